@@ -0,0 +1,45 @@
+"""Permission registry with stable bit indices
+
+Revision ID: 8c3f2d9a41e7
+Revises: 270ede961a3b
+Create Date: 2026-10-17 10:12:05.418203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '8c3f2d9a41e7'
+down_revision: Union[str, None] = '270ede961a3b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence('permission_bit_seq', start=0, minvalue=0)))
+    op.create_table('permissions',
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('bit', sa.Integer(), server_default=sa.text("nextval('permission_bit_seq')"), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('name'),
+    sa.UniqueConstraint('bit')
+    )
+
+    # Разрешение по умолчанию получает бит 0, остальные — в алфавитном порядке
+    op.execute("INSERT INTO permissions (name) VALUES ('view_content')")
+    op.execute(
+        """
+        INSERT INTO permissions (name)
+        SELECT name FROM (SELECT DISTINCT unnest(permissions) AS name FROM roles) AS role_permissions
+        WHERE name <> '*'
+        ORDER BY name
+        ON CONFLICT (name) DO NOTHING
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('permissions')
+    op.execute(sa.schema.DropSequence(sa.Sequence('permission_bit_seq')))
@@ -5,10 +5,12 @@ from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import RedirectResponse, Response
 
-from app.core.dependencies import get_current_user, rate_limit_dependency
+from app.core.dependencies import get_current_principal, require_permission
+from app.core.principal import Principal
 from app.core.oauth import oauth
 from app.db.session import get_db_session
-from app.schemas import (LoginHistoryResponse, LoginRequest, RegisterRequest,
+from app.schemas import (IntrospectionRequest, LoginHistoryResponse,
+                         LoginRequest, RegisterRequest, TokenIntrospection,
                          TokenPair)
 from app.schemas.auth import MessageResponse, RefreshToken
 from app.schemas.error import ErrorResponseModel
@@ -19,6 +21,11 @@ logger = structlog.get_logger(__name__)
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+
+async def get_auth_service(db: AsyncSession = Depends(get_db_session)) -> AuthService:
+    return AuthService(db)
+
+
 @router.get("/{provider}/login", summary="Redirect to OAuth provider")
 async def oauth_login(provider: str, request: Request):
     if provider not in settings.oauth_providers:
@@ -64,8 +71,7 @@ async def oauth_callback(
             "description": "Too many requests",
             "model": ErrorResponseModel,
         },
-    },
-    dependencies=[Depends(lambda: rate_limit_dependency(traffic_type="login"))]
+    }
 )
 async def login(
     request_data: LoginRequest,
@@ -108,8 +114,7 @@ async def login(
         },
     },
     summary="Register a new user",
-    description="Registers a new user with provided login and password. Email is optional.",
-    dependencies=[Depends(lambda: rate_limit_dependency(traffic_type="register"))]
+    description="Registers a new user with provided login and password. Email is optional."
 )
 async def register(
     request_data: RegisterRequest, auth_service: AuthService = Depends(get_auth_service)
@@ -133,8 +138,7 @@ async def register(
     response_model=MessageResponse,
     responses={200: {"model": MessageResponse, "description": "Logged out"}},
     summary="Log out from current session",
-    description="Invalidates the provided refresh token, effectively logging out the user from this session.",
-    dependencies=[Depends(lambda: rate_limit_dependency(traffic_type="default"))]
+    description="Invalidates the provided refresh token, effectively logging out the user from this session."
 )
 async def logout(
     request_data: RefreshToken, auth_service: AuthService = Depends(get_auth_service)
@@ -158,8 +162,7 @@ async def logout(
         },
     },
     summary="Refresh access token",
-    description="Exchanges a valid refresh token for a new access token and refresh token.",
-    dependencies=[Depends(lambda: rate_limit_dependency(traffic_type="default"))]
+    description="Exchanges a valid refresh token for a new access token and refresh token."
 )
 async def refresh_token(
     request_data: RefreshToken,
@@ -188,15 +191,14 @@ async def refresh_token(
     response_model=MessageResponse,
     responses={200: {"model": MessageResponse, "description": "Logged out from all other sessions"}},
     summary="Log out from all other active sessions",
-    description="Invalidates all active sessions for the current user, except the one used for this request.",
-    dependencies=[Depends(lambda: rate_limit_dependency(traffic_type="default"))]
+    description="Invalidates all active sessions for the current user, except the one used for this request."
 )
 async def logout_all_other_sessions_endpoint(
     request_data: RefreshToken,
-    current_user: dict = Depends(get_current_user),
+    principal: Principal = Depends(get_current_principal),
     auth_service: AuthService = Depends(get_auth_service)
 ) -> MessageResponse:
-    user_id = UUID(current_user["id"])
+    user_id = UUID(principal.id)
     await auth_service.logout_all_other_sessions(user_id, request_data.refresh_token)
     return MessageResponse(message="Logged out from all other sessions successfully")
 
@@ -213,15 +215,37 @@ async def logout_all_other_sessions_endpoint(
             "description": "Too many requests",
             "model": ErrorResponseModel,
         },
-    },
-    dependencies=[Depends(lambda: rate_limit_dependency(traffic_type="default"))]
+    }
 )
 async def get_user_login_history(
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of history entries to return"),
     offset: int = Query(0, ge=0, description="Number of history entries to skip"),
-    current_user: dict = Depends(get_current_user),
+    principal: Principal = Depends(get_current_principal),
     auth_service: AuthService = Depends(get_auth_service)
 ) -> list[LoginHistoryResponse]:
-    user_id = current_user["id"]
+    user_id = principal.id
     history = await auth_service.get_login_history(user_id, limit=limit, offset=offset)
-    return [LoginHistoryResponse.model_validate(entry) for entry in history]
\ No newline at end of file
+    return [LoginHistoryResponse.model_validate(entry) for entry in history]
+
+
+@router.post(
+    "/introspect",
+    response_model=list[TokenIntrospection],
+    summary="Introspect access tokens in bulk",
+    description="Verifies up to 100 access tokens in one call and returns, for each of them in request order, whether it is active, its subject, expiry and permissions. Requires the introspect_tokens permission.",
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {"description": "Missing or invalid token"},
+        status.HTTP_403_FORBIDDEN: {"description": "Not enough permissions"},
+        status.HTTP_429_TOO_MANY_REQUESTS: {
+            "description": "Too many requests",
+            "model": ErrorResponseModel,
+        },
+    },
+    dependencies=[Depends(require_permission("introspect_tokens"))]
+)
+async def introspect_tokens(
+    request_data: IntrospectionRequest,
+    auth_service: AuthService = Depends(get_auth_service)
+) -> list[TokenIntrospection]:
+    results = await auth_service.introspect_tokens(request_data.tokens)
+    return [TokenIntrospection(**result) for result in results]
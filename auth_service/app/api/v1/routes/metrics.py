@@ -0,0 +1,21 @@
+import structlog
+from fastapi import APIRouter, Depends
+
+from app.core.dependencies import require_permission
+from app.utils.metrics import collect_stats
+
+logger = structlog.get_logger(__name__)
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get(
+    "/",
+    summary="Internal cache and pool statistics",
+    description="Returns hit/miss/eviction counters of in-process caches and pools of the current worker.",
+    dependencies=[Depends(require_permission("view_metrics"))]
+)
+async def get_metrics() -> dict:
+    stats = collect_stats()
+    logger.debug("Запрошены внутренние метрики", providers=list(stats.keys()))
+    return stats
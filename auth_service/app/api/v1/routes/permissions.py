@@ -0,0 +1,35 @@
+import structlog
+from fastapi import APIRouter, Depends, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.dependencies import require_permission
+from app.db.session import get_db_session
+from app.schemas.error import ErrorResponseModel
+from app.schemas.permission import (PermissionCheckBatchRequest,
+                                    PermissionCheckResult)
+from app.services.role_service import RoleService
+
+logger = structlog.get_logger(__name__)
+
+router = APIRouter(prefix="/permissions", tags=["Permissions"])
+
+
+async def get_role_service(db: AsyncSession = Depends(get_db_session)) -> RoleService:
+    return RoleService(db)
+
+
+@router.post(
+    "/check",
+    response_model=list[PermissionCheckResult],
+    summary="Bulk permission check",
+    description="Checks many (user_id, permission) pairs at once. Results are returned in request order.",
+    responses={
+        status.HTTP_403_FORBIDDEN: {"model": ErrorResponseModel},
+    },
+    dependencies=[Depends(require_permission("check_permissions"))]
+)
+async def check_permissions(
+    request: PermissionCheckBatchRequest,
+    role_service: RoleService = Depends(get_role_service),
+):
+    return await role_service.check_permissions(request.checks)
@@ -4,8 +4,7 @@ import structlog
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.dependencies import (get_current_user, rate_limit_dependency,
-                                   require_permission)
+from app.core.dependencies import get_current_principal, require_permission
 from app.db.session import get_db_session
 from app.models.user import User
 from app.schemas.error import ErrorResponseModel
@@ -33,7 +32,7 @@ async def get_role_service(db: AsyncSession = Depends(get_db_session)) -> RoleSe
             "model": ErrorResponseModel,
         },
     },
-    dependencies=[Depends(require_permission("manage_roles")), Depends(lambda: rate_limit_dependency(traffic_type="default"))]
+    dependencies=[Depends(require_permission("manage_roles"))]
 )
 async def create_role(
     role_data: RoleCreate,
@@ -59,7 +58,7 @@ async def create_role(
             "model": ErrorResponseModel,
         },
     },
-    dependencies=[Depends(get_current_user), Depends(lambda: rate_limit_dependency(traffic_type="default"))]
+    dependencies=[Depends(get_current_principal)]
 )
 async def get_all_roles(
     role_service: RoleService = Depends(get_role_service),
@@ -79,7 +78,7 @@ async def get_all_roles(
             "model": ErrorResponseModel,
         },
     },
-    dependencies=[Depends(get_current_user), Depends(lambda: rate_limit_dependency(traffic_type="default"))]
+    dependencies=[Depends(get_current_principal)]
 )
 async def get_role_by_id(
     role_id: UUID,
@@ -106,7 +105,7 @@ async def get_role_by_id(
             "model": ErrorResponseModel,
         },
     },
-    dependencies=[Depends(require_permission("manage_roles")), Depends(lambda: rate_limit_dependency(traffic_type="default"))]
+    dependencies=[Depends(require_permission("manage_roles"))]
 )
 async def update_role(
     role_id: UUID,
@@ -133,7 +132,7 @@ async def update_role(
             "model": ErrorResponseModel,
         },
     },
-    dependencies=[Depends(require_permission("manage_roles")), Depends(lambda: rate_limit_dependency(traffic_type="default"))]
+    dependencies=[Depends(require_permission("manage_roles"))]
 )
 async def delete_role(
     role_id: UUID,
@@ -160,7 +159,7 @@ async def delete_role(
             "model": ErrorResponseModel,
         },
     },
-    dependencies=[Depends(require_permission("manage_roles")), Depends(lambda: rate_limit_dependency(traffic_type="default"))]
+    dependencies=[Depends(require_permission("manage_roles"))]
 )
 async def assign_role_to_user(
     role_id: UUID,
@@ -190,7 +189,7 @@ async def assign_role_to_user(
             "model": ErrorResponseModel,
         },
     },
-    dependencies=[Depends(require_permission("manage_roles")), Depends(lambda: rate_limit_dependency(traffic_type="default"))]
+    dependencies=[Depends(require_permission("manage_roles"))]
 )
 async def revoke_role_from_user(
     role_id: UUID,
@@ -222,7 +221,7 @@ async def revoke_role_from_user(
             "model": ErrorResponseModel,
         },
     },
-    dependencies=[Depends(require_permission("manage_roles")), Depends(lambda: rate_limit_dependency(traffic_type="default"))]
+    dependencies=[Depends(require_permission("manage_roles"))]
 )
 async def get_user_permissions_endpoint(
     user_id: UUID,
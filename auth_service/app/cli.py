@@ -1,12 +1,15 @@
 import asyncio
+import time
 
 import click
 from sqlalchemy.future import select
 
-from app.core.security import get_password_hash
+from app.core.hashing import build_crypt_context, hashing_pool
+from app.core.security import hash_password_async
 from app.db.session import AsyncDBSession
 from app.models import User
 from app.services.auth_service import AuthService
+from app.settings import settings
 
 
 @click.group()
@@ -26,14 +29,84 @@ def create_superuser(username: str, password: str):
                 click.echo(f"Ошибка: Пользователь с логином '{username}' уже существует.")
                 return
 
-            pwd_hash = get_password_hash(password)
+            pwd_hash = await hash_password_async(password)
             user = User(login=username, password_hash=pwd_hash, is_superuser=True)
             db.add(user)
             await db.commit()
             await db.refresh(user)
             click.echo(f"Суперпользователь '{username}' создан.")
 
-    asyncio.run(_create_superuser_async())
+    try:
+        asyncio.run(_create_superuser_async())
+    finally:
+        hashing_pool.shutdown()
+
+
+def _verify_ms(scheme: str, samples: int, **params: int) -> float:
+    context = build_crypt_context(
+        scheme,
+        bcrypt_rounds=params.get("bcrypt_rounds", 12),
+        argon2_memory_cost=params.get("argon2_memory_cost", 65536),
+        argon2_time_cost=params.get("argon2_time_cost", 3),
+        argon2_parallelism=params.get("argon2_parallelism", 1),
+    )
+    hashed = context.hash("calibration-password")
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.verify("calibration-password", hashed)
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)[len(timings) // 2]
+
+
+@cli.command()
+@click.option("--target-ms", default=250.0, show_default=True, help="Целевое время проверки пароля")
+@click.option("--scheme", type=click.Choice(["bcrypt", "argon2", "all"]), default="all", show_default=True)
+@click.option("--samples", default=3, show_default=True, help="Замеров на каждый вариант параметров")
+@click.option("--argon2-parallelism", default=settings.argon2_parallelism, show_default=True)
+def calibrate_password_hashing(target_ms: float, scheme: str, samples: int, argon2_parallelism: int):
+    if scheme in ("bcrypt", "all"):
+        best_rounds = None
+        for rounds in range(8, 17):
+            elapsed = _verify_ms("bcrypt", samples, bcrypt_rounds=rounds)
+            click.echo(f"bcrypt rounds={rounds}: {elapsed:.1f} мс")
+            if elapsed > target_ms:
+                break
+            best_rounds = rounds
+        if best_rounds is None:
+            click.echo("bcrypt: даже минимальная стоимость превышает целевое время")
+        else:
+            click.echo(f"Рекомендация: PASSWORD_HASH_SCHEME=bcrypt BCRYPT_ROUNDS={best_rounds}")
+
+    if scheme in ("argon2", "all"):
+        best = None
+        # Память важнее числа проходов: перебираем от большей к меньшей и
+        # для каждой подбираем максимальный time_cost в пределах цели.
+        for memory_cost in (262144, 131072, 65536, 47104, 19456):
+            time_cost = 0
+            for candidate in range(1, 11):
+                elapsed = _verify_ms(
+                    "argon2",
+                    samples,
+                    argon2_memory_cost=memory_cost,
+                    argon2_time_cost=candidate,
+                    argon2_parallelism=argon2_parallelism,
+                )
+                click.echo(f"argon2id m={memory_cost} КиБ t={candidate}: {elapsed:.1f} мс")
+                if elapsed > target_ms:
+                    break
+                time_cost = candidate
+            if time_cost >= 2 or (time_cost == 1 and memory_cost >= 47104):
+                best = (memory_cost, time_cost)
+                break
+        if best is None:
+            click.echo("argon2id: подходящих параметров в пределах целевого времени не найдено")
+        else:
+            click.echo(
+                "Рекомендация: PASSWORD_HASH_SCHEME=argon2 "
+                f"ARGON2_MEMORY_COST_KIB={best[0]} ARGON2_TIME_COST={best[1]} "
+                f"ARGON2_PARALLELISM={argon2_parallelism}"
+            )
 
 
 if __name__ == "__main__":
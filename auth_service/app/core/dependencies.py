@@ -1,103 +1,27 @@
-from typing import Any, Dict, List
 from uuid import UUID
 
 import structlog
 from fastapi import Depends, HTTPException, Request, status
 from jose.exceptions import ExpiredSignatureError, JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
 
+from app.core.permissions import permission_registry
+from app.core.principal import Principal, principal_for_token
 from app.core.security import decode_jwt
 from app.db.session import get_db_session
-from app.models import Role, User, UserRole
 from app.schemas.error import ErrorResponseModel
-from app.settings import settings
-from app.utils.cache import redis_client
-from app.utils.rate_limiter import (RedisLeakyBucketRateLimiter,
-                                    get_rate_limiter)
 
 logger = structlog.get_logger(__name__)
 
 
-async def get_token(request: Request) -> str:
+def get_bearer_token(request: Request) -> str | None:
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
-        logger.warning("Отсутствует или неверный токен авторизации")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid token",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        return None
     return auth_header[7:]
 
 
-async def get_cached_permissions(user_id: UUID, db: AsyncSession) -> List[str]:
-    user_id_str = str(user_id)
-    permissions_str = await redis_client.get(f"permissions:{user_id_str}")
-    if permissions_str:
-        logger.debug("Разрешения получены из кэша Redis", user_id=user_id_str)
-        return permissions_str.split(",")
-
-    user_result = await db.execute(select(User.is_superuser).where(User.id == user_id))
-    is_superuser = user_result.scalar_one_or_none()
-
-    if is_superuser:
-        logger.info(
-            "Пользователь является суперпользователем, добавлены все разрешения",
-            user_id=user_id_str,
-        )
-        permissions_list = ["*"]
-    else:
-        result = await db.execute(
-            select(Role.permissions)
-            .join(UserRole, UserRole.role_id == Role.id)
-            .where(UserRole.user_id == user_id)
-        )
-        all_permissions = set()
-        for row in result.scalars().all():
-            all_permissions.update(row)
-
-        permissions_list = list(all_permissions)
-        if not permissions_list:
-            logger.info(
-                "Для пользователя не найдено разрешений, по умолчанию 'view_content'",
-                user_id=user_id_str,
-            )
-            permissions_list = ["view_content"]
-
-    if permissions_list:
-        await redis_client.setex(
-            f"permissions:{user_id_str}", 3600, ",".join(permissions_list)
-        )
-        logger.debug("Разрешения кэшированы в Redis", user_id=user_id_str)
-
-    return permissions_list
-
-
-async def get_user_roles(user_id: UUID, db: AsyncSession) -> List[str]:
-    roles_list = []
-    user_result = await db.execute(select(User.is_superuser).where(User.id == user_id))
-    is_superuser = user_result.scalar_one_or_none()
-
-    if is_superuser:
-        roles_list.append("superuser")
-
-    role_names_result = await db.execute(
-        select(Role.name)
-        .join(UserRole, UserRole.role_id == Role.id)
-        .where(UserRole.user_id == user_id)
-    )
-    roles_list.extend(role_names_result.scalars().all())
-
-    if not is_superuser and not roles_list:
-        roles_list.append("user")
-
-    return list(set(roles_list))
-
-
-async def get_current_user(
-        token: str = Depends(get_token), db: AsyncSession = Depends(get_db_session)
-) -> Dict[str, Any]:
+async def authenticate(token: str, db: AsyncSession) -> Principal:
     try:
         payload = await decode_jwt(token)
 
@@ -121,32 +45,23 @@ async def get_current_user(
                 detail="Invalid token: invalid user ID format",
             )
 
-        user_obj = await db.get(User, user_id)
-        if not user_obj:
+        principal = await principal_for_token(user_id, payload, db)
+        if not principal:
             logger.warning("Пользователь не найден по ID из токена", user_id=user_id)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found"
             )
 
-        permissions = await get_cached_permissions(user_id, db)
-        roles = await get_user_roles(user_id, db)
-
         logger.debug(
             "Текущий пользователь успешно аутентифицирован",
             user_id=user_id,
-            login=user_obj.login,
-            permissions=permissions,
-            roles=roles,
+            login=principal["login"],
+            roles=principal["roles"],
         )
-        return {
-            "id": str(user_id),
-            "login": payload.get("login", user_obj.login),
-            "mfa_verified": payload.get("mfa_verified", False),
-            "is_superuser": user_obj.is_superuser,
-            "permissions": permissions,
-            "roles": roles,
-        }
+        return Principal.from_token(user_id_str, principal, payload)
 
+    except HTTPException:
+        raise
     except ExpiredSignatureError:
         logger.warning("Токен истек")
         raise HTTPException(
@@ -175,74 +90,67 @@ async def get_current_user(
         )
 
 
-def require_permission(permission: str):
-    async def _require_permission(
-            current_user: Dict[str, Any] = Depends(get_current_user),
-    ):
-        if current_user["is_superuser"] or "*" in current_user["permissions"]:
-            logger.debug(
-                "Суперпользователь или имеет все разрешения",
-                user_id=current_user["id"],
-                required_permission=permission,
-            )
-            return current_user
+async def get_optional_principal(
+        request: Request, db: AsyncSession = Depends(get_db_session)
+) -> Principal | None:
+    # Токен проверяется один раз за запрос: результат (или ошибка) сохраняется
+    # в request.state и переиспользуется всеми зависимостями.
+    if hasattr(request.state, "principal"):
+        return request.state.principal
 
-        if permission not in current_user["permissions"]:
-            logger.warning(
-                "Пользователь не имеет необходимых разрешений",
-                user_id=current_user["id"],
-                required_permission=permission,
-                user_permissions=current_user["permissions"],
-            )
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Not enough permissions. Required: {permission}",
-            )
-        logger.debug(
-            "Пользователь имеет необходимые разрешения",
-            user_id=current_user["id"],
-            required_permission=permission,
+    principal, error = None, None
+    token = get_bearer_token(request)
+    if token is None:
+        error = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing or invalid token",
+            headers={"WWW-Authenticate": "Bearer"},
         )
-        return current_user
-
-    return _require_permission
+    else:
+        try:
+            principal = await authenticate(token, db)
+        except HTTPException as e:
+            error = e
 
+    request.state.principal = principal
+    request.state.principal_error = error
+    return principal
 
-async def rate_limit_dependency(
-        request: Request,
-        traffic_type: str,
-        current_user: Dict[str, Any] | None = Depends(get_current_user),
-        rate_limiter: RedisLeakyBucketRateLimiter = Depends(get_rate_limiter)
-):
-    identifier = request.client.host if request.client else "unknown_ip"
-    user_roles = ["guest"]
 
-    if current_user:
-        identifier = current_user["id"]
-        user_roles = current_user["roles"]
-        if not user_roles:
-            user_roles = ["user"]
+async def get_current_principal(
+        request: Request, principal: Principal | None = Depends(get_optional_principal)
+) -> Principal:
+    if principal is None:
+        logger.warning("Отсутствует или неверный токен авторизации", path=request.url.path)
+        raise request.state.principal_error
+    return principal
 
-    if not current_user and "guest" not in user_roles:
-        user_roles.append("guest")
-    elif current_user and not user_roles:
-        user_roles.append("user")
 
-    allowed = await rate_limiter.allow_request(identifier, user_roles, traffic_type)
+def require_permission(permission: str):
+    async def _require_permission(
+            principal: Principal = Depends(get_current_principal),
+            db: AsyncSession = Depends(get_db_session),
+    ) -> Principal:
+        if principal.is_superuser or await permission_registry.has(
+            principal.permission_mask, permission, db
+        ):
+            logger.debug(
+                "Пользователь имеет необходимые разрешения",
+                user_id=principal.id,
+                required_permission=permission,
+            )
+            return principal
 
-    if not allowed:
         logger.warning(
-            "Превышен лимит запросов",
-            identifier=identifier,
-            traffic_type=traffic_type,
-            user_roles=user_roles,
-            path=request.url.path
+            "Пользователь не имеет необходимых разрешений",
+            user_id=principal.id,
+            required_permission=permission,
+            user_roles=principal.roles,
         )
         raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail=ErrorResponseModel(
-                detail={"rate_limit": "Too many requests. Please try again later."}
-            ).model_dump(),
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Not enough permissions. Required: {permission}",
         )
-    logger.debug("Проверка лимита запросов пройдена", identifier=identifier, traffic_type=traffic_type,
-                 user_roles=user_roles)
\ No newline at end of file
+
+    return _require_permission
+
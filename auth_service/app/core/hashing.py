@@ -0,0 +1,176 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+import structlog
+from passlib.context import CryptContext
+
+from app.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+PASSWORD_HASH_SCHEMES = ("argon2", "bcrypt")
+
+
+def build_crypt_context(
+    scheme: str,
+    bcrypt_rounds: int,
+    argon2_memory_cost: int,
+    argon2_time_cost: int,
+    argon2_parallelism: int,
+) -> CryptContext:
+    # Остальные схемы остаются для проверки старых хешей и помечаются
+    # устаревшими, чтобы needs_update предлагал перехеширование.
+    schemes = [scheme] + [other for other in PASSWORD_HASH_SCHEMES if other != scheme]
+    return CryptContext(
+        schemes=schemes,
+        deprecated="auto",
+        bcrypt__rounds=bcrypt_rounds,
+        bcrypt__min_rounds=bcrypt_rounds,
+        argon2__type="ID",
+        argon2__memory_cost=argon2_memory_cost,
+        argon2__time_cost=argon2_time_cost,
+        argon2__parallelism=argon2_parallelism,
+    )
+
+
+pwd_context = build_crypt_context(
+    settings.password_hash_scheme,
+    settings.bcrypt_rounds,
+    settings.argon2_memory_cost_kib,
+    settings.argon2_time_cost,
+    settings.argon2_parallelism,
+)
+
+
+class PasswordHashingUnavailable(Exception):
+    pass
+
+
+def verify_password_hash(plain_password: str, hashed_password: str) -> bool:
+    valid: bool = pwd_context.verify(plain_password, hashed_password)
+    return valid
+
+
+def verify_and_update_password_hash(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    valid, new_hash = pwd_context.verify_and_update(plain_password, hashed_password)
+    return bool(valid), new_hash
+
+
+def hash_password(password: str) -> str:
+    hashed: str = pwd_context.hash(password)
+    return hashed
+
+
+def _warm_up() -> None:
+    pwd_context.handler().get_backend()
+
+
+class PasswordHasherPool:
+    def __init__(self, max_workers: int | None, max_queue: int, queue_timeout: float) -> None:
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._executor: ProcessPoolExecutor | None = None
+        self._slots = asyncio.Semaphore(self.max_workers)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: воркер uvicorn уже держит потоки и event loop, fork небезопасен
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info("Запущен пул процессов хеширования паролей", workers=self.max_workers)
+        return self._executor
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        await asyncio.gather(
+            *(loop.run_in_executor(executor, _warm_up) for _ in range(self.max_workers))
+        )
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        # В очереди считаются только вызовы, которым не хватило свободного
+        # процесса: при max_queue = 0 запрос отклоняется, лишь когда заняты все.
+        if self._slots.locked():
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                logger.warning("Очередь хеширования паролей переполнена", waiting=self.waiting)
+                raise PasswordHashingUnavailable("Password hashing queue is full")
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                logger.warning("Превышено время ожидания в очереди хеширования паролей",
+                               timeout=self.queue_timeout)
+                raise PasswordHashingUnavailable("Password hashing queue timeout")
+            finally:
+                self.waiting -= 1
+        else:
+            await self._slots.acquire()
+
+        self.in_flight += 1
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._finish(started)
+            raise
+        # Слот освобождается, когда процесс закончил работу, а не когда
+        # вызывающий перестал ждать: отмена запроса (разрыв соединения) не
+        # останавливает уже начатое хеширование.
+        future.add_done_callback(lambda _: self._on_done(loop, started))
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, loop: asyncio.AbstractEventLoop, started: float) -> None:
+        # Вызывается из потока пула; после остановки цикла освобождать нечего
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._finish, started)
+
+    def _finish(self, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        self.in_flight -= 1
+        self.completed += 1
+        self.total_seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+        self._slots.release()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_hash_ms": round(self.total_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "max_hash_ms": round(self.max_seconds * 1000, 2),
+        }
+
+
+hashing_pool = PasswordHasherPool(
+    max_workers=settings.password_hash_workers,
+    max_queue=settings.password_hash_max_queue,
+    queue_timeout=settings.password_hash_queue_timeout_seconds,
+)
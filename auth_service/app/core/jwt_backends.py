@@ -0,0 +1,257 @@
+import base64
+import binascii
+import hmac
+import json
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Tuple
+
+from jose import jwk as jose_jwk
+from jose import jwt as jose_jwt
+from jose.exceptions import ExpiredSignatureError, JWTClaimsError, JWTError
+
+Signer = Callable[[bytes], bytes]
+
+
+class JWTBackend(ABC):
+    name: str
+    algorithms: frozenset[str]
+
+    @abstractmethod
+    def prepare_key(self, key: Any, algorithm: str) -> Any:
+        ...
+
+    @abstractmethod
+    def public_jwk(self, public_key: Any, algorithm: str) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def key_from_jwk(self, jwk: Dict[str, Any], algorithm: str) -> Any:
+        ...
+
+    @abstractmethod
+    def signer(self, prepared_key: Any, algorithm: str) -> Signer:
+        ...
+
+    @abstractmethod
+    def encode(
+        self, claims: Dict[str, Any], prepared_key: Any, algorithm: str, headers: Dict[str, Any] | None = None
+    ) -> str:
+        ...
+
+    # Должен бросать исключения python-jose (ExpiredSignatureError, JWTError),
+    # чтобы поведение decode_jwt не зависело от выбранной реализации.
+    @abstractmethod
+    def decode(
+        self, token: str, prepared_key: Any, algorithms: List[str], options: Dict[str, Any] | None = None
+    ) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def get_unverified_header(self, token: str) -> Dict[str, Any]:
+        ...
+
+
+class JoseBackend(JWTBackend):
+    name = "jose"
+    algorithms = frozenset(
+        {"HS256", "HS384", "HS512", "RS256", "RS384", "RS512", "ES256", "ES384", "ES512"}
+    )
+
+    def prepare_key(self, key: Any, algorithm: str) -> Any:
+        return jose_jwk.construct(key, algorithm)
+
+    def public_jwk(self, public_key: Any, algorithm: str) -> Dict[str, Any]:
+        return jose_jwk.construct(public_key, algorithm).to_dict()
+
+    def key_from_jwk(self, jwk: Dict[str, Any], algorithm: str) -> Any:
+        return jose_jwk.construct(jwk, algorithm)
+
+    def signer(self, prepared_key: Any, algorithm: str) -> Signer:
+        return prepared_key.sign
+
+    def encode(
+        self, claims: Dict[str, Any], prepared_key: Any, algorithm: str, headers: Dict[str, Any] | None = None
+    ) -> str:
+        return jose_jwt.encode(claims, prepared_key, algorithm=algorithm, headers=headers)
+
+    def decode(
+        self, token: str, prepared_key: Any, algorithms: List[str], options: Dict[str, Any] | None = None
+    ) -> Dict[str, Any]:
+        return jose_jwt.decode(token, prepared_key, algorithms=algorithms, options=options or {})
+
+    def get_unverified_header(self, token: str) -> Dict[str, Any]:
+        return jose_jwt.get_unverified_header(token)
+
+
+class PyJWTBackend(JWTBackend):
+    name = "pyjwt"
+
+    def __init__(self) -> None:
+        import jwt
+        from jwt.algorithms import get_default_algorithms
+
+        self._jwt = jwt
+        self._algorithms = get_default_algorithms()
+        # Набор исключений о claims зависит от версии PyJWT
+        self._claims_errors = tuple(
+            getattr(jwt.exceptions, name)
+            for name in (
+                "ImmatureSignatureError",
+                "InvalidAudienceError",
+                "InvalidIssuerError",
+                "InvalidIssuedAtError",
+                "MissingRequiredClaimError",
+                "InvalidSubjectError",
+                "InvalidJTIError",
+            )
+            if hasattr(jwt.exceptions, name)
+        )
+        self.algorithms = frozenset(self._algorithms) - {"none"}
+
+    def prepare_key(self, key: Any, algorithm: str) -> Any:
+        return self._algorithms[algorithm].prepare_key(key)
+
+    def public_jwk(self, public_key: Any, algorithm: str) -> Dict[str, Any]:
+        algorithm_obj = self._algorithms[algorithm]
+        jwk = algorithm_obj.to_jwk(algorithm_obj.prepare_key(public_key))
+        return {**(json.loads(jwk) if isinstance(jwk, str) else jwk), "alg": algorithm}
+
+    def key_from_jwk(self, jwk: Dict[str, Any], algorithm: str) -> Any:
+        return self._algorithms[algorithm].from_jwk(jwk)
+
+    def signer(self, prepared_key: Any, algorithm: str) -> Signer:
+        algorithm_obj = self._algorithms[algorithm]
+        return lambda message: algorithm_obj.sign(message, prepared_key)
+
+    def encode(
+        self, claims: Dict[str, Any], prepared_key: Any, algorithm: str, headers: Dict[str, Any] | None = None
+    ) -> str:
+        return self._jwt.encode(claims, prepared_key, algorithm=algorithm, headers=headers)
+
+    def decode(
+        self, token: str, prepared_key: Any, algorithms: List[str], options: Dict[str, Any] | None = None
+    ) -> Dict[str, Any]:
+        try:
+            return self._jwt.decode(token, prepared_key, algorithms=algorithms, options=options)
+        except self._jwt.ExpiredSignatureError as e:
+            raise ExpiredSignatureError(str(e)) from e
+        except self._claims_errors as e:
+            raise JWTClaimsError(str(e)) from e
+        except self._jwt.InvalidTokenError as e:
+            raise JWTError(str(e)) from e
+
+    def get_unverified_header(self, token: str) -> Dict[str, Any]:
+        try:
+            return self._jwt.get_unverified_header(token)
+        except self._jwt.InvalidTokenError as e:
+            raise JWTError(str(e)) from e
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+class NativeBackend(PyJWTBackend):
+    # Разбор токена и проверка claims на стандартной библиотеке; из PyJWT
+    # берутся только примитивы подписи. Проверки claims повторяют python-jose
+    # для токенов, которые выпускает сервис (без aud/iss).
+    name = "native"
+
+    def signer(self, prepared_key: Any, algorithm: str) -> Signer:
+        if algorithm.startswith("HS"):
+            digest = self._algorithms[algorithm].hash_alg
+            return lambda message: hmac.new(prepared_key, message, digest).digest()
+        return super().signer(prepared_key, algorithm)
+
+    def encode(
+        self, claims: Dict[str, Any], prepared_key: Any, algorithm: str, headers: Dict[str, Any] | None = None
+    ) -> str:
+        header = {"alg": algorithm, "typ": "JWT", **(headers or {})}
+        signing_input = (
+            _b64encode(json.dumps(header, separators=(",", ":")).encode())
+            + "."
+            + _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        ).encode()
+        return signing_input.decode() + "." + _b64encode(self.signer(prepared_key, algorithm)(signing_input))
+
+    def _split(self, token: str) -> Tuple[bytes, Dict[str, Any], str, str]:
+        try:
+            signing_input, signature_segment = token.rsplit(".", 1)
+            header_segment, payload_segment = signing_input.split(".", 1)
+            header = json.loads(_b64decode(header_segment))
+        except (ValueError, binascii.Error, UnicodeDecodeError):
+            raise JWTError("Error decoding token headers.")
+        if not isinstance(header, dict):
+            raise JWTError("Invalid header string: must be a json object")
+        return signing_input.encode(), header, payload_segment, signature_segment
+
+    def decode(
+        self, token: str, prepared_key: Any, algorithms: List[str], options: Dict[str, Any] | None = None
+    ) -> Dict[str, Any]:
+        options = options or {}
+        signing_input, header, payload_segment, signature_segment = self._split(token)
+
+        if options.get("verify_signature", True):
+            algorithm = header.get("alg")
+            if algorithm not in algorithms:
+                raise JWTError("The specified alg value is not allowed")
+            try:
+                signature = _b64decode(signature_segment)
+            except (ValueError, binascii.Error):
+                raise JWTError("Invalid crypto padding")
+            if algorithm.startswith("HS"):
+                valid = hmac.compare_digest(self.signer(prepared_key, algorithm)(signing_input), signature)
+            else:
+                valid = self._algorithms[algorithm].verify(signing_input, prepared_key, signature)
+            if not valid:
+                raise JWTError("Signature verification failed.")
+
+        try:
+            claims = json.loads(_b64decode(payload_segment))
+        except (ValueError, binascii.Error, UnicodeDecodeError):
+            raise JWTError("Invalid payload string")
+        if not isinstance(claims, dict):
+            raise JWTError("Invalid payload string: must be a json object")
+
+        self._validate_claims(claims, options)
+        return claims
+
+    @staticmethod
+    def _validate_claims(claims: Dict[str, Any], options: Dict[str, Any]) -> None:
+        now = time.time()
+        leeway = options.get("leeway", 0)
+        for name in ("exp", "nbf", "iat"):
+            if name in claims and not isinstance(claims[name], (int, float)):
+                raise JWTClaimsError(f"{name.capitalize()} claim must be a number.")
+
+        if options.get("verify_exp", True) and "exp" in claims and claims["exp"] < now - leeway:
+            raise ExpiredSignatureError("Signature has expired.")
+        if options.get("verify_nbf", True) and "nbf" in claims and claims["nbf"] > now + leeway:
+            raise JWTClaimsError("The token is not yet valid (nbf)")
+        if options.get("verify_aud", True) and "aud" in claims:
+            raise JWTClaimsError("Invalid audience")
+        for name in ("sub", "jti"):
+            if options.get(f"verify_{name}", True) and name in claims and not isinstance(claims[name], str):
+                raise JWTClaimsError(f"{name.capitalize()} claim must be a string.")
+
+    def get_unverified_header(self, token: str) -> Dict[str, Any]:
+        return self._split(token)[1]
+
+
+_BACKENDS: Dict[str, type[JWTBackend]] = {
+    JoseBackend.name: JoseBackend,
+    PyJWTBackend.name: PyJWTBackend,
+    NativeBackend.name: NativeBackend,
+}
+
+
+def get_backend(name: str) -> JWTBackend:
+    try:
+        return _BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Неизвестная реализация JWT: {name}")
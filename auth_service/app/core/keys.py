@@ -0,0 +1,118 @@
+import base64
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, List
+
+import structlog
+from cryptography.hazmat.primitives import serialization
+from jose.exceptions import JWTError
+
+from app.core.jwt_backends import JWTBackend, get_backend
+from app.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+
+def is_asymmetric(algorithm: str) -> bool:
+    return not algorithm.startswith("HS")
+
+
+def _public_pem(public_key: Any) -> str:
+    return public_key.public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+
+
+def _key_id(public_key: Any) -> str:
+    der = public_key.public_bytes(
+        serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return base64.urlsafe_b64encode(hashlib.sha256(der).digest()[:12]).decode().rstrip("=")
+
+
+class KeyRing:
+    def __init__(
+        self,
+        backend: JWTBackend,
+        access_algorithm: str,
+        access_secret: str,
+        refresh_algorithm: str,
+        refresh_secret: str,
+        private_key_pem: str | None = None,
+        retired_public_key_pems: List[str] | None = None,
+    ):
+        for algorithm in (access_algorithm, refresh_algorithm):
+            if algorithm not in backend.algorithms:
+                raise ValueError(f"Реализация JWT {backend.name} не поддерживает {algorithm}")
+
+        self.backend = backend
+        self.access_algorithm = access_algorithm
+        self.refresh_algorithm = refresh_algorithm
+        # Ключи разбираются один раз при старте: повторный разбор PEM
+        # на каждый запрос заметно дороже самой проверки подписи.
+        self.refresh_key = backend.prepare_key(refresh_secret.encode(), refresh_algorithm)
+        self.signing_kid: str | None = None
+        self.verification_keys: Dict[str, Any] = {}
+        self._jwks: Dict[str, List[Dict[str, Any]]] = {"keys": []}
+
+        if not is_asymmetric(access_algorithm):
+            self.signing_key = backend.prepare_key(access_secret.encode(), access_algorithm)
+            return
+        if not private_key_pem:
+            raise ValueError(f"Для алгоритма {access_algorithm} нужен закрытый ключ")
+
+        private_key = serialization.load_pem_private_key(private_key_pem.encode(), password=None)
+        self.signing_kid = self._add_public_key(private_key.public_key())
+        self.signing_key = backend.prepare_key(private_key_pem, access_algorithm)
+
+        # Выведенные из оборота ключи остаются в JWKS и доступны для проверки,
+        # пока не истекут подписанные ими токены.
+        for pem in retired_public_key_pems or []:
+            self._add_public_key(serialization.load_pem_public_key(pem.encode()))
+
+        logger.info(
+            "Загружены ключи подписи токенов",
+            algorithm=access_algorithm,
+            signing_kid=self.signing_kid,
+            kids=list(self.verification_keys),
+        )
+
+    def _add_public_key(self, public_key: Any) -> str:
+        kid = _key_id(public_key)
+        pem = _public_pem(public_key)
+        self.verification_keys[kid] = self.backend.prepare_key(pem, self.access_algorithm)
+        self._jwks["keys"].append(
+            {**self.backend.public_jwk(pem, self.access_algorithm), "kid": kid, "use": "sig"}
+        )
+        return kid
+
+    def get_verification_key(self, kid: str | None) -> Any:
+        key = self.verification_keys.get(kid) if kid else None
+        if key is None:
+            raise JWTError("Unknown signing key")
+        return key
+
+    def jwks(self) -> Dict[str, List[Dict[str, Any]]]:
+        return self._jwks
+
+    @classmethod
+    def from_settings(cls) -> "KeyRing":
+        private_key_pem = (
+            Path(settings.jwt_private_key_file).read_text()
+            if settings.jwt_private_key_file
+            else None
+        )
+        retired = [Path(path).read_text() for path in settings.jwt_retired_public_key_files]
+        return cls(
+            get_backend(settings.jwt_backend),
+            settings.jwt_algorithm,
+            settings.jwt_secret_key.get_secret_value(),
+            settings.jwt_refresh_algorithm,
+            settings.jwt_refresh_secret_key.get_secret_value(),
+            private_key_pem,
+            retired,
+        )
+
+
+key_ring = KeyRing.from_settings()
+jwt_backend = key_ring.backend
@@ -0,0 +1,90 @@
+import math
+from typing import Dict, List, Tuple
+
+import structlog
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.principal import cached_roles
+from app.core.security import get_cached_token_claims
+from app.schemas.error import ErrorResponseModel
+
+logger = structlog.get_logger(__name__)
+
+# Роли для выбора лимита запросов у пользователя без ролей и у анонимного клиента
+AUTHENTICATED_ROLES = ("user",)
+ANONYMOUS_ROLES = ("guest",)
+
+
+class RateLimitMiddleware:
+    # Лимит проверяется до маршрутизации, чтения тела и зависимостей, поэтому
+    # отказ не стоит ни разбора JSON, ни проверки подписи, ни запроса к БД.
+    # Клиент определяется по subject токена, если этот воркер уже проверял
+    # токен и он лежит в кэше, иначе по IP. Маршруты задаются путями
+    # относительно prefix: путь с "/" на конце покрывает все вложенные,
+    # остальные сравниваются точно; тип трафика None отключает ограничение.
+    def __init__(self, app: ASGIApp, routes: Dict[str, str | None], prefix: str = ""):
+        self.app = app
+        self._exact: Dict[str, str | None] = {}
+        self._prefixes: List[Tuple[str, str | None]] = []
+        for path, traffic_type in routes.items():
+            if path.endswith("/"):
+                self._prefixes.append((prefix + path, traffic_type))
+            else:
+                self._exact[prefix + path] = traffic_type
+        self._prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+
+    def _traffic_type(self, path: str) -> str | None:
+        if path in self._exact:
+            return self._exact[path]
+        for route_prefix, traffic_type in self._prefixes:
+            if path.startswith(route_prefix):
+                return traffic_type
+        return None
+
+    @staticmethod
+    def _identify(scope: Scope) -> Tuple[str, Tuple[str, ...]]:
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                if value.startswith(b"Bearer "):
+                    claims = get_cached_token_claims(value[7:].decode("latin-1"))
+                    if claims and claims.get("sub"):
+                        subject = claims["sub"]
+                        roles = tuple(claims.get("roles") or ()) or cached_roles(subject)
+                        return subject, roles or AUTHENTICATED_ROLES
+                break
+
+        client = scope.get("client")
+        return (client[0] if client else "unknown_ip"), ANONYMOUS_ROLES
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traffic_type = self._traffic_type(scope["path"])
+        if traffic_type is None:
+            await self.app(scope, receive, send)
+            return
+
+        identifier, user_roles = self._identify(scope)
+        decision = await scope["app"].state.rate_limiter.allow_request(identifier, user_roles, traffic_type)
+        if decision.allowed:
+            await self.app(scope, receive, send)
+            return
+
+        logger.warning(
+            "Превышен лимит запросов",
+            identifier=identifier,
+            traffic_type=traffic_type,
+            user_roles=user_roles,
+            path=scope["path"],
+        )
+        response = JSONResponse(
+            status_code=429,
+            content=ErrorResponseModel(
+                detail={"rate_limit": "Too many requests. Please try again later."}
+            ).model_dump(),
+            headers={"Retry-After": str(max(1, math.ceil(decision.retry_after)))},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,166 @@
+import asyncio
+from typing import Any, Dict, Iterable, List
+
+import structlog
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.models import Permission
+from app.utils.metrics import register_stats_provider
+
+logger = structlog.get_logger(__name__)
+
+WILDCARD = "*"
+SEPARATOR = ":"
+_END = None
+# Все биты установлены: маска суперпользователя и роли с разрешением "*"
+ALL_PERMISSIONS = -1
+MAX_DECODED_MASKS = 10000
+
+
+class PermissionMatcher:
+    # Префиксное дерево по сегментам разрешения: "roles:*" покрывает
+    # "roles:create" и "roles:assign:admin", но не само "roles". Проверка
+    # проходит не больше сегментов, чем в проверяемом разрешении, и не
+    # зависит от числа шаблонов у пользователя.
+    __slots__ = ("_root",)
+
+    def __init__(self, patterns: Iterable[str]):
+        self._root: Dict[str | None, Any] = {}
+        for pattern in patterns:
+            node = self._root
+            for segment in pattern.split(SEPARATOR):
+                if WILDCARD in node:
+                    break
+                if segment == WILDCARD:
+                    # Шаблон поглощает вложенные ветви, но не сам префикс:
+                    # "roles" вместе с "roles:*" по-прежнему разрешено
+                    end = _END in node
+                    node.clear()
+                    node[WILDCARD] = True
+                    if end:
+                        node[_END] = True
+                    break
+                node = node.setdefault(segment, {})
+            else:
+                node[_END] = True
+
+    def matches(self, permission: str) -> bool:
+        node = self._root
+        for segment in permission.split(SEPARATOR):
+            if WILDCARD in node:
+                return True
+            child = node.get(segment)
+            if child is None:
+                return False
+            node = child
+        return _END in node
+
+
+class PermissionRegistry:
+    def __init__(self) -> None:
+        self._bits: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        self._known_mask = 0
+        self._decoded: Dict[int, List[str]] = {}
+        self._matchers: Dict[int, PermissionMatcher] = {}
+        self._lock = asyncio.Lock()
+        self.loads = 0
+
+    def _has_unknown_bits(self, mask: int) -> bool:
+        return mask != ALL_PERMISSIONS and bool(mask & ~self._known_mask)
+
+    async def load(self, db: AsyncSession) -> None:
+        async with self._lock:
+            result = await db.execute(select(Permission.name, Permission.bit))
+            rows = result.all()
+            self._bits = {row.name: row.bit for row in rows}
+            self._names = {row.bit: row.name for row in rows}
+            self._known_mask = 0
+            for bit in self._names:
+                self._known_mask |= 1 << bit
+            self._decoded = {}
+            self._matchers = {}
+            self.loads += 1
+        logger.info("Загружен реестр разрешений", permissions=len(self._bits))
+
+    async def register(self, names: Iterable[str], db: AsyncSession) -> None:
+        # Вставка выполняется в транзакции вызывающего кода и фиксируется
+        # вместе с ролью, которая ссылается на новые разрешения. Реестр здесь
+        # не перечитывается: до фиксации новые биты видны только этой
+        # транзакции и после отката остались бы в памяти воркера. Их подхватит
+        # mask_for или names при первой встрече неизвестного имени или бита.
+        missing = sorted({name for name in names if name != WILDCARD} - self._bits.keys())
+        if not missing:
+            return
+        await db.execute(
+            insert(Permission)
+            .values([{"name": name} for name in missing])
+            .on_conflict_do_nothing(index_elements=[Permission.name])
+        )
+
+    async def mask_for(self, names: Iterable[str], db: AsyncSession) -> int:
+        names = set(names)
+        if WILDCARD in names:
+            return ALL_PERMISSIONS
+        if names - self._bits.keys():
+            await self.load(db)
+        mask = 0
+        for name in names:
+            bit = self._bits.get(name)
+            if bit is None:
+                logger.warning("Разрешение отсутствует в реестре", permission=name)
+                continue
+            mask |= 1 << bit
+        return mask
+
+    async def has(self, mask: int, name: str, db: AsyncSession) -> bool:
+        if mask == ALL_PERMISSIONS:
+            return True
+        bit = self._bits.get(name)
+        if bit is not None and mask >> bit & 1:
+            return True
+        return (await self.matcher(mask, db)).matches(name)
+
+    async def matcher(self, mask: int, db: AsyncSession) -> PermissionMatcher:
+        # Матчер компилируется один раз на маску и общий для всех
+        # пользователей с тем же набором разрешений.
+        matcher = self._matchers.get(mask)
+        if matcher is None:
+            matcher = PermissionMatcher(await self.names(mask, db))
+            if len(self._matchers) >= MAX_DECODED_MASKS:
+                self._matchers.clear()
+            self._matchers[mask] = matcher
+        return matcher
+
+    async def missing(self, mask: int, names: Iterable[str], db: AsyncSession) -> List[str]:
+        return [name for name in names if not await self.has(mask, name, db)]
+
+    async def names(self, mask: int, db: AsyncSession) -> List[str]:
+        if mask == ALL_PERMISSIONS:
+            return [WILDCARD]
+        decoded = self._decoded.get(mask)
+        if decoded is not None:
+            return decoded
+        # Неизвестный бит в маске означает, что реестр воркера отстал:
+        # разрешение могло быть зарегистрировано после его загрузки.
+        if self._has_unknown_bits(mask):
+            await self.load(db)
+        decoded = sorted(name for bit, name in self._names.items() if mask >> bit & 1)
+        if len(self._decoded) >= MAX_DECODED_MASKS:
+            self._decoded.clear()
+        self._decoded[mask] = decoded
+        return decoded
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "permissions": len(self._bits),
+            "loads": self.loads,
+            "decoded_masks": len(self._decoded),
+            "matchers": len(self._matchers),
+        }
+
+
+permission_registry = PermissionRegistry()
+register_stats_provider("permission_registry", permission_registry.stats)
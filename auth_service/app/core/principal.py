@@ -0,0 +1,536 @@
+import asyncio
+import json
+import math
+import random
+import time
+from typing import Any, AsyncIterable, Dict, Iterable, Tuple
+from uuid import UUID
+
+import structlog
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.permissions import ALL_PERMISSIONS, permission_registry
+from app.db.session import AsyncDBSession
+from app.models import Role, User, UserRole
+from app.settings import settings
+from app.utils.cache import redis_client
+from app.utils.metrics import register_stats_provider
+from app.utils.pubsub import RedisBroadcaster, broadcaster
+from app.utils.single_flight import RedisLock, SingleFlight
+from app.utils.ttl_cache import TTLCache
+
+logger = structlog.get_logger(__name__)
+
+INVALIDATION_BATCH_SIZE = 500
+LOAD_LOCK_POLL_SECONDS = 0.025
+PRINCIPAL_CHANNEL = "principal:events"
+DEFAULT_PERMISSIONS = ["view_content"]
+DEFAULT_ROLES = ["user"]
+
+# Запись досрочного обновления применяется, только если версия прав не
+# менялась с начала загрузки: иначе инвалидация (и новая запись после нее)
+# произошла, пока читалась БД, и загруженные данные уже устарели.
+_REFRESH_PRINCIPAL_LUA = """
+if redis.call('GET', KEYS[3]) ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[4])
+redis.call('SET', KEYS[2], ARGV[3], 'EX', ARGV[4])
+return 1
+"""
+
+
+class Principal:
+    # Вызывающий запроса: определяется один раз и хранится в request.state
+    __slots__ = (
+        "id",
+        "login",
+        "is_superuser",
+        "roles",
+        "permission_mask",
+        "mfa_verified",
+        "session_id",
+    )
+
+    def __init__(
+        self,
+        id: str,
+        login: str | None,
+        is_superuser: bool,
+        roles: Tuple[str, ...],
+        permission_mask: int,
+        mfa_verified: bool = False,
+        session_id: str | None = None,
+    ):
+        self.id = id
+        self.login = login
+        self.is_superuser = is_superuser
+        self.roles = roles
+        self.permission_mask = permission_mask
+        self.mfa_verified = mfa_verified
+        self.session_id = session_id
+
+    @classmethod
+    def from_token(cls, user_id: str, principal: Dict[str, Any], payload: Dict[str, Any]) -> "Principal":
+        return cls(
+            id=user_id,
+            login=payload.get("login", principal["login"]),
+            is_superuser=principal["is_superuser"],
+            roles=tuple(principal["roles"]),
+            permission_mask=principal["permission_mask"],
+            mfa_verified=payload.get("mfa_verified", False),
+            session_id=payload.get("sid"),
+        )
+
+    def __repr__(self) -> str:
+        return f"Principal(id={self.id!r}, login={self.login!r}, roles={self.roles!r})"
+
+
+class PrincipalCache:
+    def __init__(self, bus: RedisBroadcaster, max_size: int, ttl_seconds: float, enabled: bool = True):
+        self.bus = bus
+        self.enabled = enabled
+        self.principals = TTLCache(max_size=max_size, default_ttl=ttl_seconds)
+        self.versions = TTLCache(max_size=max_size, default_ttl=ttl_seconds)
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.early_refreshes = 0
+
+        if enabled:
+            bus.subscribe(PRINCIPAL_CHANNEL, self._on_message)
+            bus.on_disconnect(self.clear)
+
+    @property
+    def ready(self) -> bool:
+        # Без активной подписки воркер может пропустить инвалидацию, поэтому
+        # локальный уровень в это время не читается и не заполняется.
+        return self.enabled and self.bus.ready
+
+    def discard(self, user_ids: Iterable[str]) -> None:
+        for user_id in user_ids:
+            self.principals.pop(user_id)
+            self.versions.pop(user_id)
+
+    def clear(self) -> None:
+        self.principals.clear()
+        self.versions.clear()
+
+    def _on_message(self, data: str) -> None:
+        self.discard(data.split(","))
+
+    @staticmethod
+    def encode_event(user_ids: Iterable[str]) -> str:
+        return ",".join(user_ids)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.redis_hits + self.redis_misses
+        return {
+            "ready": self.ready,
+            "local": self.principals.stats(),
+            "local_versions": self.versions.stats(),
+            "redis": {
+                "hits": self.redis_hits,
+                "misses": self.redis_misses,
+                "hit_ratio": round(self.redis_hits / lookups, 4) if lookups else 0.0,
+                "early_refreshes": self.early_refreshes,
+            },
+        }
+
+
+principal_cache = PrincipalCache(
+    broadcaster,
+    max_size=settings.principal_local_cache_max_size,
+    ttl_seconds=settings.principal_local_cache_ttl_seconds,
+    enabled=settings.principal_local_cache_enabled,
+)
+principal_flight = SingleFlight(timeout=settings.principal_load_wait_timeout_seconds)
+principal_load_lock = RedisLock(redis_client, ttl_ms=settings.principal_load_lock_ttl_ms)
+_refresh_principal_script = redis_client.register_script(_REFRESH_PRINCIPAL_LUA)
+_refresh_tasks: Dict[str, asyncio.Task] = {}
+register_stats_provider("principal_cache", principal_cache.stats)
+register_stats_provider("principal_single_flight", principal_flight.stats)
+
+
+def cached_roles(user_id: str) -> Tuple[str, ...] | None:
+    # Роли из локального уровня кэша, без обращения к Redis и БД
+    if not principal_cache.ready:
+        return None
+    principal = principal_cache.principals.get(user_id)
+    return tuple(principal["roles"]) if principal else None
+
+
+def principal_key(user_id: UUID | str) -> str:
+    return f"principal:{user_id}"
+
+
+def permissions_key(user_id: UUID | str) -> str:
+    return f"permissions:{user_id}"
+
+
+def permissions_version_key(user_id: UUID | str) -> str:
+    return f"perm_ver:{user_id}"
+
+
+def _permissions_version_ttl() -> int:
+    # Версия живет не меньше refresh токена: ключи неактивных пользователей
+    # не копятся в Redis, а живые токены не теряют свою версию.
+    return settings.refresh_token_expire_days * 24 * 3600
+
+
+def _encode(principal: Dict[str, Any], delta: float, expires_at: float) -> str:
+    # Кроме данных хранятся время их вычисления и момент истечения записи
+    return json.dumps(
+        [
+            principal["login"],
+            principal["is_superuser"],
+            principal["roles"],
+            principal["permission_mask"],
+            round(delta, 4),
+            int(expires_at),
+        ],
+        separators=(",", ":"),
+    )
+
+
+def _decode(value: str) -> Tuple[Dict[str, Any] | None, float, float]:
+    fields = json.loads(value)
+    login, is_superuser, roles, permission_mask = fields[:4]
+    if not isinstance(permission_mask, int):
+        # Запись старого формата со списком разрешений
+        return None, 0.0, 0.0
+    delta, expires_at = fields[4:6] if len(fields) >= 6 else (0.0, 0.0)
+    principal = {
+        "login": login,
+        "is_superuser": is_superuser,
+        "roles": roles,
+        "permission_mask": permission_mask,
+    }
+    return principal, delta, expires_at
+
+
+def _jittered_ttl() -> int:
+    # Записи, созданные одновременно (после деплоя или очистки Redis), истекают
+    # в разное время в пределах доли jitter от TTL.
+    ttl = settings.permissions_cache_ttl_seconds
+    return max(1, int(ttl * (1 - settings.permissions_cache_ttl_jitter * random.random())))
+
+
+def _refresh_due(delta: float, expires_at: float) -> bool:
+    # XFetch: вероятность досрочного пересчета растет по мере приближения к
+    # истечению и тем быстрее, чем дороже было вычисление.
+    if not expires_at or not delta:
+        return False
+    beta = settings.permissions_cache_xfetch_beta
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+
+async def load_principals(
+    user_ids: Iterable[UUID], db: AsyncSession
+) -> Dict[UUID, Dict[str, Any]]:
+    # Флаги пользователей, их роли и объединение разрешений одним запросом
+    result = await db.execute(
+        select(User.id, User.login, User.is_superuser, Role.name, Role.permissions)
+        .outerjoin(UserRole, UserRole.user_id == User.id)
+        .outerjoin(Role, Role.id == UserRole.role_id)
+        .where(User.id.in_(list(user_ids)))
+    )
+    grouped: Dict[UUID, Dict[str, Any]] = {}
+    for row in result.all():
+        entry = grouped.setdefault(
+            row.id,
+            {"login": row.login, "is_superuser": bool(row.is_superuser), "roles": set(), "permissions": set()},
+        )
+        if row.name is not None:
+            entry["roles"].add(row.name)
+            entry["permissions"].update(row.permissions or ())
+
+    principals = {}
+    for user_id, entry in grouped.items():
+        roles = entry["roles"]
+        if entry["is_superuser"]:
+            roles.add("superuser")
+            permission_mask = ALL_PERMISSIONS
+        else:
+            permission_mask = await permission_registry.mask_for(
+                entry["permissions"] or DEFAULT_PERMISSIONS, db
+            )
+        principals[user_id] = {
+            "login": entry["login"],
+            "is_superuser": entry["is_superuser"],
+            "roles": sorted(roles) or list(DEFAULT_ROLES),
+            "permission_mask": permission_mask,
+        }
+    return principals
+
+
+async def load_principal(user_id: UUID, db: AsyncSession) -> Dict[str, Any] | None:
+    return (await load_principals([user_id], db)).get(user_id)
+
+
+async def cache_principals(
+    principals: Dict[str, Dict[str, Any]], delta: float = 0.0
+) -> None:
+    now = time.time()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for user_id, principal in principals.items():
+            ttl = _jittered_ttl()
+            value = _encode(principal, delta, now + ttl)
+            pipe.set(principal_key(user_id), value, ex=ttl)
+            pipe.set(permissions_key(user_id), str(principal["permission_mask"]), ex=ttl)
+        await pipe.execute()
+
+
+async def cache_principal(user_id: UUID | str, principal: Dict[str, Any], delta: float = 0.0) -> None:
+    await cache_principals({str(user_id): principal}, delta)
+
+
+async def _refresh_principal(user_id: UUID) -> None:
+    key = str(user_id)
+    try:
+        version = await get_permissions_version(key)
+        async with AsyncDBSession() as db:
+            started = time.monotonic()
+            principal = await load_principal(user_id, db)
+            delta = time.monotonic() - started
+        if principal is None:
+            return
+        ttl = _jittered_ttl()
+        written = await _refresh_principal_script(
+            keys=[principal_key(key), permissions_key(key), permissions_version_key(key)],
+            args=[version, _encode(principal, delta, time.time() + ttl), principal["permission_mask"], ttl],
+        )
+        if not written:
+            logger.debug("Досрочное обновление пропущено: права изменились", user_id=key)
+            return
+        principal_cache.early_refreshes += 1
+        logger.debug("Данные пользователя досрочно обновлены в Redis", user_id=key)
+    except Exception as e:
+        logger.warning("Не удалось досрочно обновить данные пользователя", user_id=key, error=str(e))
+
+
+def _schedule_refresh(user_id: UUID) -> None:
+    key = str(user_id)
+    if key in _refresh_tasks:
+        return
+    task = asyncio.create_task(_refresh_principal(user_id))
+    _refresh_tasks[key] = task
+    task.add_done_callback(lambda _: _refresh_tasks.pop(key, None))
+
+
+async def resolve_principal(
+    user_id: UUID, db: AsyncSession, use_local: bool = True
+) -> Dict[str, Any] | None:
+    # При попадании в кэш сессия БД не используется и соединение из пула не берется.
+    # use_local=False читает мимо локального уровня, когда событие инвалидации
+    # могло еще не дойти до воркера.
+    local = principal_cache.ready
+    key = str(user_id)
+    if local and use_local:
+        principal: Dict[str, Any] | None = principal_cache.principals.get(key)
+        if principal is not None:
+            return principal
+
+    cached = await redis_client.get(principal_key(key))
+    principal, delta, expires_at = _decode(cached) if cached else (None, 0.0, 0.0)
+    if principal is not None:
+        principal_cache.redis_hits += 1
+        logger.debug("Данные пользователя получены из кэша Redis", user_id=key)
+        if _refresh_due(delta, expires_at):
+            _schedule_refresh(user_id)
+    else:
+        principal_cache.redis_misses += 1
+        # Одновременные промахи по одному пользователю выполняют одну загрузку
+        principal = await principal_flight.do(key, lambda: _load_principal_once(user_id, db))
+        if principal is None:
+            return None
+
+    if local:
+        principal_cache.principals.set(key, principal)
+    return principal
+
+
+async def _wait_for_cached_principal(key: str, deadline: float) -> Dict[str, Any] | None:
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOAD_LOCK_POLL_SECONDS)
+        cached = await redis_client.get(principal_key(key))
+        if cached:
+            return _decode(cached)[0]
+    return None
+
+
+async def _load_principal_once(user_id: UUID, db: AsyncSession) -> Dict[str, Any] | None:
+    key = str(user_id)
+    lock_key, lock_token = f"lock:principal:{key}", None
+    if settings.principal_load_lock_enabled:
+        lock_token = await principal_load_lock.acquire(lock_key)
+        if lock_token is None:
+            # Загрузку выполняет другой воркер: ждем его записи в Redis, по
+            # таймауту загружаем сами.
+            deadline = time.monotonic() + settings.principal_load_wait_timeout_seconds
+            principal = await _wait_for_cached_principal(key, deadline)
+            if principal is not None:
+                return principal
+            principal_flight.timeouts += 1
+
+    try:
+        started = time.monotonic()
+        principal = await load_principal(user_id, db)
+        if principal is not None:
+            await cache_principal(key, principal, time.monotonic() - started)
+            logger.debug("Данные пользователя кэшированы в Redis", user_id=key)
+        return principal
+    finally:
+        if lock_token:
+            await principal_load_lock.release(lock_key, lock_token)
+
+
+async def resolve_principals(
+    user_ids: Iterable[UUID], db: AsyncSession
+) -> Dict[UUID, Dict[str, Any]]:
+    # Пакетный вариант: локальный уровень, затем один MGET и один SQL-запрос
+    # на все промахи. Несуществующие пользователи в ответ не попадают.
+    local = principal_cache.ready
+    principals: Dict[UUID, Dict[str, Any]] = {}
+    pending = []
+    for user_id in dict.fromkeys(user_ids):
+        principal = principal_cache.principals.get(str(user_id)) if local else None
+        if principal is not None:
+            principals[user_id] = principal
+        else:
+            pending.append(user_id)
+    if not pending:
+        return principals
+
+    missing = []
+    values = await redis_client.mget([principal_key(user_id) for user_id in pending])
+    for user_id, value in zip(pending, values):
+        principal, delta, expires_at = _decode(value) if value else (None, 0.0, 0.0)
+        if principal is None:
+            missing.append(user_id)
+        else:
+            principals[user_id] = principal
+            if _refresh_due(delta, expires_at):
+                _schedule_refresh(user_id)
+    principal_cache.redis_hits += len(pending) - len(missing)
+    principal_cache.redis_misses += len(missing)
+
+    if missing:
+        started = time.monotonic()
+        loaded = await load_principals(missing, db)
+        if loaded:
+            await cache_principals(
+                {str(user_id): principal for user_id, principal in loaded.items()},
+                time.monotonic() - started,
+            )
+        principals.update(loaded)
+
+    if local:
+        for user_id in pending:
+            if user_id in principals:
+                principal_cache.principals.set(str(user_id), principals[user_id])
+    return principals
+
+
+async def get_permissions_version(user_id: UUID | str) -> str:
+    # Версия — время изменения в наносекундах, а не счетчик: после потери ключа
+    # новая версия не совпадет ни с одной из выданных ранее.
+    key = permissions_version_key(user_id)
+    ttl = _permissions_version_ttl()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.set(key, str(time.time_ns()), nx=True, ex=ttl)
+        pipe.expire(key, ttl)
+        pipe.get(key)
+        results = await pipe.execute()
+    version: str = results[-1]
+    return version
+
+
+async def principal_claims(user_id: UUID, db: AsyncSession) -> Dict[str, Any] | None:
+    # Версия читается до загрузки данных: если права изменятся между этими
+    # шагами, токен получит устаревшую версию и не будет принят на веру.
+    # Локальный уровень пропускается: новая версия в Redis может появиться
+    # раньше, чем до воркера дойдет событие, и в токен попали бы старые права
+    # с новой версией.
+    version = await get_permissions_version(user_id)
+    principal = await resolve_principal(user_id, db, use_local=False)
+    if principal is None:
+        return None
+    return {
+        "login": principal["login"],
+        "su": principal["is_superuser"],
+        "roles": principal["roles"],
+        "perms": principal["permission_mask"],
+        "pv": version,
+    }
+
+
+async def _current_permissions_version(user_id: str) -> str | None:
+    local = principal_cache.ready
+    if local:
+        version: str | None = principal_cache.versions.get(user_id)
+        if version is not None:
+            return version
+    version = await redis_client.get(permissions_version_key(user_id))
+    if version and local:
+        principal_cache.versions.set(user_id, version)
+    return version
+
+
+async def principal_for_token(
+    user_id: UUID, payload: Dict[str, Any], db: AsyncSession
+) -> Dict[str, Any] | None:
+    version = payload.get("pv")
+    permission_mask = payload.get("perms")
+    if (
+        version
+        and isinstance(permission_mask, int)
+        and await _current_permissions_version(str(user_id)) == version
+    ):
+        logger.debug("Права пользователя взяты из токена", user_id=str(user_id))
+        return {
+            "login": payload.get("login"),
+            "is_superuser": payload.get("su", False),
+            "roles": payload.get("roles", []),
+            "permission_mask": permission_mask,
+        }
+    # Версия в токене устарела: локальная копия может быть старше нее
+    return await resolve_principal(user_id, db, use_local=not version)
+
+
+async def invalidate_principal(*user_ids: UUID | str) -> None:
+    keys = [str(user_id) for user_id in user_ids]
+    for start in range(0, len(keys), INVALIDATION_BATCH_SIZE):
+        await _invalidate_batch(keys[start:start + INVALIDATION_BATCH_SIZE])
+
+
+async def invalidate_principals(user_ids: AsyncIterable[UUID | str]) -> int:
+    # Для больших выборок (все владельцы роли): идентификаторы не собираются
+    # в память целиком, в Redis уходит по пайплайну на пачку.
+    batch: list[str] = []
+    total = 0
+    async for user_id in user_ids:
+        batch.append(str(user_id))
+        if len(batch) >= INVALIDATION_BATCH_SIZE:
+            await _invalidate_batch(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        await _invalidate_batch(batch)
+        total += len(batch)
+    return total
+
+
+async def _invalidate_batch(user_ids: list[str]) -> None:
+    if not user_ids:
+        return
+    version = str(time.time_ns())
+    ttl = _permissions_version_ttl()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for user_id in user_ids:
+            pipe.delete(principal_key(user_id), permissions_key(user_id))
+            pipe.set(permissions_version_key(user_id), version, ex=ttl)
+        # Остальные воркеры сбрасывают локальные копии по событию
+        pipe.publish(PRINCIPAL_CHANNEL, PrincipalCache.encode_event(user_ids))
+        await pipe.execute()
+    principal_cache.discard(user_ids)
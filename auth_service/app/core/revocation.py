@@ -0,0 +1,234 @@
+import math
+import time
+from typing import Any, Dict, Tuple
+
+import structlog
+from redis import asyncio as aioredis
+
+from app.settings import settings
+from app.utils.bloom import BloomFilter
+from app.utils.cache import redis_client
+from app.utils.metrics import register_stats_provider
+from app.utils.pubsub import RedisBroadcaster, broadcaster
+
+logger = structlog.get_logger(__name__)
+
+REVOCATION_CHANNEL = "blacklist:events"
+
+
+class RevocationFilter:
+    def __init__(
+        self,
+        redis: aioredis.Redis,
+        bus: RedisBroadcaster,
+        bucket_seconds: int,
+        bucket_capacity: int,
+        error_rate: float,
+        enabled: bool = True,
+    ):
+        self.redis = redis
+        self.bus = bus
+        self.bucket_seconds = bucket_seconds
+        self.bucket_capacity = bucket_capacity
+        self.error_rate = error_rate
+        self._warmed = False
+        # Ключ корзины — номер интервала, в конце которого истекают все
+        # попавшие в нее jti; после этого корзина целиком выбрасывается.
+        self._buckets: Dict[int, BloomFilter] = {}
+        self.negatives = 0
+        self.positives = 0
+        self.false_positives = 0
+        self.fallbacks = 0
+
+        if enabled:
+            bus.subscribe(REVOCATION_CHANNEL, self._on_message)
+            bus.on_resync(self.warm_up)
+            bus.on_disconnect(self._on_disconnect)
+
+    @property
+    def ready(self) -> bool:
+        return self._warmed and self.bus.ready
+
+    def add(self, jti: str, expires_at: float) -> None:
+        bucket_id = math.ceil(expires_at / self.bucket_seconds)
+        bucket = self._buckets.get(bucket_id)
+        if bucket is None:
+            bucket = BloomFilter(self.bucket_capacity, self.error_rate)
+            self._buckets[bucket_id] = bucket
+        bucket.add(jti)
+
+    def might_contain(self, jti: str) -> bool | None:
+        if not self.ready:
+            self.fallbacks += 1
+            return None
+
+        self._rotate()
+        hashes = BloomFilter.hashes(jti)
+        for bucket in self._buckets.values():
+            if bucket.contains_hashed(*hashes):
+                self.positives += 1
+                return True
+        self.negatives += 1
+        return False
+
+    def record_false_positive(self) -> None:
+        self.false_positives += 1
+
+    def _rotate(self) -> None:
+        current = math.floor(time.time() / self.bucket_seconds)
+        expired = [bucket_id for bucket_id in self._buckets if bucket_id <= current]
+        for bucket_id in expired:
+            del self._buckets[bucket_id]
+
+    def _on_message(self, data: str) -> None:
+        try:
+            jti, expires_at = data.rsplit(":", 1)
+            self.add(jti, float(expires_at))
+        except ValueError:
+            logger.warning("Некорректное событие черного списка", data=data)
+
+    def _on_disconnect(self) -> None:
+        self._warmed = False
+
+    async def warm_up(self) -> None:
+        self._warmed = False
+        self._buckets.clear()
+        now = time.time()
+        loaded = 0
+        batch: list[str] = []
+
+        async def _load(keys: list[str]) -> int:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.ttl(key)
+                ttls = await pipe.execute()
+            for key, ttl in zip(keys, ttls):
+                if ttl is not None and ttl > 0:
+                    self.add(key.split(":", 1)[1], now + ttl)
+            return len(keys)
+
+        async for key in self.redis.scan_iter(match="blacklist:*", count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                loaded += await _load(batch)
+                batch = []
+        if batch:
+            loaded += await _load(batch)
+
+        self._warmed = True
+        logger.info("Локальный фильтр черного списка загружен", tokens=loaded)
+
+    @staticmethod
+    def encode_event(jti: str, expires_at: float) -> str:
+        return f"{jti}:{math.ceil(expires_at)}"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "buckets": len(self._buckets),
+            "items": sum(bucket.count for bucket in self._buckets.values()),
+            "negatives": self.negatives,
+            "positives": self.positives,
+            "false_positives": self.false_positives,
+            "fallbacks": self.fallbacks,
+        }
+
+
+revocation_filter = RevocationFilter(
+    redis_client,
+    broadcaster,
+    bucket_seconds=settings.blacklist_filter_bucket_seconds,
+    bucket_capacity=settings.blacklist_filter_bucket_capacity,
+    error_rate=settings.blacklist_filter_error_rate,
+    enabled=settings.blacklist_filter_enabled,
+)
+register_stats_provider("blacklist_filter", revocation_filter.stats)
+
+
+EPOCH_CHANNEL = "session_epochs:events"
+
+
+class SessionEpochs:
+    def __init__(self, redis: aioredis.Redis, bus: RedisBroadcaster, enabled: bool = True):
+        self.redis = redis
+        self.bus = bus
+        self._warmed = False
+        self._adds_since_prune = 0
+        # user_id -> (not_before, сохраненная сессия, время истечения записи)
+        self._epochs: Dict[str, Tuple[float, str | None, float]] = {}
+
+        if enabled:
+            bus.subscribe(EPOCH_CHANNEL, self._on_message)
+            bus.on_resync(self.warm_up)
+            bus.on_disconnect(self._on_disconnect)
+
+    @property
+    def ready(self) -> bool:
+        return self._warmed and self.bus.ready
+
+    @staticmethod
+    def encode(not_before: float, keep_session_id: str | None) -> str:
+        return f"{not_before:.6f}:{keep_session_id or ''}"
+
+    @staticmethod
+    def decode(value: str) -> Tuple[float, str | None]:
+        not_before, keep_session_id = value.split(":", 1)
+        return float(not_before), keep_session_id or None
+
+    def add(self, user_id: str, not_before: float, keep_session_id: str | None, expires_at: float) -> None:
+        self._epochs[user_id] = (not_before, keep_session_id, expires_at)
+        self._adds_since_prune += 1
+        if self._adds_since_prune >= 1000:
+            self._prune()
+
+    def get(self, user_id: str) -> Tuple[float, str | None] | None:
+        entry = self._epochs.get(user_id)
+        if entry is None:
+            return None
+        not_before, keep_session_id, expires_at = entry
+        if expires_at <= time.time():
+            del self._epochs[user_id]
+            return None
+        return not_before, keep_session_id
+
+    def _prune(self) -> None:
+        now = time.time()
+        for user_id in [uid for uid, entry in self._epochs.items() if entry[2] <= now]:
+            del self._epochs[user_id]
+        self._adds_since_prune = 0
+
+    def _on_message(self, data: str) -> None:
+        try:
+            user_id, expires_at, value = data.split(":", 2)
+            self.add(user_id, *self.decode(value), float(expires_at))
+        except ValueError:
+            logger.warning("Некорректное событие отзыва сессий", data=data)
+
+    def _on_disconnect(self) -> None:
+        self._warmed = False
+
+    async def warm_up(self) -> None:
+        self._warmed = False
+        self._epochs.clear()
+        now = time.time()
+        keys = [key async for key in self.redis.scan_iter(match="user_tokens_nbf:*", count=1000)]
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in batch:
+                    pipe.get(key)
+                    pipe.ttl(key)
+                replies = await pipe.execute()
+            for key, value, ttl in zip(batch, replies[::2], replies[1::2]):
+                if value and ttl and ttl > 0:
+                    self.add(key.split(":", 1)[1], *self.decode(value), now + ttl)
+
+        self._warmed = True
+        logger.info("Загружены эпохи отзыва сессий", users=len(self._epochs))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "users": len(self._epochs)}
+
+
+session_epochs = SessionEpochs(redis_client, broadcaster, enabled=settings.session_epochs_mirror_enabled)
+register_stats_provider("session_epochs", session_epochs.stats)
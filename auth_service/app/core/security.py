@@ -1,19 +1,28 @@
-from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Union
-from uuid import UUID, uuid4
+import hashlib
+import time
+from typing import Dict, Tuple, Union
+from uuid import uuid4
 
 import structlog
-from jose import jwt
 from jose.exceptions import ExpiredSignatureError, JWTError
-from passlib.context import CryptContext
 from sqlalchemy.orm import Mapped
 
+from app.core.hashing import (hash_password, hashing_pool, pwd_context,
+                              verify_and_update_password_hash,
+                              verify_password_hash)
+from app.core.keys import is_asymmetric, jwt_backend, key_ring
+from app.core.revocation import (REVOCATION_CHANNEL, SessionEpochs,
+                                 revocation_filter, session_epochs)
 from app.settings import settings
 from app.utils.cache import redis_client
+from app.utils.metrics import register_stats_provider
+from app.utils.ttl_cache import TTLCache
 
 logger = structlog.get_logger(__name__)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+verified_token_cache = TTLCache(max_size=settings.token_cache_max_size)
+register_stats_provider("verified_token_cache", verified_token_cache.stats)
+register_stats_provider("password_hashing_pool", hashing_pool.stats)
 
 
 def verify_password(
@@ -26,81 +35,116 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
-def generate_jti() -> str:
-    return str(uuid4())
+async def verify_password_async(
+    plain_password: str, hashed_password: Union[str, Mapped[str]]
+) -> bool:
+    return await hashing_pool.run(verify_password_hash, plain_password, hashed_password)
+
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: Union[str, Mapped[str]]
+) -> tuple[bool, str | None]:
+    return await hashing_pool.run(verify_and_update_password_hash, plain_password, hashed_password)
 
 
-def create_access_token(
-    subject: UUID,
-    payload: Dict[str, Any] | None = None,
-    expires_minutes: int | None = None,
-    mfa_verified: bool = False,
-) -> str:
-    to_encode = payload.copy() if payload else {}
-    expire = datetime.now(timezone.utc) + timedelta(
-        minutes=expires_minutes or settings.access_token_expire_minutes
-    )
-    jti = generate_jti()
-    to_encode.update(
-        {"exp": expire, "sub": str(subject), "jti": jti, "mfa_verified": mfa_verified}
-    )
-    encoded_jwt = jwt.encode(
-        to_encode,
-        settings.jwt_secret_key.get_secret_value(),
-        algorithm=settings.jwt_algorithm,
-    )
-    logger.debug("Создан access токен", user_id=subject, jti=jti)
-    return encoded_jwt
-
-
-def create_refresh_token(
-    subject: Union[UUID, Mapped[UUID]],
-    payload: Dict[str, Any] | None = None,
-    expires_days: int | None = None,
-) -> str:
-    to_encode = payload.copy() if payload else {}
-    expire = datetime.now(timezone.utc) + timedelta(
-        days=expires_days or settings.refresh_token_expire_days
-    )
-    jti = generate_jti()
-    to_encode.update({"exp": expire, "sub": str(subject), "jti": jti})
-    encoded_jwt = jwt.encode(
-        to_encode,
-        settings.jwt_refresh_secret_key.get_secret_value(),
-        algorithm=settings.jwt_algorithm,
-    )
-    logger.debug("Создан refresh токен", user_id=subject, jti=jti)
-    return encoded_jwt
+async def hash_password_async(password: str) -> str:
+    return await hashing_pool.run(hash_password, password)
+
+
+def generate_jti() -> str:
+    return str(uuid4())
 
 
 async def is_token_blacklisted(jti: str) -> bool:
+    # Отрицательный ответ локального фильтра точен; в Redis идем только при
+    # попадании в фильтр или пока фильтр не синхронизирован.
+    if revocation_filter.might_contain(jti) is False:
+        return False
+
     blacklisted = await redis_client.get(f"blacklist:{jti}")
+    if blacklisted is None and revocation_filter.ready:
+        revocation_filter.record_false_positive()
     return blacklisted is not None
 
 
 async def add_to_blacklist(jti: str, ttl_seconds: int):
-    await redis_client.setex(f"blacklist:{jti}", ttl_seconds, "1")
+    expires_at = time.time() + ttl_seconds
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.setex(f"blacklist:{jti}", ttl_seconds, "1")
+        pipe.publish(REVOCATION_CHANNEL, revocation_filter.encode_event(jti, expires_at))
+        await pipe.execute()
+    revocation_filter.add(jti, expires_at)
     logger.info("Токен добавлен в черный список", jti=jti, ttl=ttl_seconds)
 
 
+async def get_session_epoch(user_id: str) -> Tuple[float, str | None] | None:
+    if session_epochs.ready:
+        return session_epochs.get(user_id)
+    value = await redis_client.get(f"user_tokens_nbf:{user_id}")
+    return SessionEpochs.decode(value) if value else None
+
+
+def is_revoked_by_epoch(payload: Dict, epoch: Tuple[float, str | None] | None) -> bool:
+    if epoch is None:
+        return False
+    not_before, keep_session_id = epoch
+    if keep_session_id and payload.get("sid") == keep_session_id:
+        return False
+    return payload.get("iat", 0) < not_before
+
+
+def _token_cache_key(token: str, refresh: bool) -> tuple[bool, bytes]:
+    return refresh, hashlib.sha256(token.encode()).digest()
+
+
+def get_cached_token_claims(token: str) -> Dict | None:
+    # Claims access токена, уже проверенного этим воркером, без повторной
+    # проверки подписи и черного списка
+    if not settings.token_cache_enabled:
+        return None
+    return verified_token_cache.get(_token_cache_key(token, False))
+
+
+def verify_jwt(
+    token: str, refresh: bool = False, options: Dict | None = None
+) -> Dict:
+    # Кэшируются только проверки с опциями по умолчанию: запись живет до exp
+    # токена, поэтому истекший токен всегда уходит на полную проверку.
+    cacheable = settings.token_cache_enabled and not options
+    cache_key = _token_cache_key(token, refresh) if cacheable else None
+    cached = verified_token_cache.get(cache_key) if cache_key else None
+
+    if cached is not None:
+        decoded = dict(cached)
+    else:
+        algorithm = key_ring.refresh_algorithm if refresh else key_ring.access_algorithm
+        try:
+            if refresh:
+                key = key_ring.refresh_key
+            elif is_asymmetric(algorithm):
+                key = key_ring.get_verification_key(jwt_backend.get_unverified_header(token).get("kid"))
+            else:
+                key = key_ring.signing_key
+            decoded = jwt_backend.decode(
+                token, key, algorithms=[algorithm], options=options or {}
+            )
+        except ExpiredSignatureError:
+            logger.warning("Попытка декодировать истекший токен")
+            raise
+        except JWTError:
+            logger.warning("Попытка декодировать неверный токен")
+            raise
+
+        if cache_key and isinstance(decoded.get("exp"), (int, float)):
+            verified_token_cache.set(cache_key, dict(decoded), expires_at=decoded["exp"])
+
+    return decoded
+
+
 async def decode_jwt(
     token: str, refresh: bool = False, options: Dict | None = None
 ) -> Dict:
-    secret = (
-        settings.jwt_refresh_secret_key.get_secret_value()
-        if refresh
-        else settings.jwt_secret_key.get_secret_value()
-    )
-    try:
-        decoded = jwt.decode(
-            token, secret, algorithms=[settings.jwt_algorithm], options=options or {}
-        )
-    except ExpiredSignatureError:
-        logger.warning("Попытка декодировать истекший токен")
-        raise
-    except JWTError:
-        logger.warning("Попытка декодировать неверный токен")
-        raise
+    decoded = verify_jwt(token, refresh=refresh, options=options)
 
     jti = decoded.get("jti")
     if jti and not refresh:
@@ -108,5 +152,10 @@ async def decode_jwt(
             logger.warning("Попытка использовать токен из черного списка", jti=jti)
             raise ValueError("Token is blacklisted")
 
+    user_id = decoded.get("sub")
+    if user_id and is_revoked_by_epoch(decoded, await get_session_epoch(user_id)):
+        logger.warning("Попытка использовать токен отозванной сессии", jti=jti, user_id=user_id)
+        raise ValueError("Token has been revoked")
+
     logger.debug("Токен успешно декодирован", jti=jti, refresh=refresh)
     return decoded
@@ -0,0 +1,132 @@
+import base64
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Union
+from uuid import UUID, uuid4
+
+import structlog
+from sqlalchemy.orm import Mapped
+
+from app.core.jwt_backends import Signer
+from app.core.keys import KeyRing, key_ring
+from app.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+
+def _b64url(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+@dataclass(frozen=True, slots=True)
+class IssuedToken:
+    token: str
+    jti: str
+    sub: str
+    exp: int
+
+
+class _Signer:
+    __slots__ = ("header_segment", "sign")
+
+    def __init__(self, algorithm: str, sign: Signer, kid: str | None = None):
+        header: Dict[str, str] = {"alg": algorithm, "typ": "JWT"}
+        if kid:
+            header["kid"] = kid
+        self.header_segment = _b64url(
+            json.dumps(header, separators=(",", ":"), sort_keys=True).encode()
+        )
+        self.sign = sign
+
+    def encode(self, claims: Dict[str, Any]) -> str:
+        signing_input = self.header_segment + b"." + _b64url(
+            json.dumps(claims, separators=(",", ":")).encode()
+        )
+        return (signing_input + b"." + _b64url(self.sign(signing_input))).decode()
+
+
+class TokenFactory:
+    def __init__(self, keys: KeyRing):
+        # Заголовки и ключи готовятся один раз; на выпуск токена остаются
+        # только сериализация claims и подпись.
+        self._access = _Signer(
+            keys.access_algorithm,
+            keys.backend.signer(keys.signing_key, keys.access_algorithm),
+            keys.signing_kid,
+        )
+        self._refresh = _Signer(
+            keys.refresh_algorithm,
+            keys.backend.signer(keys.refresh_key, keys.refresh_algorithm),
+        )
+
+    @staticmethod
+    def _claims(
+        subject: Union[UUID, Mapped[UUID], str],
+        payload: Dict[str, Any] | None,
+        lifetime_seconds: int,
+        session_id: str | None,
+    ) -> Dict[str, Any]:
+        claims = payload.copy() if payload else {}
+        now = time.time()
+        claims.update(
+            {
+                "exp": int(now) + lifetime_seconds,
+                # iat с микросекундами: эпоха отзыва сессий не задевает токены,
+                # выпущенные в ту же секунду после нее
+                "iat": round(now, 6),
+                "sub": str(subject),
+                "jti": str(uuid4()),
+                "sid": session_id or str(uuid4()),
+            }
+        )
+        return claims
+
+    def mint_access(
+        self,
+        subject: Union[UUID, Mapped[UUID], str],
+        payload: Dict[str, Any] | None = None,
+        expires_minutes: int | None = None,
+        mfa_verified: bool = False,
+        session_id: str | None = None,
+    ) -> IssuedToken:
+        claims = self._claims(
+            subject, payload, (expires_minutes or settings.access_token_expire_minutes) * 60, session_id
+        )
+        claims["mfa_verified"] = mfa_verified
+        token = self._access.encode(claims)
+        logger.debug("Создан access токен", user_id=claims["sub"], jti=claims["jti"])
+        return IssuedToken(token=token, jti=claims["jti"], sub=claims["sub"], exp=claims["exp"])
+
+    def mint_refresh(
+        self,
+        subject: Union[UUID, Mapped[UUID], str],
+        payload: Dict[str, Any] | None = None,
+        expires_days: int | None = None,
+        session_id: str | None = None,
+    ) -> IssuedToken:
+        claims = self._claims(
+            subject, payload, (expires_days or settings.refresh_token_expire_days) * 24 * 3600, session_id
+        )
+        token = self._refresh.encode(claims)
+        logger.debug("Создан refresh токен", user_id=claims["sub"], jti=claims["jti"])
+        return IssuedToken(token=token, jti=claims["jti"], sub=claims["sub"], exp=claims["exp"])
+
+    def mint_pair(
+        self,
+        subject: Union[UUID, Mapped[UUID], str],
+        access_payload: Dict[str, Any] | None = None,
+        refresh_payload: Dict[str, Any] | None = None,
+        mfa_verified: bool = False,
+        session_id: str | None = None,
+    ) -> tuple[IssuedToken, IssuedToken]:
+        # Оба токена пары относятся к одной сессии: sid сохраняется при
+        # обновлении и позволяет оставить ее при отзыве остальных.
+        session_id = session_id or str(uuid4())
+        return (
+            self.mint_access(subject, access_payload, mfa_verified=mfa_verified, session_id=session_id),
+            self.mint_refresh(subject, refresh_payload, session_id=session_id),
+        )
+
+
+token_factory = TokenFactory(key_ring)
@@ -3,22 +3,35 @@ from contextlib import asynccontextmanager
 import structlog
 from fastapi import Depends, FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from starlette.middleware.sessions import SessionMiddleware
 
-from app.api.v1.routes import auth, roles
+from app.api.v1.routes import auth, metrics, permissions, roles
+from app.core.hashing import PasswordHashingUnavailable, hashing_pool
+from app.core.keys import key_ring
 from app.core.logging_config import setup_logging
+from app.core.middleware import RateLimitMiddleware
 from app.core.tracing import setup_tracing
+from app.schemas.error import ErrorResponseModel
 from app.settings import settings
 from app.utils.cache import redis_client, test_connection
-from app.utils.rate_limiter import RedisLeakyBucketRateLimiter
+from app.utils.pubsub import broadcaster
+from app.utils.rate_limiter import create_rate_limiter
 
+logger = structlog.get_logger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     setup_logging()
     await test_connection()
-    app.state.rate_limiter = RedisLeakyBucketRateLimiter(redis_client, settings)
+    app.state.rate_limiter = create_rate_limiter(redis_client, settings)
+    await app.state.rate_limiter.start()
+    await broadcaster.start()
+    await hashing_pool.start()
     yield
+    await app.state.rate_limiter.stop()
+    await broadcaster.stop()
+    hashing_pool.shutdown()
     await redis_client.close()
 
 app = FastAPI(
@@ -35,6 +48,12 @@ app.add_middleware(
     SessionMiddleware,
     secret_key=settings.session_secret_key.get_secret_value()
 )
+# Внутри CORS: ответ 429 тоже получает CORS-заголовки
+app.add_middleware(
+    RateLimitMiddleware,
+    routes=settings.rate_limit_routes,
+    prefix=settings.api_v1_str,
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.cors_origins,
@@ -43,15 +62,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(PasswordHashingUnavailable)
+async def password_hashing_unavailable_handler(request: Request, exc: PasswordHashingUnavailable):
+    logger.warning("Хеширование пароля недоступно", path=request.url.path, error=str(exc))
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=ErrorResponseModel(
+            detail={"service": "Service is overloaded. Please try again later."}
+        ).model_dump(),
+        headers={"Retry-After": "1"},
+    )
+
 @app.get("/health", status_code=status.HTTP_200_OK)
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/.well-known/jwks.json", include_in_schema=False)
+async def jwks():
+    return JSONResponse(
+        content=key_ring.jwks(),
+        headers={"Cache-Control": f"public, max-age={settings.jwks_cache_max_age_seconds}"},
+    )
+
 app.include_router(auth.router, prefix=settings.api_v1_str)
 app.include_router(roles.router, prefix=settings.api_v1_str)
+app.include_router(permissions.router, prefix=settings.api_v1_str)
+app.include_router(metrics.router, prefix=settings.api_v1_str)
 
 if settings.enable_tracer:
     setup_tracing(app)
-
-async def get_rate_limiter(request: Request) -> RedisLeakyBucketRateLimiter:
-    return request.app.state.rate_limiter
@@ -1,7 +1,8 @@
 from .base import Base
 from .login_history import LoginHistory
+from .permission import Permission
 from .role import Role
 from .user import User
 from .user_role import UserRole
 
-__all__ = ["Base", "User", "Role", "UserRole", "LoginHistory"]
+__all__ = ["Base", "User", "Role", "UserRole", "LoginHistory", "Permission"]
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, Integer, Sequence, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+permission_bit_seq = Sequence("permission_bit_seq", start=0, minvalue=0)
+
+
+class Permission(Base):
+    __tablename__ = "permissions"
+
+    name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    # Номер бита в маске разрешений: выдается последовательностью и никогда
+    # не переиспользуется, поэтому маски в кэше и токенах остаются валидными.
+    bit: Mapped[int] = mapped_column(
+        Integer,
+        permission_bit_seq,
+        server_default=permission_bit_seq.next_value(),
+        unique=True,
+        nullable=False,
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
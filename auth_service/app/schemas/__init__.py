@@ -1,9 +1,11 @@
-from .auth import (LoginRequest, MessageResponse, RefreshToken,
-                   RegisterRequest, TokenData, TokenPair)
+from .auth import (IntrospectionRequest, LoginRequest, MessageResponse,
+                   RefreshToken, RegisterRequest, TokenData,
+                   TokenIntrospection, TokenPair)
 from .login_history import LoginHistoryResponse
 from .mfa import MFASetupResponse, MFAVerifyRequest, MFAVerifyResponse
 from .oauth_provider import OAuthProvider
-from .permission import (PermissionCheckRequest, PermissionCheckResponse,
+from .permission import (PermissionCheckBatchRequest, PermissionCheckRequest,
+                         PermissionCheckResponse, PermissionCheckResult,
                          UserPermissionsResponse)
 from .role import RoleBase, RoleCreate, RoleResponse, RoleUpdate
 from .user import UpdateProfileRequest, UserBase, UserCreate, UserResponse
@@ -25,9 +27,13 @@ __all__ = [
     "MFAVerifyResponse",
     "PermissionCheckRequest",
     "PermissionCheckResponse",
+    "PermissionCheckBatchRequest",
+    "PermissionCheckResult",
     "UserPermissionsResponse",
     "MessageResponse",
     "RefreshToken",
     "LoginHistoryResponse",
+    "IntrospectionRequest",
+    "TokenIntrospection",
     "OAuthProvider",
 ]
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Annotated, Optional
+from typing import Annotated, List, Optional
 
 from annotated_types import MaxLen, MinLen
 from pydantic import BaseModel, EmailStr
@@ -30,6 +30,20 @@ class RegisterRequest(BaseModel):
     email: Optional[Annotated[EmailStr, MaxLen(100)]] = None
 
 
+MAX_INTROSPECTION_TOKENS = 100
+
+
+class IntrospectionRequest(BaseModel):
+    tokens: Annotated[List[str], MinLen(1), MaxLen(MAX_INTROSPECTION_TOKENS)]
+
+
+class TokenIntrospection(BaseModel):
+    active: bool
+    sub: Optional[str] = None
+    exp: Optional[int] = None
+    permissions: List[str] = []
+
+
 class MessageResponse(BaseModel):
     message: str
 
@@ -1,8 +1,11 @@
-from typing import List
+from typing import Annotated, List
 from uuid import UUID
 
+from annotated_types import MaxLen, MinLen
 from pydantic import BaseModel
 
+MAX_PERMISSION_CHECKS = 500
+
 
 class PermissionCheckRequest(BaseModel):
     user_id: str
@@ -14,6 +17,17 @@ class PermissionCheckResponse(BaseModel):
     missing_permissions: List[str] = []
 
 
+class PermissionCheckBatchRequest(BaseModel):
+    checks: Annotated[
+        List[PermissionCheckRequest], MinLen(1), MaxLen(MAX_PERMISSION_CHECKS)
+    ]
+
+
+class PermissionCheckResult(PermissionCheckResponse):
+    user_id: str
+    required_permission: str
+
+
 class UserPermissionsResponse(BaseModel):
     user_id: UUID
-    permissions: List[str]
\ No newline at end of file
+    permissions: List[str]
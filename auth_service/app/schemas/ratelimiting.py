@@ -1,4 +1,8 @@
-from pydantic import BaseModel
+from typing import Dict, Literal
+
+from pydantic import BaseModel, ConfigDict
+
+RateLimitAlgorithm = Literal["leaky_bucket", "token_bucket", "gcra", "sliding_window"]
 
 
 class RateLimitConfig(BaseModel):
@@ -8,14 +12,30 @@ class RateLimitConfig(BaseModel):
 
 
 class RoleBasedLimits(BaseModel):
+    # Лимиты для ролей задаются дополнительными полями с именем роли:
+    # {"default": {...}, "guest": {...}, "editor": {...}}.
+    # leaky_bucket и token_bucket: capacity — размер всплеска, leak_rate — запросов
+    # в секунду; gcra — то же с хранением одного времени; sliding_window —
+    # не больше capacity запросов за окно capacity / leak_rate секунд.
+    model_config = ConfigDict(extra="allow")
+    __pydantic_extra__: Dict[str, RateLimitConfig]
+
+    algorithm: RateLimitAlgorithm = "leaky_bucket"
     default: RateLimitConfig
-    guest: RateLimitConfig | None = None
-    user: RateLimitConfig | None = None
-    premium: RateLimitConfig | None = None
-    superuser: RateLimitConfig | None = None
+
+    @property
+    def roles(self) -> Dict[str, RateLimitConfig]:
+        return self.__pydantic_extra__
 
 
 class RateLimitConfigDict(BaseModel):
+    # Типы трафика, кроме default, задаются дополнительными полями:
+    # {"default": {...}, "login": {...}, "bulk": {...}}.
+    model_config = ConfigDict(extra="allow")
+    __pydantic_extra__: Dict[str, RoleBasedLimits]
+
     default: RoleBasedLimits
-    login: RoleBasedLimits | None = None
-    register: RoleBasedLimits | None = None
+
+    @property
+    def traffic_types(self) -> Dict[str, RoleBasedLimits]:
+        return {"default": self.default, **self.__pydantic_extra__}
@@ -3,7 +3,25 @@ from typing import Annotated, List, Optional
 from uuid import UUID
 
 from annotated_types import MaxLen
-from pydantic import BaseModel, ConfigDict, Field, field_validator
+from pydantic import AfterValidator, BaseModel, ConfigDict
+
+
+def validate_wildcard(permission: str) -> str:
+    # "*" допускается только как последний сегмент: "*", "roles:*"
+    segments = permission.split(":")
+    if any(not segment for segment in segments):
+        raise ValueError(f"Empty segment in permission '{permission}'")
+    if "*" in segments[:-1] or any(
+        "*" in segment and segment != "*" for segment in segments
+    ):
+        raise ValueError(
+            f"Wildcard is only allowed as the last segment: '{permission}'"
+        )
+    return permission
+
+
+# Проверяется только во входящих данных: уже сохраненные роли отдаются как есть
+PermissionPattern = Annotated[str, MaxLen(100), AfterValidator(validate_wildcard)]
 
 
 class RoleBase(BaseModel):
@@ -13,11 +31,11 @@ class RoleBase(BaseModel):
 
 
 class RoleCreate(RoleBase):
-    pass
+    permissions: List[PermissionPattern]
 
 
 class RoleUpdate(RoleBase):
-    pass
+    permissions: List[PermissionPattern]
 
 
 class RoleResponse(RoleBase):
@@ -1,4 +1,5 @@
 import datetime
+import time
 from uuid import UUID
 
 import structlog
@@ -7,10 +8,15 @@ from sqlalchemy import desc, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-from app.core.security import (add_to_blacklist, create_access_token,
-                               create_refresh_token, decode_jwt, generate_jti,
-                               get_password_hash, is_token_blacklisted,
-                               verify_password)
+from app.core.permissions import permission_registry
+from app.core.principal import (DEFAULT_PERMISSIONS, invalidate_principal,
+                                principal_claims, resolve_principals)
+from app.core.revocation import (EPOCH_CHANNEL, SessionEpochs,
+                                 revocation_filter, session_epochs)
+from app.core.security import (add_to_blacklist, decode_jwt, generate_jti,
+                               hash_password_async, is_revoked_by_epoch,
+                               verify_and_update_password_async, verify_jwt)
+from app.core.tokens import token_factory
 from app.models import LoginHistory, User
 from app.models.social_account import SocialAccount
 from app.settings import settings
@@ -18,28 +24,56 @@ from app.utils.cache import redis_client
 
 logger = structlog.get_logger(__name__)
 
+# Проверка активности старого jti и его отзыв выполняются атомарно: из двух
+# параллельных обновлений с одним токеном SREM успешен только у одного.
+_ROTATE_REFRESH_LUA = """
+if redis.call('SREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('SET', KEYS[2], '1', 'EX', ARGV[3])
+redis.call('SADD', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+_rotate_refresh_script = redis_client.register_script(_ROTATE_REFRESH_LUA)
+
 
 class AuthService:
     def __init__(self, db_session: AsyncSession):
         self.db_session = db_session
 
+    async def _access_payload(self, user_id: UUID, login: str | None) -> dict:
+        if settings.token_embed_permissions:
+            claims = await principal_claims(user_id, self.db_session)
+            if claims:
+                return claims
+        return {"login": login}
+
     async def login(self, login: str, password: str, ip_address: str | None = None, user_agent: str | None = None) -> dict | None:
         result = await self.db_session.execute(select(User).where(User.login == login))
         user = result.scalars().first()
-        if not user or not verify_password(password, user.password_hash):
+        if not user:
             logger.warning(
                 "Неудачная попытка входа: неверный логин или пароль", login=login
             )
             return None
 
-        access_token = create_access_token(
-            subject=user.id, payload={"login": user.login}
+        valid, new_hash = await verify_and_update_password_async(password, user.password_hash)
+        if not valid:
+            logger.warning(
+                "Неудачная попытка входа: неверный логин или пароль", login=login
+            )
+            return None
+        if new_hash:
+            # Сохраняется вместе с записью истории входа ниже
+            user.password_hash = new_hash
+            logger.info("Хеш пароля обновлен до текущих параметров", user_id=user.id)
+
+        access, refresh = token_factory.mint_pair(
+            subject=user.id,
+            access_payload=await self._access_payload(user.id, user.login),
         )
-        refresh_token = create_refresh_token(subject=user.id)
-
-        refresh_payload = await decode_jwt(refresh_token, refresh=True)
-        refresh_jti = refresh_payload["jti"]
-        await redis_client.sadd(f"user_active_refresh_jtis:{user.id}", refresh_jti)
+        await redis_client.sadd(f"user_active_refresh_jtis:{user.id}", refresh.jti)
         await redis_client.expire(f"user_active_refresh_jtis:{user.id}", settings.refresh_token_expire_days * 24 * 3600)
 
         login_history_entry = LoginHistory(
@@ -54,7 +88,7 @@ class AuthService:
         logger.info(
             "Пользователь успешно вошел в систему", user_id=user.id, login=user.login
         )
-        return {"access_token": access_token, "refresh_token": refresh_token}
+        return {"access_token": access.token, "refresh_token": refresh.token}
 
     async def register(
         self, login: str, password: str, email: str | None = None
@@ -87,7 +121,7 @@ class AuthService:
                 errors["email"] = f"User with email '{email}' already exists."
 
         if success:
-            hashed_password = get_password_hash(password)
+            hashed_password = await hash_password_async(password)
             user = User(login=login, password_hash=hashed_password, email=email)
             self.db_session.add(user)
             await self.db_session.commit()
@@ -127,7 +161,7 @@ class AuthService:
                 user = User(
                     login=f"{login}_{provider}",
                     email=email,
-                    password_hash=get_password_hash(generate_jti()),
+                    password_hash=await hash_password_async(generate_jti()),
                 )
                 self.db_session.add(user)
                 await self.db_session.commit()
@@ -139,9 +173,11 @@ class AuthService:
             )
             self.db_session.add(sa)
             await self.db_session.commit()
-        access_token = create_access_token(subject=user.id, payload={"login": user.login})
-        refresh_token = create_refresh_token(subject=user.id)
-        return {"access_token": access_token, "refresh_token": refresh_token}
+        access, refresh = token_factory.mint_pair(
+            subject=user.id,
+            access_payload=await self._access_payload(user.id, user.login),
+        )
+        return {"access_token": access.token, "refresh_token": refresh.token}
     
     async def update_profile(
         self,
@@ -171,12 +207,14 @@ class AuthService:
                     raise ValueError(f"Login '{login}' is already taken.")
             user.login = login
         if password:
-            user.password_hash = get_password_hash(password)
+            user.password_hash = await hash_password_async(password)
         if email:
             user.email = email
 
         await self.db_session.commit()
         await self.db_session.refresh(user)
+        if login:
+            await invalidate_principal(user_id)
         logger.info("Профиль пользователя успешно обновлен", user_id=user_id)
         return user
 
@@ -213,30 +251,23 @@ class AuthService:
             user_id = UUID(payload["sub"])
             jti = payload["jti"]
 
-            if await is_token_blacklisted(jti):
-                logger.warning("Попытка использовать refresh токен из черного списка", jti=jti)
-                raise ValueError("Refresh token is blacklisted")
+            new_access, new_refresh = token_factory.mint_pair(
+                subject=user_id,
+                access_payload=await self._access_payload(user_id, payload.get("login")),
+                session_id=payload.get("sid"),
+            )
 
-            if not await redis_client.sismember(f"user_active_refresh_jtis:{user_id}", jti):
+            ttl = max(int(payload["exp"] - time.time()), 1)
+            rotated = await _rotate_refresh_script(
+                keys=[f"user_active_refresh_jtis:{user_id}", f"blacklist:{jti}"],
+                args=[jti, new_refresh.jti, ttl, settings.refresh_token_expire_days * 24 * 3600],
+            )
+            if not rotated:
                 logger.warning("Неактивный refresh токен", user_id=user_id, jti=jti)
                 raise ValueError("Refresh token is not active")
 
-            new_access_token = create_access_token(subject=user_id, payload={"login": payload.get("login")})
-            new_refresh_token = create_refresh_token(subject=user_id)
-
-            token_expire_date = datetime.datetime.fromtimestamp(payload["exp"], tz=datetime.timezone.utc)
-            now = datetime.datetime.now(datetime.timezone.utc)
-            ttl = int((token_expire_date - now).total_seconds())
-            if ttl < 0: ttl = 1
-            await add_to_blacklist(jti, ttl)
-
-            await redis_client.srem(f"user_active_refresh_jtis:{user_id}", jti)
-            new_refresh_payload = await decode_jwt(new_refresh_token, refresh=True)
-            await redis_client.sadd(f"user_active_refresh_jtis:{user_id}", new_refresh_payload["jti"])
-            await redis_client.expire(f"user_active_refresh_jtis:{user_id}", settings.refresh_token_expire_days * 24 * 3600)
-
             logger.info("Токены успешно обновлены", user_id=user_id)
-            return {"access_token": new_access_token, "refresh_token": new_refresh_token}
+            return {"access_token": new_access.token, "refresh_token": new_refresh.token}
 
         except (ExpiredSignatureError, JWTError, ValueError) as e:
             logger.warning("Ошибка при обновлении токенов", error=str(e))
@@ -247,20 +278,101 @@ class AuthService:
     ):
         current_payload = await decode_jwt(current_refresh_token, refresh=True)
         current_jti = current_payload["jti"]
-
-        active_jtis = await redis_client.smembers(f"user_active_refresh_jtis:{user_id}")
-
-        for jti_to_blacklist in active_jtis:
-            if jti_to_blacklist != current_jti:
-                await add_to_blacklist(jti_to_blacklist, settings.refresh_token_expire_days * 24 * 3600)
-                logger.info("Токен добавлен в черный список (logout_all_other_sessions)", user_id=user_id, jti=jti_to_blacklist)
-
-        await redis_client.delete(f"user_active_refresh_jtis:{user_id}")
-        await redis_client.sadd(f"user_active_refresh_jtis:{user_id}", current_jti)
-        await redis_client.expire(f"user_active_refresh_jtis:{user_id}", settings.refresh_token_expire_days * 24 * 3600)
+        current_session_id = current_payload.get("sid")
+
+        # Вместо отзыва каждого jti пишется одна эпоха: все токены
+        # пользователя, выпущенные до нее, кроме текущей сессии, отклоняются
+        # в decode_jwt.
+        not_before = time.time()
+        ttl = settings.refresh_token_expire_days * 24 * 3600
+        epoch = SessionEpochs.encode(not_before, current_session_id)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(f"user_tokens_nbf:{user_id}", epoch, ex=ttl)
+            pipe.publish(EPOCH_CHANNEL, f"{user_id}:{time.time() + ttl}:{epoch}")
+            pipe.delete(f"user_active_refresh_jtis:{user_id}")
+            pipe.sadd(f"user_active_refresh_jtis:{user_id}", current_jti)
+            pipe.expire(f"user_active_refresh_jtis:{user_id}", ttl)
+            await pipe.execute()
+        session_epochs.add(str(user_id), not_before, current_session_id, time.time() + ttl)
 
         logger.info(
             "Все остальные сессии пользователя завершены",
             user_id=user_id,
             current_jti=current_jti,
+            not_before=not_before,
+        )
+
+    async def introspect_tokens(self, tokens: list[str]) -> list[dict]:
+        verified: dict[int, tuple[dict, UUID]] = {}
+        for index, token in enumerate(tokens):
+            try:
+                payload = verify_jwt(token)
+                verified[index] = (payload, UUID(payload["sub"]))
+            except (ExpiredSignatureError, JWTError, KeyError, TypeError, ValueError):
+                continue
+
+        # Отрицательный ответ локального фильтра точен, остальные jti и
+        # разрешения всех пользователей запрашиваются одним пайплайном.
+        jtis_to_check = sorted({
+            payload["jti"]
+            for payload, _ in verified.values()
+            if payload.get("jti") and revocation_filter.might_contain(payload["jti"]) is not False
+        })
+        user_ids = sorted({user_id for _, user_id in verified.values()}, key=str)
+
+        blacklisted: set[str] = set()
+        permissions: dict[UUID, list[str]] = {}
+        epochs: dict[UUID, tuple[float, str | None] | None] = {}
+        if verified:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                if jtis_to_check:
+                    pipe.mget([f"blacklist:{jti}" for jti in jtis_to_check])
+                if not session_epochs.ready:
+                    pipe.mget([f"user_tokens_nbf:{user_id}" for user_id in user_ids])
+                pipe.mget([f"permissions:{user_id}" for user_id in user_ids])
+                replies = await pipe.execute()
+            if jtis_to_check:
+                blacklisted = {jti for jti, value in zip(jtis_to_check, replies[0]) if value is not None}
+            if session_epochs.ready:
+                epochs = {user_id: session_epochs.get(str(user_id)) for user_id in user_ids}
+            else:
+                epochs = {
+                    user_id: SessionEpochs.decode(value) if value else None
+                    for user_id, value in zip(user_ids, replies[-2])
+                }
+            for user_id, value in zip(user_ids, replies[-1]):
+                if value and value.lstrip("-").isdigit():
+                    permissions[user_id] = await permission_registry.names(int(value), self.db_session)
+
+        missing = [user_id for user_id in user_ids if user_id not in permissions]
+        if missing:
+            principals = await resolve_principals(missing, self.db_session)
+            for user_id in missing:
+                principal = principals.get(user_id)
+                permissions[user_id] = (
+                    await permission_registry.names(principal["permission_mask"], self.db_session)
+                    if principal else list(DEFAULT_PERMISSIONS)
+                )
+
+        results = []
+        for index in range(len(tokens)):
+            if index not in verified or verified[index][0].get("jti") in blacklisted:
+                results.append({"active": False})
+                continue
+            payload, user_id = verified[index]
+            if is_revoked_by_epoch(payload, epochs.get(user_id)):
+                results.append({"active": False})
+                continue
+            results.append({
+                "active": True,
+                "sub": payload["sub"],
+                "exp": payload.get("exp"),
+                "permissions": permissions[user_id],
+            })
+
+        logger.info(
+            "Выполнена пакетная интроспекция токенов",
+            total=len(tokens),
+            active=sum(result["active"] for result in results),
         )
+        return results
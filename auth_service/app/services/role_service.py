@@ -6,11 +6,14 @@ from sqlalchemy import delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from app.core.permissions import permission_registry
+from app.core.principal import (INVALIDATION_BATCH_SIZE, invalidate_principal,
+                                invalidate_principals, resolve_principals)
 from app.models.role import Role
 from app.models.user import User
 from app.models.user_role import UserRole
+from app.schemas.permission import PermissionCheckRequest
 from app.schemas.role import RoleCreate, RoleUpdate
-from app.utils.cache import redis_client
 
 logger = structlog.get_logger(__name__)
 
@@ -30,6 +33,7 @@ class RoleService:
             )
             raise ValueError(f"Role with name '{role_data.name}' already exists.")
 
+        await permission_registry.register(role_data.permissions, self.db_session)
         role = Role(**role_data.model_dump())
         self.db_session.add(role)
         await self.db_session.commit()
@@ -72,21 +76,50 @@ class RoleService:
                     f"Role with name '{update_data['name']}' already exists."
                 )
 
+        if "permissions" in update_data:
+            await permission_registry.register(update_data["permissions"], self.db_session)
         for field, value in update_data.items():
             setattr(role, field, value)
 
         await self.db_session.commit()
         await self.db_session.refresh(role)
+        if "name" in update_data or "permissions" in update_data:
+            holders = await self.db_session.stream_scalars(
+                select(UserRole.user_id)
+                .where(UserRole.role_id == role_id)
+                .execution_options(yield_per=INVALIDATION_BATCH_SIZE)
+            )
+            invalidated = await invalidate_principals(holders)
+            logger.info("Сброшен кэш прав владельцев роли", role_id=role_id, users=invalidated)
         logger.info(
             "Роль успешно обновлена", role_id=role.id, updated_fields=update_data.keys()
         )
         return role
 
     async def delete_role(self, role_id: UUID) -> bool:
+        # Назначения удаляются явно пачками, чтобы получить владельцев роли
+        # (каскад в БД их бы не вернул) и не держать их в памяти целиком.
+        # Каждая пачка фиксируется до сброса кэша, иначе параллельная загрузка
+        # могла бы закэшировать еще не удаленную роль.
+        invalidated = 0
+        while True:
+            batch = select(UserRole.user_id).where(UserRole.role_id == role_id).limit(INVALIDATION_BATCH_SIZE)
+            holders = await self.db_session.execute(
+                delete(UserRole)
+                .where(UserRole.role_id == role_id, UserRole.user_id.in_(batch))
+                .returning(UserRole.user_id)
+            )
+            holder_ids = holders.scalars().all()
+            if not holder_ids:
+                break
+            await self.db_session.commit()
+            await invalidate_principal(*holder_ids)
+            invalidated += len(holder_ids)
+
         result = await self.db_session.execute(delete(Role).where(Role.id == role_id))
         await self.db_session.commit()
         if result.rowcount > 0:
-            logger.info("Роль успешно удалена", role_id=role_id)
+            logger.info("Роль успешно удалена", role_id=role_id, users=invalidated)
             return True
         else:
             logger.warning("Роль не найдена для удаления", role_id=role_id)
@@ -119,7 +152,7 @@ class RoleService:
         user_role = UserRole(user_id=user_id, role_id=role_id)
         self.db_session.add(user_role)
         await self.db_session.commit()
-        await redis_client.delete(f"permissions:{user_id}")
+        await invalidate_principal(user_id)
         logger.info(
             "Роль успешно назначена пользователю", user_id=user_id, role_id=role_id
         )
@@ -133,7 +166,7 @@ class RoleService:
         )
         await self.db_session.commit()
         if result.rowcount > 0:
-            await redis_client.delete(f"permissions:{user_id}")
+            await invalidate_principal(user_id)
             logger.info(
                 "Роль успешно отозвана у пользователя", user_id=user_id, role_id=role_id
             )
@@ -162,3 +195,33 @@ class RoleService:
             permissions=list(all_permissions),
         )
         return list(all_permissions)
+
+    async def check_permissions(self, checks: List[PermissionCheckRequest]) -> List[dict]:
+        user_ids = {}
+        for check in checks:
+            try:
+                user_ids[check.user_id] = UUID(check.user_id)
+            except ValueError:
+                continue
+        principals = await resolve_principals(user_ids.values(), self.db_session)
+
+        results = []
+        for check in checks:
+            principal = principals.get(user_ids.get(check.user_id))
+            has_access = principal is not None and await permission_registry.has(
+                principal["permission_mask"], check.required_permission, self.db_session
+            )
+            results.append({
+                "user_id": check.user_id,
+                "required_permission": check.required_permission,
+                "has_access": has_access,
+                "missing_permissions": [] if has_access else [check.required_permission],
+            })
+
+        logger.info(
+            "Выполнена пакетная проверка разрешений",
+            checks=len(checks),
+            users=len(user_ids),
+            granted=sum(result["has_access"] for result in results),
+        )
+        return results
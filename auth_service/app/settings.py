@@ -1,5 +1,5 @@
 import os
-from typing import List, Literal
+from typing import Dict, List, Literal
 
 from dotenv import load_dotenv
 from pydantic import AnyUrl, Field, SecretStr, field_validator
@@ -45,10 +45,81 @@ class Settings(BaseSettings):
     jwt_refresh_secret_key: SecretStr = Field(
         ..., description="Secret key for refresh tokens"
     )
-    jwt_algorithm: str = "HS256"
+    jwt_backend: Literal["jose", "pyjwt", "native"] = Field(
+        default="jose", description="Реализация кодирования и проверки JWT"
+    )
+    jwt_algorithm: str = Field(
+        default="HS256",
+        description="Алгоритм access токенов: HS256 или RS*/ES*/EdDSA (кроме jose) с ключом из файла",
+    )
+    jwt_refresh_algorithm: str = "HS256"
+    jwt_private_key_file: str | None = Field(
+        default=None, description="PEM закрытого ключа для RS*/ES* подписи access токенов"
+    )
+    jwt_retired_public_key_files: List[str] = Field(
+        default_factory=list,
+        description="PEM открытых ключей после ротации; держать до истечения их токенов",
+    )
+    jwks_cache_max_age_seconds: int = 3600
     access_token_expire_minutes: int = 15
     refresh_token_expire_days: int = 7
 
+    token_cache_enabled: bool = True
+    token_cache_max_size: int = Field(
+        default=10000, gt=0, description="Максимум проверенных токенов в памяти воркера"
+    )
+    permissions_cache_ttl_seconds: int = Field(
+        default=86400, gt=0, description="TTL данных пользователя и разрешений в Redis"
+    )
+    permissions_cache_ttl_jitter: float = Field(
+        default=0.1, ge=0, lt=1, description="Доля TTL, на которую случайно сокращается срок записи"
+    )
+    permissions_cache_xfetch_beta: float = Field(
+        default=1.0, ge=0, description="Агрессивность досрочного обновления записей (XFetch), 0 — выключено"
+    )
+    principal_load_lock_enabled: bool = Field(
+        default=False, description="Блокировка в Redis: загрузку прав пользователя из БД выполняет один воркер"
+    )
+    principal_load_lock_ttl_ms: int = Field(default=2000, gt=0)
+    principal_load_wait_timeout_seconds: float = Field(
+        default=1.0, gt=0, description="Сколько ждать чужой загрузки, прежде чем загрузить самому"
+    )
+    principal_local_cache_enabled: bool = True
+    principal_local_cache_max_size: int = Field(
+        default=10000, gt=0, description="Максимум пользователей в локальном кэше прав воркера"
+    )
+    principal_local_cache_ttl_seconds: float = Field(default=30.0, gt=0)
+    token_embed_permissions: bool = Field(
+        default=False,
+        description="Встраивать роли, разрешения и версию прав (pv) в access токен",
+    )
+
+    password_hash_scheme: Literal["bcrypt", "argon2"] = Field(
+        default="bcrypt", description="Схема новых хешей; хеши других схем обновляются при входе"
+    )
+    bcrypt_rounds: int = Field(default=12, ge=4, le=31)
+    argon2_memory_cost_kib: int = Field(default=65536, ge=8)
+    argon2_time_cost: int = Field(default=3, ge=1)
+    argon2_parallelism: int = Field(default=4, ge=1)
+
+    password_hash_workers: int | None = Field(
+        default=None, gt=0, description="Процессов для bcrypt; по умолчанию по числу ядер"
+    )
+    password_hash_max_queue: int = Field(
+        default=64, ge=0, description="Вызовов, ожидающих свободный процесс; 0 — без очереди"
+    )
+    password_hash_queue_timeout_seconds: float = Field(default=2.0, gt=0)
+
+    blacklist_filter_enabled: bool = True
+    blacklist_filter_bucket_seconds: int = Field(
+        default=3600, gt=0, description="Длина временной корзины фильтра отозванных jti"
+    )
+    blacklist_filter_bucket_capacity: int = Field(default=10000, gt=0)
+    blacklist_filter_error_rate: float = Field(default=0.001, gt=0, lt=1)
+    session_epochs_mirror_enabled: bool = Field(
+        default=True, description="Зеркало эпох отзыва сессий в памяти воркера; без него эпоха читается из Redis"
+    )
+
     redis_url: SecretStr = Field(
         default=SecretStr("redis://localhost:6379"),
         description="URL подключения к Redis",
@@ -72,6 +143,7 @@ class Settings(BaseSettings):
                 superuser=RateLimitConfig(capacity=500, leak_rate=50, ttl_seconds=86400),
             ),
             login=RoleBasedLimits(
+                algorithm="sliding_window",
                 default=RateLimitConfig(capacity=5, leak_rate=0.5, ttl_seconds=300),
                 guest=RateLimitConfig(capacity=3, leak_rate=0.3, ttl_seconds=300),
                 user=RateLimitConfig(capacity=10, leak_rate=1, ttl_seconds=600),
@@ -84,6 +156,35 @@ class Settings(BaseSettings):
         )
     )
 
+    rate_limit_routes: Dict[str, str | None] = Field(
+        default_factory=lambda: {
+            "/auth/login": "login",
+            "/auth/register": "register",
+            "/auth/": "default",
+            "/roles/": "default",
+        },
+        description="Тип трафика по пути относительно api_v1_str; путь с / на конце покрывает вложенные",
+    )
+    rate_limit_role_priority: List[str] = Field(
+        default=["superuser", "premium", "user", "guest"],
+        description="Порядок выбора лимита, если у пользователя несколько ролей с лимитами",
+    )
+    rate_limit_mode: Literal["redis", "hybrid"] = Field(
+        default="redis",
+        description=(
+            "hybrid — локальные корзины в воркере с пакетной синхронизацией в Redis; "
+            "запросы с алгоритмом sliding_window всегда проверяются в Redis"
+        ),
+    )
+    rate_limit_local_error_budget: float = Field(
+        default=0.1, ge=0, lt=1,
+        description="Доля емкости, которую воркер пропускает без обращения к Redis",
+    )
+    rate_limit_local_flush_interval_seconds: float = Field(default=0.1, gt=0)
+    rate_limit_local_max_buckets: int = Field(
+        default=100000, gt=0, description="Локальных корзин в воркере; сверх лимита вытесняются давно не использованные"
+    )
+
     oauth_providers: dict[str, OAuthProvider] = Field(
         default_factory=lambda: {
             "yandex": OAuthProvider(
@@ -114,6 +215,15 @@ class Settings(BaseSettings):
             )
         return v
 
+    @field_validator("jwt_algorithm", mode="after")
+    def check_jwt_algorithm(cls, v: str):
+        supported = {
+            "HS256", "HS384", "HS512", "RS256", "RS384", "RS512", "ES256", "ES384", "ES512", "EdDSA",
+        }
+        if v not in supported:
+            raise ValueError(f"jwt_algorithm должен быть одним из {sorted(supported)}")
+        return v
+
     @field_validator("redis_url", mode="after")
     def parse_redis_url(cls, v: SecretStr):
         url = v.get_secret_value()
@@ -0,0 +1,40 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        if capacity <= 0:
+            raise ValueError("capacity должен быть положительным")
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate должен быть в интервале (0, 1)")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    @staticmethod
+    def hashes(item: str) -> tuple[int, int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+    def add(self, item: str) -> None:
+        self.add_hashed(*self.hashes(item))
+
+    def add_hashed(self, h1: int, h2: int) -> None:
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % self.size
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return self.contains_hashed(*self.hashes(item))
+
+    def contains_hashed(self, h1: int, h2: int) -> bool:
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % self.size
+            if not self._bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
@@ -0,0 +1,133 @@
+import asyncio
+import re
+import time
+from typing import Any, Dict, List
+
+import httpx
+import structlog
+from jose.exceptions import JWTError
+
+from app.core.jwt_backends import get_backend
+
+logger = structlog.get_logger(__name__)
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+# Не зависит от настроек сервиса: подключается в других сервисах кинотеатра
+# для локальной проверки access токенов. В сеть ходит только при первом
+# обращении, по истечении кэша и при встрече неизвестного kid. Ключи строятся
+# выбранной реализацией JWT; для EdDSA нужна pyjwt или native.
+class JWKSVerifier:
+    def __init__(
+        self,
+        jwks_url: str,
+        algorithms: List[str],
+        cache_ttl_seconds: float = 3600,
+        min_refresh_interval_seconds: float = 30,
+        max_retry_interval_seconds: float = 300,
+        http_client: httpx.AsyncClient | None = None,
+        backend: str = "pyjwt",
+    ) -> None:
+        self.backend = get_backend(backend)
+        unsupported = set(algorithms) - self.backend.algorithms
+        if unsupported:
+            raise ValueError(
+                f"Реализация JWT {backend} не поддерживает алгоритмы {sorted(unsupported)}"
+            )
+        self.jwks_url = jwks_url
+        self.algorithms = algorithms
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.min_refresh_interval_seconds = min_refresh_interval_seconds
+        self.max_retry_interval_seconds = max_retry_interval_seconds
+        self._http_client = http_client
+        self._keys: Dict[str, Any] = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        # После неудачной загрузки следующая попытка не раньше _retry_at,
+        # интервал удваивается с каждой неудачей подряд
+        self._retry_at = 0.0
+        self._failures = 0
+        self._lock = asyncio.Lock()
+
+    async def _fetch(self) -> None:
+        client = self._http_client or httpx.AsyncClient(timeout=5.0)
+        try:
+            response = await client.get(self.jwks_url)
+            response.raise_for_status()
+        finally:
+            if self._http_client is None:
+                await client.aclose()
+
+        keys: Dict[str, Any] = {}
+        for key_data in response.json().get("keys", []):
+            kid = key_data.get("kid")
+            algorithm = key_data.get("alg")
+            if not kid or algorithm not in self.algorithms:
+                continue
+            keys[kid] = self.backend.key_from_jwk(key_data, algorithm)
+
+        ttl = self.cache_ttl_seconds
+        match = _MAX_AGE_RE.search(response.headers.get("Cache-Control", ""))
+        if match:
+            ttl = min(ttl, int(match.group(1)))
+
+        now = time.monotonic()
+        self._keys = keys
+        self._fetched_at = now
+        self._expires_at = now + ttl
+        self._retry_at = 0.0
+        self._failures = 0
+        logger.info("JWKS загружен", url=self.jwks_url, kids=list(keys))
+
+    def _record_failure(self, now: float) -> None:
+        delay = min(
+            self.max_retry_interval_seconds,
+            self.min_refresh_interval_seconds * 2 ** self._failures,
+        )
+        self._failures += 1
+        self._retry_at = now + delay
+
+    async def get_key(self, kid: str) -> Any:
+        now = time.monotonic()
+        key = self._keys.get(kid)
+        if key is not None and (now < self._expires_at or now < self._retry_at):
+            return key
+
+        async with self._lock:
+            key = self._keys.get(kid)
+            now = time.monotonic()
+            # Пока сервис авторизации недоступен, токены проверяются ранее
+            # загруженными ключами, а запросы не встают в очередь за
+            # повторными попытками загрузки.
+            retry_due = now >= self._retry_at
+            stale = now >= self._expires_at
+            can_refetch = now - self._fetched_at >= self.min_refresh_interval_seconds
+            if retry_due and (stale or (key is None and can_refetch)):
+                try:
+                    await self._fetch()
+                except httpx.HTTPError as e:
+                    self._record_failure(time.monotonic())
+                    logger.error(
+                        "Не удалось загрузить JWKS",
+                        url=self.jwks_url,
+                        error=str(e),
+                        retry_in=round(self._retry_at - time.monotonic(), 1),
+                    )
+                    if key is None:
+                        raise JWTError("JWKS is unavailable") from e
+                    return key
+                key = self._keys.get(kid)
+            elif key is None and not retry_due:
+                raise JWTError("JWKS is unavailable")
+
+        if key is None:
+            raise JWTError("Unknown signing key")
+        return key
+
+    async def verify(self, token: str, options: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        kid = self.backend.get_unverified_header(token).get("kid")
+        if not kid:
+            raise JWTError("Token has no key id")
+        key = await self.get_key(kid)
+        return self.backend.decode(token, key, self.algorithms, options=options or {})
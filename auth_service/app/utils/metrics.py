@@ -0,0 +1,24 @@
+from typing import Any, Callable, Dict
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+StatsProvider = Callable[[], Dict[str, Any]]
+
+_providers: Dict[str, StatsProvider] = {}
+
+
+def register_stats_provider(name: str, provider: StatsProvider) -> None:
+    _providers[name] = provider
+
+
+def collect_stats() -> Dict[str, Dict[str, Any]]:
+    stats: Dict[str, Dict[str, Any]] = {}
+    for name, provider in _providers.items():
+        try:
+            stats[name] = provider()
+        except Exception as e:
+            logger.error("Ошибка при сборе метрик", provider=name, error=str(e))
+            stats[name] = {"error": str(e)}
+    return stats
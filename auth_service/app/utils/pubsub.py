@@ -0,0 +1,89 @@
+import asyncio
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List
+
+import structlog
+from redis import asyncio as aioredis
+
+from app.utils.cache import redis_client
+
+logger = structlog.get_logger(__name__)
+
+MessageHandler = Callable[[str], None]
+ResyncCallback = Callable[[], Awaitable[None]]
+DisconnectCallback = Callable[[], None]
+
+
+class RedisBroadcaster:
+    def __init__(self, redis: aioredis.Redis, reconnect_delay: float = 1.0):
+        self.redis = redis
+        self.reconnect_delay = reconnect_delay
+        self.ready = False
+        self._handlers: Dict[str, List[MessageHandler]] = defaultdict(list)
+        self._resync_callbacks: List[ResyncCallback] = []
+        self._disconnect_callbacks: List[DisconnectCallback] = []
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, channel: str, handler: MessageHandler) -> None:
+        self._handlers[channel].append(handler)
+
+    def on_resync(self, callback: ResyncCallback) -> None:
+        self._resync_callbacks.append(callback)
+
+    def on_disconnect(self, callback: DisconnectCallback) -> None:
+        self._disconnect_callbacks.append(callback)
+
+    async def publish(self, channel: str, message: str) -> None:
+        await self.redis.publish(channel, message)
+
+    async def start(self) -> None:
+        if self._task is None and self._handlers:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._mark_disconnected()
+
+    def _mark_disconnected(self) -> None:
+        self.ready = False
+        for callback in self._disconnect_callbacks:
+            callback()
+
+    async def _run(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(*self._handlers.keys())
+                # Состояние синхронизируется уже после подписки: события,
+                # пришедшие во время синхронизации, не теряются.
+                for callback in self._resync_callbacks:
+                    await callback()
+                self.ready = True
+                logger.info("Подписка на события Redis активна", channels=list(self._handlers))
+
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    for handler in self._handlers.get(message["channel"], []):
+                        handler(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Потеряна подписка на события Redis", error=str(e))
+                self._mark_disconnected()
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                try:
+                    await pubsub.reset()
+                except Exception:
+                    pass
+
+
+broadcaster = RedisBroadcaster(redis_client)
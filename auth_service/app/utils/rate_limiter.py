@@ -1,93 +1,500 @@
+import asyncio
 import time
-from typing import List
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
 
 import structlog
 from redis import asyncio as aioredis
-from redis.commands.json.path import Path
 
-from app.schemas.ratelimiting import (RateLimitConfig, RateLimitConfigDict,
-                                      RoleBasedLimits)
-from app.settings import settings
+from app.schemas.ratelimiting import RateLimitConfig, RateLimitConfigDict
+from app.settings import Settings
+from app.utils.metrics import register_stats_provider
 
 logger = structlog.get_logger(__name__)
 
+MAX_RESOLVED_POLICIES = 10000
+
+# Алгоритмы, у которых уровень убывает линейно и может считаться в воркере
+LOCAL_ALGORITHMS = frozenset({"leaky_bucket", "token_bucket", "gcra"})
+
+# Алгоритмы хранят состояние в разных типах данных, поэтому у каждого свой
+# префикс: смена алгоритма не приводит к WRONGTYPE на старых ключах.
+RATE_LIMIT_KEY_PREFIXES: Dict[str, str] = {
+    "leaky_bucket": "rate_limit_bucket",
+    "token_bucket": "rate_limit_tokens",
+    "gcra": "rate_limit_gcra",
+    "sliding_window": "rate_limit_window",
+}
+
+# Все скрипты выполняются атомарно на стороне Redis за один вызов и принимают
+# одинаковые аргументы: capacity, leak_rate, ttl, cost, consumed. Время берется
+# из TIME сервера, чтобы расхождение часов между воркерами не влияло на
+# скорость утечки. consumed — уже пропущенные воркером запросы, они
+# учитываются без проверки; cost проверяется по емкости и при отказе не
+# записывается. Вызов с cost = 0 и consumed = 0 только читает состояние.
+# Возвращается решение, остаток, время до повтора и уровень заполнения в
+# единицах запросов (для синхронизации локальных корзин).
+_LEAKY_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local leak_rate = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local consumed = tonumber(ARGV[5])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'level', 'updated_at')
+local level = tonumber(state[1]) or 0
+local updated_at = tonumber(state[2]) or now
+level = math.max(0, level - math.max(0, now - updated_at) * leak_rate) + consumed
+
+local allowed = 1
+local retry_after = 0
+if cost > 0 and level + cost > capacity then
+    allowed = 0
+    retry_after = ttl
+    if leak_rate > 0 then
+        retry_after = (level + cost - capacity) / leak_rate
+    end
+else
+    level = level + cost
+end
+
+if consumed > 0 or (allowed == 1 and cost > 0) then
+    redis.call('HSET', KEYS[1], 'level', tostring(level), 'updated_at', string.format('%.6f', now))
+    redis.call('EXPIRE', KEYS[1], ttl)
+end
+return {allowed, math.max(0, math.floor(capacity - level)), tostring(retry_after), tostring(level)}
+"""
+
+# Корзина токенов: хранит число оставшихся токенов, пополняемых со скоростью
+# leak_rate до capacity.
+_TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local consumed = tonumber(ARGV[5])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate) - consumed
+
+local allowed = 1
+local retry_after = 0
+if cost > 0 and tokens < cost then
+    allowed = 0
+    retry_after = ttl
+    if rate > 0 then
+        retry_after = (cost - tokens) / rate
+    end
+else
+    tokens = tokens - cost
+end
+
+if consumed > 0 or (allowed == 1 and cost > 0) then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', string.format('%.6f', now))
+    redis.call('EXPIRE', KEYS[1], ttl)
+end
+return {allowed, math.max(0, math.floor(tokens)), tostring(retry_after), tostring(capacity - tokens)}
+"""
+
+# GCRA: хранится одно теоретическое время прибытия (TAT) в строковом ключе,
+# который живет, только пока TAT в будущем.
+_GCRA_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local consumed = tonumber(ARGV[5])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local interval = ttl
+if rate > 0 then
+    interval = 1 / rate
+end
+local burst = capacity * interval
+
+local tat = math.max(tonumber(redis.call('GET', KEYS[1])) or now, now) + consumed * interval
+local new_tat = tat + cost * interval
+
+local allowed = 1
+local retry_after = 0
+if cost > 0 and new_tat - now > burst then
+    allowed = 0
+    retry_after = new_tat - now - burst
+    new_tat = tat
+end
+
+if consumed > 0 or (allowed == 1 and cost > 0) then
+    redis.call('SET', KEYS[1], string.format('%.6f', new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+end
+local level = (new_tat - now) / interval
+return {allowed, math.max(0, math.floor(capacity - level)), tostring(retry_after), tostring(level)}
+"""
+
+# Скользящее окно по двум счетчикам: текущее окно целиком и предыдущее с
+# весом непрошедшей доли. Окно — время полного опустошения корзины
+# (capacity / leak_rate), средняя скорость та же, что у leaky_bucket.
+_SLIDING_WINDOW_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local consumed = tonumber(ARGV[5])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local window = ttl
+if rate > 0 then
+    window = capacity / rate
+end
+local index = math.floor(now / window)
+
+local state = redis.call('HMGET', KEYS[1], 'window', 'current', 'previous')
+local stored = tonumber(state[1])
+local current = tonumber(state[2]) or 0
+local previous = tonumber(state[3]) or 0
+if stored ~= index then
+    if stored == index - 1 then
+        previous = current
+    else
+        previous = 0
+    end
+    current = 0
+end
+current = current + consumed
+
+local elapsed = now - index * window
+local count = previous * (1 - elapsed / window) + current
+
+local allowed = 1
+local retry_after = 0
+if cost > 0 and count + cost > capacity then
+    allowed = 0
+    if current + cost <= capacity then
+        -- Достаточно, чтобы вес предыдущего окна уменьшился
+        retry_after = (count + cost - capacity) / previous * window
+    elseif current > 0 then
+        -- Текущее окно станет предыдущим и должно частично выйти из окна
+        retry_after = window - elapsed + math.min(1, (current + cost - capacity) / current) * window
+    else
+        retry_after = window - elapsed
+    end
+else
+    current = current + cost
+    count = count + cost
+end
+
+if consumed > 0 or (allowed == 1 and cost > 0) then
+    redis.call('HSET', KEYS[1], 'window', index, 'current', current, 'previous', previous)
+    redis.call('EXPIRE', KEYS[1], math.max(ttl, math.ceil(window * 2)))
+end
+return {allowed, math.max(0, math.floor(capacity - count)), tostring(retry_after), tostring(count)}
+"""
+
+_SCRIPTS: Dict[str, str] = {
+    "leaky_bucket": _LEAKY_BUCKET_LUA,
+    "token_bucket": _TOKEN_BUCKET_LUA,
+    "gcra": _GCRA_LUA,
+    "sliding_window": _SLIDING_WINDOW_LUA,
+}
+
+
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+class RateLimitPolicy(NamedTuple):
+    algorithm: str
+    config: RateLimitConfig
+    key_prefix: str
+
+
+class RateLimitPolicyTable:
+    # Конфигурация компилируется один раз: политики по (тип трафика, роль) и
+    # роли каждого типа трафика в порядке приоритета. Роли, не указанные в
+    # role_priority, идут после указанных в порядке конфигурации. Результат
+    # для набора ролей запоминается, повторный запрос — один поиск в словаре.
+    def __init__(self, config: RateLimitConfigDict, role_priority: Sequence[str]):
+        priority = {role: index for index, role in enumerate(role_priority)}
+        self._defaults: Dict[str, RateLimitPolicy] = {}
+        self._policies: Dict[Tuple[str, str], RateLimitPolicy] = {}
+        self._role_order: Dict[str, List[str]] = {}
+        self._resolved: Dict[Tuple[str, Tuple[str, ...]], RateLimitPolicy] = {}
+
+        for traffic_type, limits in config.traffic_types.items():
+            key_prefix = f"{RATE_LIMIT_KEY_PREFIXES[limits.algorithm]}:{traffic_type}"
+            self._defaults[traffic_type] = RateLimitPolicy(limits.algorithm, limits.default, key_prefix)
+            for role, role_config in limits.roles.items():
+                self._policies[(traffic_type, role)] = RateLimitPolicy(
+                    limits.algorithm, role_config, key_prefix
+                )
+            self._role_order[traffic_type] = sorted(
+                limits.roles, key=lambda role: priority.get(role, len(priority))
+            )
+
+    def resolve(self, traffic_type: str, roles: Tuple[str, ...]) -> RateLimitPolicy:
+        policy = self._resolved.get((traffic_type, roles))
+        if policy is None:
+            policy = self._resolve(traffic_type, roles)
+            if len(self._resolved) >= MAX_RESOLVED_POLICIES:
+                self._resolved.clear()
+            self._resolved[(traffic_type, roles)] = policy
+        return policy
+
+    def _resolve(self, traffic_type: str, roles: Tuple[str, ...]) -> RateLimitPolicy:
+        if traffic_type not in self._defaults:
+            # Тип трафика без своих лимитов ограничивается лимитами default,
+            # но в отдельной корзине
+            policy = self.resolve("default", roles)
+            return policy._replace(key_prefix=f"{RATE_LIMIT_KEY_PREFIXES[policy.algorithm]}:{traffic_type}")
+        for role in self._role_order[traffic_type]:
+            if role in roles:
+                return self._policies[(traffic_type, role)]
+        return self._defaults[traffic_type]
+
 
 class RedisLeakyBucketRateLimiter:
-    def __init__(self, redis_client: aioredis.Redis, settings: settings):
+    def __init__(self, redis_client: aioredis.Redis, settings: Settings):
         self.redis = redis_client
         self.settings = settings
-        self.rate_limit_config: RateLimitConfigDict = settings.rate_limit_config
+        self.policies = RateLimitPolicyTable(settings.rate_limit_config, settings.rate_limit_role_priority)
+        self._scripts = {
+            algorithm: redis_client.register_script(script) for algorithm, script in _SCRIPTS.items()
+        }
+
+    async def start(self) -> None:
+        # Скрипты загружаются при старте, дальше вызываются через EVALSHA
+        for script in _SCRIPTS.values():
+            await self.redis.script_load(script)
+
+    async def stop(self) -> None:
+        pass
+
+    def _script_args(self, config: RateLimitConfig, cost: int, consumed: int) -> List[float]:
+        return [config.capacity, config.leak_rate, config.ttl_seconds, cost, consumed]
+
+    async def _check_remote(
+            self, key: str, algorithm: str, config: RateLimitConfig, cost: int = 1, consumed: int = 0
+    ) -> Tuple[RateLimitDecision, float]:
+        allowed, remaining, retry_after, level = await self._scripts[algorithm](
+            keys=[key], args=self._script_args(config, cost, consumed)
+        )
+        return RateLimitDecision(bool(allowed), int(remaining), float(retry_after)), float(level)
 
-    async def _get_effective_config(self, user_roles: List[str], traffic_type: str) -> RateLimitConfig:
-        config_for_traffic_type: RoleBasedLimits = getattr(self.rate_limit_config, traffic_type,
-                                                           self.rate_limit_config.default)
+    def _log_decision(self, decision: RateLimitDecision, key: str, identifier: str, traffic_type: str,
+                      config: RateLimitConfig) -> RateLimitDecision:
+        if not decision.allowed:
+            logger.warning("Rate limit exceeded", key=key, identifier=identifier, traffic_type=traffic_type,
+                           capacity=config.capacity, retry_after=decision.retry_after)
+        else:
+            logger.debug("Request allowed", key=key, identifier=identifier, traffic_type=traffic_type,
+                         remaining=decision.remaining, capacity=config.capacity)
+        return decision
 
-        effective_config: RateLimitConfig = config_for_traffic_type.default
+    async def allow_request(self, identifier: str, user_roles: Tuple[str, ...],
+                            traffic_type: str = "default") -> RateLimitDecision:
+        algorithm, config, key_prefix = self.policies.resolve(traffic_type, user_roles)
+        key = f"{key_prefix}:{identifier}"
 
-        if "superuser" in user_roles and config_for_traffic_type.superuser:
-            effective_config = config_for_traffic_type.superuser
-        elif "premium" in user_roles and config_for_traffic_type.premium:
-            effective_config = config_for_traffic_type.premium
-        elif "user" in user_roles and config_for_traffic_type.user:
-            effective_config = config_for_traffic_type.user
-        elif "guest" in user_roles and config_for_traffic_type.guest:
-            effective_config = config_for_traffic_type.guest
+        decision, _ = await self._check_remote(key, algorithm, config)
+        return self._log_decision(decision, key, identifier, traffic_type, config)
 
-        return effective_config
 
+class _LocalBucket:
+    __slots__ = ("algorithm", "config", "level", "updated_at", "pending")
 
-async def allow_request(self, identifier: str, user_roles: List[str], traffic_type: str = "default") -> bool:
+    def __init__(self, algorithm: str, config: RateLimitConfig, level: float, now: float):
+        self.algorithm = algorithm
+        self.config = config
+        self.level = level
+        self.updated_at = now
+        # Пропущенные локально запросы, еще не отправленные в Redis
+        self.pending = 0
 
+    def leak(self, now: float) -> None:
+        self.level = max(0.0, self.level - (now - self.updated_at) * self.config.leak_rate)
+        self.updated_at = now
 
-    key = f"rate_limit:{traffic_type}:{identifier}"
+    def sync(self, server_level: float, now: float) -> None:
+        # Уровень в Redis учитывает запросы всех воркеров; поверх него
+        # остаются локальные запросы, пришедшие во время обращения к Redis.
+        self.level = server_level + self.pending
+        self.updated_at = now
 
-    config: RateLimitConfig = await self._get_effective_config(user_roles, traffic_type)
-    capacity = config.capacity
-    leak_rate = config.leak_rate
-    ttl_seconds = config.ttl_seconds
 
-    current_time = time.time()
+class HybridRateLimiter(RedisLeakyBucketRateLimiter):
+    # Воркер держит локальные копии корзин. Клиент, чья корзина заведомо
+    # переполнена, получает отказ без обращения к Redis. Запросы в пределах
+    # бюджета ошибки (доля емкости) пропускаются локально и отправляются в Redis
+    # пачкой раз в flush_interval. Когда бюджет исчерпан, запрос проверяется
+    # в Redis вместе с накопленными локальными запросами. Суммарное превышение
+    # лимита не больше бюджета на каждый воркер. Локально уровень убывает
+    # линейно, как в протекающей корзине, корзине токенов и GCRA; скользящее
+    # окно так не моделируется, поэтому его запросы всегда проверяет Redis.
+    # При переполнении вытесняется давно не использованная корзина, ее
+    # неотправленные запросы уходят в Redis со следующей синхронизацией.
+    def __init__(self, redis_client: aioredis.Redis, settings: Settings):
+        super().__init__(redis_client, settings)
+        self.error_budget = settings.rate_limit_local_error_budget
+        self.flush_interval = settings.rate_limit_local_flush_interval_seconds
+        self.max_buckets = settings.rate_limit_local_max_buckets
+        self._buckets: "OrderedDict[str, _LocalBucket]" = OrderedDict()
+        self._evicted: List[Tuple[str, _LocalBucket]] = []
+        self._task: asyncio.Task | None = None
+        self.local_allowed = 0
+        self.local_rejected = 0
+        self.remote_checks = 0
+        self.evictions = 0
+        self.flushes = 0
+        self.flush_errors = 0
 
-    bucket_state = await self.redis.json().get(key, Path.root())
+    async def start(self) -> None:
+        await super().start()
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
 
-    if bucket_state is None:
-        current_level = 1.0
-        last_refill_time = current_time
-        logger.debug("Rate limit bucket initialized", key=key, identifier=identifier, traffic_type=traffic_type,
-                     capacity=capacity, leak_rate=leak_rate)
-    else:
-        last_refill_time = bucket_state.get("last_refill", current_time)
-        previous_level = bucket_state.get("level", 0.0)
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._flush_logged()
 
-        time_passed = current_time - last_refill_time
-        leaked_amount = time_passed * leak_rate
+    async def allow_request(self, identifier: str, user_roles: Tuple[str, ...],
+                            traffic_type: str = "default") -> RateLimitDecision:
+        algorithm, config, key_prefix = self.policies.resolve(traffic_type, user_roles)
+        key = f"{key_prefix}:{identifier}"
+        if algorithm not in LOCAL_ALGORITHMS:
+            self.remote_checks += 1
+            decision, _ = await self._check_remote(key, algorithm, config)
+            return self._log_decision(decision, key, identifier, traffic_type, config)
+        now = time.monotonic()
 
-        current_level = max(0.0, previous_level - leaked_amount)
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets.move_to_end(key)
+            bucket.config = config
+            bucket.leak(now)
+            if bucket.level + 1 > config.capacity:
+                self.local_rejected += 1
+                retry_after = (
+                    (bucket.level + 1 - config.capacity) / config.leak_rate
+                    if config.leak_rate > 0 else config.ttl_seconds
+                )
+                return self._log_decision(
+                    RateLimitDecision(False, 0, retry_after), key, identifier, traffic_type, config
+                )
+            if bucket.pending + 1 <= int(config.capacity * self.error_budget):
+                self.local_allowed += 1
+                bucket.level += 1
+                bucket.pending += 1
+                return self._log_decision(
+                    RateLimitDecision(True, int(config.capacity - bucket.level), 0.0),
+                    key, identifier, traffic_type, config
+                )
 
-        current_level += 1.0
-        last_refill_time = current_time
+        # Первый запрос клиента в воркере или исчерпанный бюджет
+        self.remote_checks += 1
+        consumed = 0
+        if bucket is not None:
+            consumed, bucket.pending = bucket.pending, 0
+        try:
+            decision, level = await self._check_remote(key, algorithm, config, consumed=consumed)
+        except Exception:
+            if bucket is not None:
+                bucket.pending += consumed
+            raise
 
-        logger.debug("Rate limit bucket updated", key=key, identifier=identifier, traffic_type=traffic_type,
-                     previous_level=previous_level, leaked_amount=leaked_amount,
-                     current_level_after_leak=current_level - 1.0, new_level=current_level)
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.sync(level, now)
+        else:
+            self._buckets[key] = _LocalBucket(algorithm, config, level, now)
+            while len(self._buckets) > self.max_buckets:
+                evicted = self._buckets.popitem(last=False)
+                self.evictions += 1
+                if evicted[1].pending:
+                    self._evicted.append(evicted)
+        return self._log_decision(decision, key, identifier, traffic_type, config)
 
+    async def flush(self) -> None:
+        now = time.monotonic()
+        evicted, self._evicted = self._evicted, []
+        batch = []
+        for key, bucket in evicted + list(self._buckets.items()):
+            if bucket.pending:
+                batch.append((key, bucket, bucket.pending))
+                bucket.pending = 0
+                continue
+            bucket.leak(now)
+            if bucket.level == 0:
+                # Опустевшая корзина не отличается от отсутствующей
+                del self._buckets[key]
+        if not batch:
+            return
 
-    if current_level > capacity:
-        logger.warning("Rate limit exceeded", key=key, identifier=identifier, traffic_type=traffic_type,
-                       current_level=current_level, capacity=capacity)
-        return False
+        pipe = self.redis.pipeline(transaction=False)
+        for key, bucket, consumed in batch:
+            await self._scripts[bucket.algorithm](
+                keys=[key], args=self._script_args(bucket.config, 0, consumed), client=pipe
+            )
+        try:
+            results = await pipe.execute()
+        except Exception:
+            for key, bucket, consumed in batch:
+                bucket.pending += consumed
+            self._evicted = evicted + self._evicted
+            raise
 
-    await self.redis.json().set(key, Path.root(), {"level": current_level, "last_refill": last_refill_time})
-    await self.redis.expire(key, ttl_seconds)
+        now = time.monotonic()
+        for (key, bucket, consumed), result in zip(batch, results):
+            bucket.sync(float(result[3]), now)
+        self.flushes += 1
 
-    logger.debug("Request allowed", key=key, identifier=identifier, traffic_type=traffic_type, current_level=current_level,
-                 capacity=capacity)
-    return True
+    async def _flush_logged(self) -> None:
+        try:
+            await self.flush()
+        except Exception as e:
+            self.flush_errors += 1
+            logger.error("Не удалось синхронизировать локальные лимиты с Redis", error=str(e))
 
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush_logged()
 
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buckets": len(self._buckets),
+            "local_allowed": self.local_allowed,
+            "local_rejected": self.local_rejected,
+            "remote_checks": self.remote_checks,
+            "evictions": self.evictions,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+        }
 
-async def get_rate_limiter(
-        redis_client: aioredis.Redis,
-        settings: settings) -> RedisLeakyBucketRateLimiter:
 
-    return RedisLeakyBucketRateLimiter(redis_client, settings)
\ No newline at end of file
+def create_rate_limiter(redis_client: aioredis.Redis, settings: Settings) -> RedisLeakyBucketRateLimiter:
+    if settings.rate_limit_mode == "hybrid":
+        rate_limiter = HybridRateLimiter(redis_client, settings)
+        register_stats_provider("rate_limiter", rate_limiter.stats)
+        return rate_limiter
+    return RedisLeakyBucketRateLimiter(redis_client, settings)
@@ -0,0 +1,86 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+from uuid import uuid4
+
+from redis import asyncio as aioredis
+
+T = TypeVar("T")
+
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    # Объединение одновременных загрузок одного ключа внутри воркера: первый
+    # вызов выполняет загрузку, остальные ждут его результата не дольше
+    # timeout и после этого загружают сами.
+    def __init__(self, timeout: float | None = None):
+        self.timeout = timeout
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+            except asyncio.CancelledError:
+                # Отмена ведущего вызова не должна отменять ожидающих
+                task = asyncio.current_task()
+                if not future.cancelled() or (task is not None and task.cancelling()):
+                    raise
+            return await fn()
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.leaders += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение получает сам ведущий; без ожидающих оно не логируется
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "timeouts": self.timeouts,
+        }
+
+
+class RedisLock:
+    # Короткая блокировка между воркерами: SET NX PX, снятие только своим
+    # токеном. По истечении ttl блокировка снимается сама.
+    def __init__(self, redis: aioredis.Redis, ttl_ms: int):
+        self.redis = redis
+        self.ttl_ms = ttl_ms
+        self._release = redis.register_script(_RELEASE_LOCK_LUA)
+
+    async def acquire(self, key: str) -> str | None:
+        token = uuid4().hex
+        if await self.redis.set(key, token, nx=True, px=self.ttl_ms):
+            return token
+        return None
+
+    async def release(self, key: str, token: str) -> None:
+        await self._release(keys=[key], args=[token])
@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Tuple
+
+
+class TTLCache:
+    def __init__(self, max_size: int, default_ttl: float | None = None):
+        if max_size <= 0:
+            raise ValueError("max_size должен быть положительным")
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, expires_at: float | None = None) -> None:
+        if expires_at is None:
+            if self.default_ttl is None:
+                raise ValueError("Не задано время жизни записи")
+            expires_at = time.time() + self.default_ttl
+        if expires_at <= time.time():
+            return
+
+        if key in self._data:
+            self._data.move_to_end(key)
+        self._data[key] = (value, expires_at)
+
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Any | None:
+        entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,109 @@
+"""Сравнение реализаций JWT на токенах, которые выпускает сервис.
+
+Токены выпускаются через TokenFactory.mint_pair с claims принципала, как
+при входе: iat, sid и встроенные роли и маска разрешений. Проверка идет
+тем же ключом, что и в decode_jwt.
+
+Запуск из каталога auth_service:
+
+    python -m benchmarks.jwt_backends --iterations 20000 --algorithm HS256
+"""
+import argparse
+import logging
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+import structlog
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from app.core.jwt_backends import JWTBackend, get_backend
+from app.core.keys import KeyRing, is_asymmetric
+from app.core.tokens import TokenFactory
+
+BACKENDS = ["jose", "pyjwt", "native"]
+SECRET = "benchmark-secret-key-benchmark-secret-key"
+
+
+def _private_key_pem(algorithm: str) -> str | None:
+    if not is_asymmetric(algorithm):
+        return None
+
+    if algorithm.startswith("RS"):
+        private_key: Any = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif algorithm.startswith("ES"):
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        private_key = ed25519.Ed25519PrivateKey.generate()
+
+    return private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+
+
+def _principal_claims() -> Dict[str, Any]:
+    # То же, что principal_claims кладет в access токен
+    return {
+        "login": "benchmark_user",
+        "su": False,
+        "roles": ["user", "subscriber"],
+        "perms": 0b1011,
+        "pv": str(time.time_ns()),
+    }
+
+
+def _rate(fn: Callable[[], Any], iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return iterations / (time.perf_counter() - started)
+
+
+def run(
+    backend: JWTBackend, algorithm: str, iterations: int, private_key_pem: str | None
+) -> Dict[str, float]:
+    keys = KeyRing(backend, algorithm, SECRET, "HS256", SECRET, private_key_pem)
+    factory = TokenFactory(keys)
+    subject = str(uuid.uuid4())
+    claims = _principal_claims()
+    access, _ = factory.mint_pair(subject, access_payload=claims)
+    key = keys.get_verification_key(keys.signing_kid) if keys.signing_kid else keys.signing_key
+
+    return {
+        "mint_pair": _rate(lambda: factory.mint_pair(subject, access_payload=claims), iterations),
+        "decode": _rate(
+            lambda: backend.decode(
+                access.token, key, [algorithm], options={"verify_signature": False}
+            ),
+            iterations,
+        ),
+        "decode+verify": _rate(
+            lambda: backend.decode(access.token, key, [algorithm]), iterations
+        ),
+    }
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="JWT backends throughput, tokens/sec")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--algorithm", default="HS256")
+    args = parser.parse_args(argv)
+    # Отладочный лог выпуска токенов иначе занимает большую часть замера
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+
+    # Один ключ на все реализации, чтобы сравнивать одинаковые токены
+    private_key_pem = _private_key_pem(args.algorithm)
+    print(f"{'backend':<8} {'operation':<14} {'tokens/sec':>12}")
+    for name in BACKENDS:
+        backend = get_backend(name)
+        if args.algorithm not in backend.algorithms:
+            print(f"{name:<8} {args.algorithm} не поддерживается")
+            continue
+        results = run(backend, args.algorithm, args.iterations, private_key_pem)
+        for operation, rate in results.items():
+            print(f"{name:<8} {operation:<14} {rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Сравнение алгоритмов ограничения запросов: пропускная способность, команды
+Redis на запрос и память на ключ.
+
+Запуск из каталога auth_service (нужен Redis из redis_url):
+
+    python -m benchmarks.rate_limit_algorithms --identifiers 1000 --requests 20
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from typing import Any, Dict, List, get_args
+
+from redis import asyncio as aioredis
+
+from app.schemas.ratelimiting import RateLimitAlgorithm, RateLimitConfigDict
+from app.settings import settings
+from app.utils.rate_limiter import (RATE_LIMIT_KEY_PREFIXES,
+                                    RedisLeakyBucketRateLimiter)
+
+ALGORITHMS: List[RateLimitAlgorithm] = list(get_args(RateLimitAlgorithm))
+MEMORY_SAMPLE = 100
+
+
+async def _command_calls(redis: aioredis.Redis) -> Dict[str, int]:
+    stats = await redis.info("commandstats")
+    return {name: value["calls"] for name, value in stats.items()}
+
+
+async def run(
+    redis: aioredis.Redis, algorithm: RateLimitAlgorithm, args: argparse.Namespace
+) -> Dict[str, Any]:
+    config = RateLimitConfigDict.model_validate({
+        "default": {
+            "algorithm": algorithm,
+            "default": {
+                "capacity": args.capacity,
+                "leak_rate": args.leak_rate,
+                "ttl_seconds": args.ttl_seconds,
+            },
+        },
+    })
+    rate_limiter = RedisLeakyBucketRateLimiter(
+        redis, settings.model_copy(update={"rate_limit_config": config})
+    )
+    await rate_limiter.start()
+
+    run_id = uuid.uuid4().hex[:8]
+    identifiers = [f"benchmark-{run_id}-{i}" for i in range(args.identifiers)]
+    total = args.identifiers * args.requests
+
+    before = await _command_calls(redis)
+    started = time.perf_counter()
+    allowed = 0
+    for _ in range(args.requests):
+        decisions = await asyncio.gather(
+            *(rate_limiter.allow_request(identifier, ("guest",)) for identifier in identifiers)
+        )
+        allowed += sum(decision.allowed for decision in decisions)
+    elapsed = time.perf_counter() - started
+    after = await _command_calls(redis)
+
+    # Команды внутри скриптов учитываются отдельно от самого EVALSHA
+    round_trips = after.get("cmdstat_evalsha", 0) - before.get("cmdstat_evalsha", 0)
+    script_commands = sum(
+        calls - before.get(name, 0)
+        for name, calls in after.items()
+        if name not in ("cmdstat_evalsha", "cmdstat_info")
+    )
+
+    prefix = f"{RATE_LIMIT_KEY_PREFIXES[algorithm]}:default:benchmark-{run_id}-"
+    keys = [key async for key in redis.scan_iter(match=f"{prefix}*", count=1000)]
+    memory = [await redis.memory_usage(key) or 0 for key in keys[:MEMORY_SAMPLE]]
+    if keys:
+        await redis.delete(*keys)
+
+    return {
+        "requests/sec": total / elapsed,
+        "allowed %": 100 * allowed / total,
+        "round trips/req": round_trips / total,
+        "commands/req": script_commands / total,
+        "bytes/key": sum(memory) / len(memory) if memory else 0,
+    }
+
+
+async def _main(args: argparse.Namespace) -> None:
+    redis = aioredis.from_url(args.redis_url, decode_responses=True)
+    try:
+        print(f"{'algorithm':<16} " + " ".join(f"{column:>16}" for column in (
+            "requests/sec", "allowed %", "round trips/req", "commands/req", "bytes/key"
+        )))
+        for algorithm in args.algorithms:
+            result = await run(redis, algorithm, args)
+            print(f"{algorithm:<16} " + " ".join(f"{value:>16.2f}" for value in result.values()))
+    finally:
+        await redis.close()
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Rate limiting algorithms: Redis cost per request and key")
+    parser.add_argument("--redis-url", default=settings.redis_url.get_secret_value())
+    parser.add_argument("--algorithms", nargs="+", choices=ALGORITHMS, default=ALGORITHMS)
+    parser.add_argument("--identifiers", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20, help="Запросов на идентификатор")
+    parser.add_argument("--capacity", type=int, default=10)
+    parser.add_argument("--leak-rate", type=float, default=1.0)
+    parser.add_argument("--ttl-seconds", type=int, default=60)
+    asyncio.run(_main(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
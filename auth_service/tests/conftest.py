@@ -0,0 +1,19 @@
+import pytest_asyncio
+from fakeredis import FakeAsyncRedis
+
+from app.core import principal, revocation, security
+from app.services import auth_service
+from app.utils import cache
+
+# Модули, которые импортируют клиент Redis напрямую
+REDIS_MODULES = (cache, principal, revocation, security, auth_service)
+
+
+@pytest_asyncio.fixture
+async def redis(monkeypatch):
+    # Redis в памяти с поддержкой Lua: скрипты выполняются так же, как на сервере
+    client = FakeAsyncRedis(decode_responses=True)
+    for module in REDIS_MODULES:
+        monkeypatch.setattr(module, "redis_client", client)
+    yield client
+    await client.aclose()
@@ -0,0 +1,29 @@
+from click.testing import CliRunner
+
+from app import cli
+
+
+def test_calibrate_recommends_highest_cost_within_target(monkeypatch):
+    """Тест подбора параметров хеширования по целевому времени"""
+    def verify_ms(scheme, samples, **params):
+        if scheme == "bcrypt":
+            return 2 ** (params["bcrypt_rounds"] - 8) * 30
+        return params["argon2_memory_cost"] / 1024 * params["argon2_time_cost"]
+
+    monkeypatch.setattr(cli, "_verify_ms", verify_ms)
+
+    result = CliRunner().invoke(cli.cli, ["calibrate-password-hashing", "--target-ms", "250", "--argon2-parallelism", "2"])
+
+    assert result.exit_code == 0, result.output
+    assert "PASSWORD_HASH_SCHEME=bcrypt BCRYPT_ROUNDS=11" in result.output
+    assert "ARGON2_MEMORY_COST_KIB=131072 ARGON2_TIME_COST=1 ARGON2_PARALLELISM=2" in result.output
+
+
+def test_calibrate_reports_unreachable_target(monkeypatch):
+    """Тест: цель недостижима даже с минимальной стоимостью"""
+    monkeypatch.setattr(cli, "_verify_ms", lambda scheme, samples, **params: 1000.0)
+
+    result = CliRunner().invoke(cli.cli, ["calibrate-password-hashing", "--scheme", "bcrypt"])
+
+    assert result.exit_code == 0, result.output
+    assert "даже минимальная стоимость превышает целевое время" in result.output
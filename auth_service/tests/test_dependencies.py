@@ -0,0 +1,81 @@
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.core import dependencies
+from app.core.dependencies import (get_current_principal,
+                                   get_optional_principal, require_permission)
+from app.core.principal import Principal
+from app.core.tokens import token_factory
+
+ALICE = {"login": "alice", "is_superuser": False, "roles": ["user"], "permission_mask": 0b1}
+
+
+def _request(token: str | None = None) -> Request:
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_principal_from_token_prefers_token_fields():
+    """Тест: логин, MFA и сессия берутся из токена, права — из кэша"""
+    principal = Principal.from_token(
+        "user-1", ALICE, {"login": "alice-token", "mfa_verified": True, "sid": "sid-1"}
+    )
+
+    assert principal.login == "alice-token"
+    assert principal.roles == ("user",)
+    assert principal.permission_mask == 0b1
+    assert principal.mfa_verified and principal.session_id == "sid-1"
+    assert Principal.from_token("user-1", ALICE, {}).login == "alice"
+
+
+@pytest.mark.asyncio
+async def test_principal_is_authenticated_once_per_request(redis, monkeypatch):
+    """Тест: токен проверяется один раз, результат хранится в request.state"""
+    calls = []
+
+    async def principal_for_token(user_id, payload, db):
+        calls.append(user_id)
+        return ALICE
+
+    monkeypatch.setattr(dependencies, "principal_for_token", principal_for_token)
+    user_id = uuid.uuid4()
+    request = _request(token_factory.mint_access(user_id).token)
+
+    principal = await get_optional_principal(request, db=None)
+    assert await get_optional_principal(request, db=None) is principal
+    assert await get_current_principal(request, principal) is principal
+    assert principal.id == str(user_id)
+    assert calls == [user_id]
+
+
+@pytest.mark.asyncio
+async def test_missing_token_error_is_raised_by_required_dependency():
+    """Тест: без токена необязательная зависимость дает None, обязательная — 401"""
+    request = _request()
+
+    principal = await get_optional_principal(request, db=None)
+    assert principal is None
+
+    with pytest.raises(HTTPException) as error:
+        await get_current_principal(request, principal)
+    assert error.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_require_permission(monkeypatch):
+    """Тест проверки разрешения по маске и для суперпользователя"""
+    async def has(mask, name, db):
+        return name == "view_content" and bool(mask & 1)
+
+    monkeypatch.setattr(dependencies.permission_registry, "has", has)
+    user = Principal.from_token("user-1", ALICE, {})
+    admin = Principal.from_token("admin", {**ALICE, "is_superuser": True, "permission_mask": 0}, {})
+
+    assert await require_permission("view_content")(user, db=None) is user
+    assert await require_permission("roles:create")(admin, db=None) is admin
+    with pytest.raises(HTTPException) as error:
+        await require_permission("roles:create")(user, db=None)
+    assert error.value.status_code == 403
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core.hashing import (PasswordHasherPool, PasswordHashingUnavailable,
+                              build_crypt_context)
+
+
+def _thread_pool(pool: PasswordHasherPool) -> ThreadPoolExecutor:
+    # Потоки вместо процессов: тестируется учет очереди, а не сам хеш
+    executor = ThreadPoolExecutor(max_workers=pool.max_workers)
+    pool._get_executor = lambda: executor
+    return executor
+
+
+@pytest.mark.asyncio
+async def test_pool_without_queue_runs_when_idle():
+    """Тест: при max_queue = 0 свободный пул выполняет вызов"""
+    pool = PasswordHasherPool(max_workers=1, max_queue=0, queue_timeout=1)
+    _thread_pool(pool)
+
+    assert await pool.run(len, "abc") == 3
+    assert pool.stats()["rejected"] == 0
+
+
+@pytest.mark.asyncio
+async def test_pool_rejects_when_queue_is_full():
+    """Тест отказа, когда заняты все процессы и очередь заполнена"""
+    pool = PasswordHasherPool(max_workers=1, max_queue=0, queue_timeout=1)
+    _thread_pool(pool)
+    release = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    def blocking() -> None:
+        asyncio.run_coroutine_threadsafe(release.wait(), loop).result()
+
+    busy = asyncio.create_task(pool.run(blocking))
+    await asyncio.sleep(0.05)
+    with pytest.raises(PasswordHashingUnavailable):
+        await pool.run(len, "abc")
+    release.set()
+    await busy
+    assert pool.stats()["rejected"] == 1
+
+
+def test_crypt_context_marks_other_schemes_deprecated():
+    """Тест: хеш старой схемы проверяется и требует перехеширования"""
+    old = build_crypt_context("bcrypt", 4, 1024, 1, 1)
+    new = build_crypt_context("argon2", 4, 1024, 1, 1)
+    legacy_hash = old.hash("secret")
+
+    valid, new_hash = new.verify_and_update("secret", legacy_hash)
+
+    assert valid
+    assert new_hash is not None and new_hash.startswith("$argon2id$")
+
+
+def test_crypt_context_rehashes_weaker_bcrypt_rounds():
+    """Тест: хеш с меньшей стоимостью перехешируется, с текущей — нет"""
+    weak = build_crypt_context("bcrypt", 4, 1024, 1, 1)
+    current = build_crypt_context("bcrypt", 5, 1024, 1, 1)
+
+    valid, new_hash = current.verify_and_update("secret", weak.hash("secret"))
+    assert valid and new_hash is not None and "$05$" in new_hash
+    assert current.verify_and_update("secret", new_hash) == (True, None)
+    assert current.verify_and_update("wrong", new_hash) == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_keeps_slot_until_hash_finishes():
+    """Тест: отмена ожидающего не освобождает процесс, пока хеширование не закончено"""
+    pool = PasswordHasherPool(max_workers=1, max_queue=0, queue_timeout=1)
+    _thread_pool(pool)
+    started, release = threading.Event(), threading.Event()
+
+    def blocking() -> None:
+        started.set()
+        release.wait(5)
+
+    caller = asyncio.create_task(pool.run(blocking))
+    await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+
+    assert pool.stats()["in_flight"] == 1
+    with pytest.raises(PasswordHashingUnavailable):
+        await pool.run(len, "abc")
+
+    release.set()
+    for _ in range(100):
+        if pool.stats()["in_flight"] == 0:
+            break
+        await asyncio.sleep(0.01)
+    assert await pool.run(len, "abc") == 3
@@ -0,0 +1,86 @@
+import pytest
+
+from app.schemas.ratelimiting import (RateLimitConfig, RateLimitConfigDict,
+                                      RoleBasedLimits)
+from app.settings import settings
+from app.utils.rate_limiter import HybridRateLimiter
+
+
+def _limiter(redis, algorithm="leaky_bucket", capacity=10, **overrides):
+    config = RateLimitConfigDict(
+        default=RoleBasedLimits(
+            algorithm=algorithm,
+            default=RateLimitConfig(capacity=capacity, leak_rate=0.001, ttl_seconds=60),
+        )
+    )
+    return HybridRateLimiter(redis, settings.model_copy(update={
+        "rate_limit_config": config,
+        "rate_limit_local_error_budget": 0.2,
+        **overrides,
+    }))
+
+
+async def _allowed(limiter, identifier, count):
+    return [(await limiter.allow_request(identifier, ("guest",))).allowed for _ in range(count)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("algorithm", ["leaky_bucket", "token_bucket", "gcra"])
+async def test_hybrid_admits_within_budget_and_rejects_locally(redis, algorithm):
+    """Тест: бюджет ошибки пропускается локально, переполненная корзина отклоняется без Redis"""
+    limiter = _limiter(redis, algorithm)
+
+    assert await _allowed(limiter, "client", 10) == [True] * 10
+    assert limiter.local_allowed > 0
+    assert limiter.remote_checks < 10
+
+    decisions = await _allowed(limiter, "client", 5)
+    assert decisions == [False] * 5
+    assert limiter.local_rejected > 0
+
+
+@pytest.mark.asyncio
+async def test_hybrid_flush_sends_pending_requests(redis):
+    """Тест: локально пропущенные запросы отправляются в Redis при синхронизации"""
+    limiter = _limiter(redis)
+    await _allowed(limiter, "client", 3)
+    bucket = next(iter(limiter._buckets.values()))
+    assert bucket.pending == 2
+
+    await limiter.flush()
+
+    assert bucket.pending == 0
+    assert limiter.flushes == 1
+    level = float(await redis.hget("rate_limit_bucket:default:client", "level"))
+    assert level == pytest.approx(3, abs=0.01)
+
+
+@pytest.mark.asyncio
+async def test_hybrid_sliding_window_is_always_checked_in_redis(redis):
+    """Тест: скользящее окно не моделируется локально"""
+    limiter = _limiter(redis, "sliding_window", capacity=3)
+
+    assert await _allowed(limiter, "client", 5) == [True, True, True, False, False]
+    assert limiter.remote_checks == 5
+    assert limiter.local_allowed == limiter.local_rejected == 0
+    assert not limiter._buckets
+
+
+@pytest.mark.asyncio
+async def test_hybrid_evicts_least_recently_used_bucket(redis):
+    """Тест: при переполнении вытесняется давно не использованная корзина без потери запросов"""
+    limiter = _limiter(redis, rate_limit_local_max_buckets=2)
+    await _allowed(limiter, "first", 2)
+    await _allowed(limiter, "second", 1)
+    await _allowed(limiter, "first", 1)
+    await _allowed(limiter, "third", 1)
+
+    assert list(limiter._buckets) == ["rate_limit_bucket:default:first", "rate_limit_bucket:default:third"]
+    assert limiter.stats()["evictions"] == 1
+
+    await _allowed(limiter, "second", 1)
+    assert "rate_limit_bucket:default:second" in limiter._buckets
+
+    await limiter.flush()
+    level = float(await redis.hget("rate_limit_bucket:default:first", "level"))
+    assert level == pytest.approx(3, abs=0.01)
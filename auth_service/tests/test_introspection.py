@@ -0,0 +1,35 @@
+import uuid
+
+import pytest
+
+from app.core import principal as principal_module
+from app.core.tokens import token_factory
+from app.services.auth_service import AuthService
+
+
+@pytest.mark.asyncio
+async def test_introspection_resolves_missing_permissions_in_one_batch(redis, monkeypatch):
+    """Тест: пользователи без ключа permissions: загружаются одним пакетом"""
+    cached, uncached = uuid.uuid4(), uuid.uuid4()
+    await redis.set(f"permissions:{cached}", "0")
+    calls = []
+
+    async def resolve_principals(user_ids, db):
+        calls.append(list(user_ids))
+        return {uncached: {"login": "bob", "is_superuser": False, "roles": ["user"], "permission_mask": 0}}
+
+    monkeypatch.setattr("app.services.auth_service.resolve_principals", resolve_principals)
+    missing_user = uuid.uuid4()
+    tokens = [
+        token_factory.mint_access(cached).token,
+        token_factory.mint_access(uncached).token,
+        token_factory.mint_access(missing_user).token,
+        "not-a-token",
+    ]
+
+    results = await AuthService(db_session=None).introspect_tokens(tokens)
+
+    assert [result["active"] for result in results] == [True, True, True, False]
+    assert results[1]["permissions"] == []
+    assert results[2]["permissions"] == list(principal_module.DEFAULT_PERMISSIONS)
+    assert len(calls) == 1 and set(calls[0]) == {uncached, missing_user}
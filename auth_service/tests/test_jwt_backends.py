@@ -0,0 +1,145 @@
+import time
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from jose.exceptions import ExpiredSignatureError, JWTError
+
+from app.core.jwt_backends import get_backend
+from app.utils.jwks_verifier import JWKSVerifier
+
+BACKENDS = ["jose", "pyjwt", "native"]
+ALGORITHMS = ["HS256", "RS256", "ES256", "EdDSA"]
+
+
+def _keys(algorithm: str):
+    if algorithm.startswith("HS"):
+        secret = "test-secret-key-test-secret-key!"
+        return secret, secret
+    if algorithm.startswith("RS"):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif algorithm.startswith("ES"):
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return private_pem, public_pem
+
+
+def _cases():
+    for name in BACKENDS:
+        for algorithm in ALGORITHMS:
+            if algorithm in get_backend(name).algorithms:
+                yield name, algorithm
+
+
+@pytest.mark.parametrize("name,algorithm", list(_cases()))
+def test_backend_round_trip(name, algorithm):
+    """Тест выпуска и проверки токена каждой реализацией"""
+    backend = get_backend(name)
+    private_material, public_material = _keys(algorithm)
+    signing_key = backend.prepare_key(private_material, algorithm)
+    verification_key = backend.prepare_key(public_material, algorithm)
+    claims = {"sub": "user-1", "exp": int(time.time()) + 60}
+
+    token = backend.encode(claims, signing_key, algorithm, headers={"kid": "k1"})
+
+    assert backend.decode(token, verification_key, [algorithm]) == claims
+    assert backend.get_unverified_header(token)["kid"] == "k1"
+
+
+@pytest.mark.parametrize("name", BACKENDS)
+def test_backend_errors_are_jose_exceptions(name):
+    """Тест: ошибки проверки не зависят от реализации"""
+    backend = get_backend(name)
+    key = backend.prepare_key("test-secret-key-test-secret-key!", "HS256")
+    other_key = backend.prepare_key("other-secret-key-other-secret-key", "HS256")
+    expired = backend.encode({"sub": "user-1", "exp": int(time.time()) - 60}, key, "HS256")
+    valid = backend.encode({"sub": "user-1", "exp": int(time.time()) + 60}, key, "HS256")
+
+    with pytest.raises(ExpiredSignatureError):
+        backend.decode(expired, key, ["HS256"])
+    with pytest.raises(JWTError):
+        backend.decode(valid, other_key, ["HS256"])
+    with pytest.raises(JWTError):
+        backend.decode(valid, key, ["HS512"])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("algorithm", ["RS256", "ES256", "EdDSA"])
+async def test_jwks_verifier_checks_tokens_with_published_keys(algorithm):
+    """Тест локальной проверки токена по JWKS, включая EdDSA"""
+    backend = get_backend("pyjwt")
+    private_material, public_material = _keys(algorithm)
+    jwks = {"keys": [{**backend.public_jwk(public_material, algorithm), "kid": "k1"}]}
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json=jwks, headers={"Cache-Control": "max-age=60"})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        verifier = JWKSVerifier("http://auth/jwks.json", [algorithm], http_client=client)
+        token = backend.encode(
+            {"sub": "user-1", "exp": int(time.time()) + 60},
+            backend.prepare_key(private_material, algorithm),
+            algorithm,
+            headers={"kid": "k1"},
+        )
+
+        assert (await verifier.verify(token))["sub"] == "user-1"
+        assert (await verifier.verify(token))["sub"] == "user-1"
+        assert len(requests) == 1
+
+
+def test_jwks_verifier_rejects_unsupported_algorithms():
+    """Тест: реализация без поддержки алгоритма отклоняется при создании"""
+    with pytest.raises(ValueError):
+        JWKSVerifier("http://auth/jwks.json", ["EdDSA"], backend="jose")
+
+
+@pytest.mark.asyncio
+async def test_jwks_verifier_backs_off_while_jwks_is_unavailable():
+    """Тест: при недоступном JWKS работают старые ключи, повторы реже с каждой неудачей"""
+    backend = get_backend("pyjwt")
+    private_material, public_material = _keys("ES256")
+    jwks = {"keys": [{**backend.public_jwk(public_material, "ES256"), "kid": "k1"}]}
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if len(requests) == 1:
+            return httpx.Response(200, json=jwks)
+        return httpx.Response(503)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        verifier = JWKSVerifier(
+            "http://auth/jwks.json", ["ES256"], min_refresh_interval_seconds=10, http_client=client
+        )
+        token = backend.encode(
+            {"sub": "user-1", "exp": int(time.time()) + 60},
+            backend.prepare_key(private_material, "ES256"),
+            "ES256",
+            headers={"kid": "k1"},
+        )
+        assert (await verifier.verify(token))["sub"] == "user-1"
+        verifier._expires_at = 0.0
+
+        for _ in range(3):
+            assert (await verifier.verify(token))["sub"] == "user-1"
+        assert len(requests) == 2
+        with pytest.raises(JWTError):
+            await verifier.get_key("unknown")
+        assert len(requests) == 2
+        assert 9 < verifier._retry_at - time.monotonic() <= 10
+
+        verifier._retry_at = 0.0
+        assert (await verifier.verify(token))["sub"] == "user-1"
+        assert len(requests) == 3
+        assert 19 < verifier._retry_at - time.monotonic() <= 20
@@ -0,0 +1,100 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.core import middleware
+from app.core.middleware import RateLimitMiddleware
+from app.utils.rate_limiter import RateLimitDecision
+
+ROUTES = {"/auth/login": "login", "/auth/": "default", "/auth/public/": None, "/roles/": "default"}
+
+
+def _middleware():
+    return RateLimitMiddleware(app=None, routes=ROUTES, prefix="/api/v1")
+
+
+def _scope(headers=(), client=("10.0.0.1", 1234)):
+    return {"type": "http", "path": "/", "headers": list(headers), "client": client}
+
+
+def test_traffic_type_exact_and_longest_prefix():
+    """Тест: точный путь важнее префикса, из префиксов выбирается самый длинный"""
+    limiter = _middleware()
+
+    assert limiter._traffic_type("/api/v1/auth/login") == "login"
+    assert limiter._traffic_type("/api/v1/auth/login/extra") == "default"
+    assert limiter._traffic_type("/api/v1/auth/public/keys") is None
+    assert limiter._traffic_type("/api/v1/roles/") == "default"
+    assert limiter._traffic_type("/api/v1/roles") is None
+    assert limiter._traffic_type("/api/v1/users/me") is None
+
+
+def test_identify_by_cached_token(monkeypatch):
+    """Тест: клиент с проверенным токеном определяется по subject и ролям"""
+    tokens = {"with-roles": {"sub": "user-1", "roles": ["premium"]}, "without-roles": {"sub": "user-2"}}
+    monkeypatch.setattr(middleware, "get_cached_token_claims", tokens.get)
+    monkeypatch.setattr(middleware, "cached_roles", lambda user_id: ("editor",) if user_id == "user-2" else None)
+
+    assert RateLimitMiddleware._identify(_scope([(b"authorization", b"Bearer with-roles")])) == (
+        "user-1", ("premium",)
+    )
+    assert RateLimitMiddleware._identify(_scope([(b"authorization", b"Bearer without-roles")])) == (
+        "user-2", ("editor",)
+    )
+    tokens["without-roles"] = {"sub": "user-3"}
+    assert RateLimitMiddleware._identify(_scope([(b"authorization", b"Bearer without-roles")])) == (
+        "user-3", middleware.AUTHENTICATED_ROLES
+    )
+
+
+def test_identify_falls_back_to_ip(monkeypatch):
+    """Тест: без проверенного токена клиент определяется по IP"""
+    monkeypatch.setattr(middleware, "get_cached_token_claims", lambda token: None)
+
+    assert RateLimitMiddleware._identify(_scope([(b"authorization", b"Bearer unknown")])) == (
+        "10.0.0.1", middleware.ANONYMOUS_ROLES
+    )
+    assert RateLimitMiddleware._identify(_scope([(b"authorization", b"Basic abc")])) == (
+        "10.0.0.1", middleware.ANONYMOUS_ROLES
+    )
+    assert RateLimitMiddleware._identify(_scope(client=None)) == ("unknown_ip", middleware.ANONYMOUS_ROLES)
+
+
+class _Limiter:
+    def __init__(self, allowed):
+        self.allowed = allowed
+        self.calls = []
+
+    async def allow_request(self, identifier, user_roles, traffic_type):
+        self.calls.append((identifier, user_roles, traffic_type))
+        return RateLimitDecision(self.allowed, 0, 2.5)
+
+
+@pytest.mark.parametrize("allowed", [True, False])
+def test_middleware_rejects_before_routing(allowed):
+    """Тест: отказ возвращается с Retry-After до вызова обработчика"""
+    handled = []
+
+    async def login(request):
+        handled.append(request.url.path)
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/api/v1/auth/login", login, methods=["POST"]),
+                            Route("/api/v1/users/me", login)])
+    app.state.rate_limiter = _Limiter(allowed)
+    app.add_middleware(RateLimitMiddleware, routes=ROUTES, prefix="/api/v1")
+    client = TestClient(app)
+
+    response = client.post("/api/v1/auth/login")
+    assert client.get("/api/v1/users/me").status_code == 200
+
+    if allowed:
+        assert response.status_code == 200
+        assert handled == ["/api/v1/auth/login", "/api/v1/users/me"]
+    else:
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "3"
+        assert handled == ["/api/v1/users/me"]
+    assert app.state.rate_limiter.calls == [("testclient", middleware.ANONYMOUS_ROLES, "login")]
@@ -0,0 +1,63 @@
+import pytest
+from pydantic import ValidationError
+
+from app.core.permissions import PermissionMatcher
+from app.schemas.role import RoleCreate, RoleResponse, RoleUpdate
+
+
+def test_matcher_exact_and_wildcard():
+    """Тест точных разрешений и шаблонов"""
+    matcher = PermissionMatcher(["view_content", "roles:*"])
+
+    assert matcher.matches("view_content")
+    assert matcher.matches("roles:create")
+    assert matcher.matches("roles:assign:admin")
+    assert not matcher.matches("roles")
+    assert not matcher.matches("view_content:extra")
+    assert not matcher.matches("users:create")
+
+
+def test_matcher_root_wildcard():
+    """Тест шаблона "*" на все разрешения"""
+    matcher = PermissionMatcher(["roles:create", "*"])
+
+    assert matcher.matches("roles:create")
+    assert matcher.matches("anything:else")
+
+
+@pytest.mark.parametrize("patterns", [["roles", "roles:*"], ["roles:*", "roles"]])
+def test_matcher_keeps_prefix_with_wildcard(patterns):
+    """Тест: префикс и шаблон на него не зависят от порядка"""
+    matcher = PermissionMatcher(patterns)
+
+    assert matcher.matches("roles")
+    assert matcher.matches("roles:create")
+
+
+def test_matcher_wildcard_absorbs_nested_patterns():
+    """Тест: шаблон покрывает ранее добавленные вложенные разрешения"""
+    matcher = PermissionMatcher(["roles:create", "roles:*", "roles:delete"])
+
+    assert matcher.matches("roles:update")
+    assert not matcher.matches("roles")
+
+
+@pytest.mark.parametrize("schema", [RoleCreate, RoleUpdate])
+@pytest.mark.parametrize("permission", ["roles:*:create", "roles*", "roles::create", "*roles"])
+def test_role_input_rejects_invalid_wildcards(schema, permission):
+    """Тест отклонения некорректных шаблонов во входящих данных"""
+    with pytest.raises(ValidationError):
+        schema(name="editor", permissions=[permission])
+
+
+def test_role_response_accepts_stored_permissions():
+    """Тест: сохраненные роли отдаются без проверки шаблонов"""
+    role = RoleResponse(
+        id="00000000-0000-0000-0000-000000000001",
+        created_at="2024-01-01T00:00:00Z",
+        name="legacy",
+        permissions=["roles:*:create"],
+    )
+
+    assert role.permissions == ["roles:*:create"]
+    assert RoleCreate(name="editor", permissions=["*", "roles:*"]).permissions == ["*", "roles:*"]
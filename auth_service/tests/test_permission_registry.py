@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.permissions import ALL_PERMISSIONS, PermissionRegistry
+
+
+class _Db:
+    # Таблица permissions в памяти: SELECT отдает только зафиксированные строки
+    def __init__(self, committed):
+        self.committed = dict(committed)
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        rows = [SimpleNamespace(name=name, bit=bit) for name, bit in self.committed.items()]
+        return SimpleNamespace(all=lambda: rows)
+
+
+@pytest.mark.asyncio
+async def test_mask_for_and_names_round_trip():
+    """Тест перевода разрешений в маску и обратно"""
+    registry = PermissionRegistry()
+    db = _Db({"view_content": 0, "roles:create": 1, "roles:delete": 3})
+
+    mask = await registry.mask_for(["view_content", "roles:delete"], db)
+
+    assert mask == 0b1001
+    assert await registry.names(mask, db) == ["roles:delete", "view_content"]
+    assert await registry.mask_for(["*", "view_content"], db) == ALL_PERMISSIONS
+    assert await registry.names(ALL_PERMISSIONS, db) == ["*"]
+    assert registry.loads == 1
+
+
+@pytest.mark.asyncio
+async def test_unknown_name_or_bit_reloads_registry():
+    """Тест: неизвестное имя или бит перечитывает реестр"""
+    registry = PermissionRegistry()
+    db = _Db({"view_content": 0})
+    await registry.load(db)
+
+    db.committed["roles:create"] = 1
+    assert await registry.names(0b11, db) == ["roles:create", "view_content"]
+    assert registry.loads == 2
+
+    db.committed["roles:delete"] = 2
+    assert await registry.mask_for(["roles:delete"], db) == 0b100
+    assert registry.loads == 3
+
+    # Имя, которого нет и в БД, пропускается
+    assert await registry.mask_for(["missing"], db) == 0
+
+
+@pytest.mark.asyncio
+async def test_has_checks_bits_and_wildcard_patterns():
+    """Тест проверки разрешения по биту и по шаблону"""
+    registry = PermissionRegistry()
+    db = _Db({"view_content": 0, "roles:*": 1})
+    await registry.load(db)
+
+    assert await registry.has(0b01, "view_content", db)
+    assert not await registry.has(0b01, "roles:create", db)
+    assert await registry.has(0b10, "roles:create", db)
+    assert await registry.has(ALL_PERMISSIONS, "anything", db)
+    assert await registry.missing(0b10, ["roles:create", "view_content"], db) == ["view_content"]
+
+
+@pytest.mark.asyncio
+async def test_register_does_not_touch_registry_before_commit():
+    """Тест: регистрация не меняет реестр воркера до фиксации транзакции"""
+    registry = PermissionRegistry()
+    db = _Db({"view_content": 0})
+    await registry.load(db)
+
+    await registry.register(["view_content", "roles:create", "*"], db)
+
+    assert len(db.statements) == 2
+    assert registry.loads == 1
+    assert registry.stats()["permissions"] == 1
+
+    # После отката разрешения нет ни в БД, ни в реестре
+    assert await registry.mask_for(["roles:create"], db) == 0
+
+    await registry.register(["view_content"], db)
+    assert len(db.statements) == 3
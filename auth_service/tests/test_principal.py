@@ -0,0 +1,362 @@
+import asyncio
+import random
+import time
+import uuid
+
+import pytest
+
+from app.core import principal as principal_module
+from app.core.principal import (PrincipalCache, _decode, _encode,
+                                _jittered_ttl, _refresh_due, cached_roles,
+                                get_permissions_version, invalidate_principal,
+                                invalidate_principals, principal_claims,
+                                principal_for_token, principal_key,
+                                resolve_principal, resolve_principals)
+from app.settings import settings
+from app.utils.single_flight import RedisLock
+
+ALICE = {"login": "alice", "is_superuser": False, "roles": ["user"], "permission_mask": 0b101}
+
+
+@pytest.fixture
+def users(redis, monkeypatch):
+    # Пользователи в БД; load_principals отдает их и считает обращения
+    store = {}
+    calls = []
+
+    async def load_principals(user_ids, db):
+        user_ids = list(user_ids)
+        calls.append(user_ids)
+        return {user_id: dict(store[user_id]) for user_id in user_ids if user_id in store}
+
+    monkeypatch.setattr(principal_module, "load_principals", load_principals)
+    monkeypatch.setattr(principal_module, "principal_load_lock", RedisLock(redis, ttl_ms=2000))
+    monkeypatch.setattr(
+        principal_module,
+        "_refresh_principal_script",
+        redis.register_script(principal_module._REFRESH_PRINCIPAL_LUA),
+    )
+    principal_module.principal_cache.clear()
+    yield store, calls
+    principal_module.principal_cache.clear()
+
+
+def test_encode_decode_round_trip():
+    """Тест: запись кэша хранит данные, время вычисления и истечение"""
+    principal, delta, expires_at = _decode(_encode(ALICE, 0.012345, 1700000000.7))
+
+    assert principal == ALICE
+    assert delta == 0.0123
+    assert expires_at == 1700000000
+
+
+def test_decode_legacy_entry_is_a_miss():
+    """Тест: запись старого формата со списком разрешений считается промахом"""
+    assert _decode('["alice",false,["user"],["view_content"]]') == (None, 0.0, 0.0)
+    assert _decode('["alice",false,["user"],5]')[0]["permission_mask"] == 5
+
+
+@pytest.mark.asyncio
+async def test_resolve_principal_loads_once_and_caches_in_redis(redis, users):
+    """Тест: промах загружает пользователя из БД и кэширует его в Redis"""
+    store, calls = users
+    user_id = uuid.uuid4()
+    store[user_id] = ALICE
+
+    assert await resolve_principal(user_id, db=None) == ALICE
+    assert await redis.exists(principal_key(user_id))
+    assert await redis.get(f"permissions:{user_id}") == str(ALICE["permission_mask"])
+
+    assert await resolve_principal(user_id, db=None) == ALICE
+    assert calls == [[user_id]]
+
+
+@pytest.mark.asyncio
+async def test_resolve_missing_user(redis, users):
+    """Тест: несуществующий пользователь не кэшируется"""
+    user_id = uuid.uuid4()
+
+    assert await resolve_principal(user_id, db=None) is None
+    assert not await redis.exists(principal_key(user_id))
+
+
+@pytest.mark.asyncio
+async def test_token_claims_are_trusted_until_permissions_change(redis, users):
+    """Тест: права из токена принимаются, пока версия прав не изменилась"""
+    store, calls = users
+    user_id = uuid.uuid4()
+    store[user_id] = ALICE
+
+    claims = await principal_claims(user_id, db=None)
+    assert claims["perms"] == ALICE["permission_mask"] and claims["pv"]
+    assert await get_permissions_version(user_id) == claims["pv"]
+
+    payload = {**claims, "perms": 0b111}
+    assert (await principal_for_token(user_id, payload, db=None))["permission_mask"] == 0b111
+
+    await invalidate_principal(user_id)
+    assert await get_permissions_version(user_id) != claims["pv"]
+    assert (await principal_for_token(user_id, payload, db=None))["permission_mask"] == ALICE["permission_mask"]
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_token_without_version_falls_back_to_cache(redis, users):
+    """Тест: токен без версии прав разрешается через кэш"""
+    store, _ = users
+    user_id = uuid.uuid4()
+    store[user_id] = ALICE
+
+    principal = await principal_for_token(user_id, {"login": "alice", "perms": 0b111}, db=None)
+
+    assert principal == ALICE
+
+
+@pytest.fixture
+def local_tier(monkeypatch):
+    monkeypatch.setattr(principal_module.principal_cache.bus, "ready", True)
+    return principal_module.principal_cache
+
+
+@pytest.mark.asyncio
+async def test_local_tier_serves_repeated_lookups(redis, users, local_tier):
+    """Тест: повторное чтение берется из памяти воркера без Redis"""
+    store, _ = users
+    user_id = uuid.uuid4()
+    store[user_id] = ALICE
+    await resolve_principal(user_id, db=None)
+    await redis.delete(principal_key(user_id))
+
+    assert await resolve_principal(user_id, db=None) == ALICE
+    assert cached_roles(str(user_id)) == ("user",)
+
+    # Событие инвалидации от другого воркера сбрасывает локальную копию
+    local_tier._on_message(PrincipalCache.encode_event([str(user_id), "other"]))
+    assert cached_roles(str(user_id)) is None
+
+
+@pytest.mark.asyncio
+async def test_local_tier_is_bypassed_without_subscription(redis, users, local_tier, monkeypatch):
+    """Тест: без подписки на события локальный уровень не используется"""
+    store, calls = users
+    user_id = uuid.uuid4()
+    store[user_id] = ALICE
+    await resolve_principal(user_id, db=None)
+    monkeypatch.setattr(local_tier.bus, "ready", False)
+    await redis.delete(principal_key(user_id))
+
+    await resolve_principal(user_id, db=None)
+
+    assert len(calls) == 2
+    assert cached_roles(str(user_id)) is None
+
+
+@pytest.mark.asyncio
+async def test_invalidation_clears_both_tiers(redis, users, local_tier):
+    """Тест: инвалидация удаляет запись в Redis и в памяти воркера"""
+    store, calls = users
+    user_id = uuid.uuid4()
+    store[user_id] = ALICE
+    await resolve_principal(user_id, db=None)
+    version = await get_permissions_version(user_id)
+    await principal_for_token(user_id, {"pv": version, "perms": 1}, db=None)
+    assert local_tier.versions.get(str(user_id)) == version
+
+    await invalidate_principal(user_id)
+
+    assert not await redis.exists(principal_key(user_id))
+    assert local_tier.principals.get(str(user_id)) is None
+    assert local_tier.versions.get(str(user_id)) is None
+    store[user_id] = {**ALICE, "roles": ["admin"]}
+    assert (await resolve_principal(user_id, db=None))["roles"] == ["admin"]
+
+
+@pytest.mark.asyncio
+async def test_claims_ignore_local_copy_older_than_version(redis, users, local_tier):
+    """Тест: токен не получает старые права воркера вместе с новой версией"""
+    store, _ = users
+    user_id = uuid.uuid4()
+    store[user_id] = ALICE
+    claims = await principal_claims(user_id, db=None)
+    await resolve_principal(user_id, db=None)
+    assert local_tier.principals.get(str(user_id)) == ALICE
+
+    # Инвалидация на другом воркере: Redis уже обновлен, событие еще не дошло
+    store[user_id] = {**ALICE, "roles": ["admin"], "permission_mask": 0b111}
+    await redis.delete(principal_key(user_id))
+    await redis.set(f"perm_ver:{user_id}", str(time.time_ns()))
+
+    fresh = await principal_claims(user_id, db=None)
+    assert fresh["roles"] == ["admin"] and fresh["perms"] == 0b111
+    assert fresh["pv"] != claims["pv"]
+    assert (await principal_for_token(user_id, claims, db=None))["roles"] == ["admin"]
+
+
+@pytest.mark.asyncio
+async def test_permissions_version_expires_after_refresh_token_lifetime(redis, users):
+    """Тест: ключ версии прав получает TTL при каждой записи"""
+    user_id = uuid.uuid4()
+    lifetime = settings.refresh_token_expire_days * 24 * 3600
+    key = f"perm_ver:{user_id}"
+
+    version = await get_permissions_version(user_id)
+    assert lifetime - 5 <= await redis.ttl(key) <= lifetime
+
+    await redis.expire(key, 10)
+    assert await get_permissions_version(user_id) == version
+    assert await redis.ttl(key) > 10
+
+    await invalidate_principal(user_id)
+    assert lifetime - 5 <= await redis.ttl(key) <= lifetime
+
+
+@pytest.mark.asyncio
+async def test_invalidate_principals_streams_in_batches(redis, users, monkeypatch):
+    """Тест: владельцы роли сбрасываются пачками из асинхронного потока"""
+    monkeypatch.setattr(principal_module, "INVALIDATION_BATCH_SIZE", 2)
+    user_ids = [uuid.uuid4() for _ in range(5)]
+    for user_id in user_ids:
+        await redis.set(principal_key(user_id), "cached")
+    batches = []
+    invalidate_batch = principal_module._invalidate_batch
+
+    async def record_batch(batch):
+        batches.append(len(batch))
+        await invalidate_batch(batch)
+
+    async def holders():
+        for user_id in user_ids:
+            yield user_id
+
+    monkeypatch.setattr(principal_module, "_invalidate_batch", record_batch)
+
+    assert await invalidate_principals(holders()) == 5
+    assert batches == [2, 2, 1]
+    assert await redis.exists(*(principal_key(user_id) for user_id in user_ids)) == 0
+
+
+@pytest.mark.asyncio
+async def test_resolve_principals_batches_redis_and_database(redis, users, local_tier):
+    """Тест: пакет разрешается локально, одним MGET и одной загрузкой промахов"""
+    store, calls = users
+    local_user, redis_user, db_user, missing_user = (uuid.uuid4() for _ in range(4))
+    for user_id in (local_user, redis_user, db_user):
+        store[user_id] = ALICE
+    await resolve_principal(local_user, db=None)
+    await principal_module.cache_principal(redis_user, ALICE)
+    calls.clear()
+
+    principals = await resolve_principals([local_user, redis_user, db_user, missing_user, db_user], db=None)
+
+    assert set(principals) == {local_user, redis_user, db_user}
+    assert calls == [[db_user, missing_user]]
+    assert await redis.exists(principal_key(db_user))
+    assert cached_roles(str(db_user)) == ("user",)
+
+
+def test_refresh_due_grows_towards_expiry(monkeypatch):
+    """Тест XFetch: досрочный пересчет вероятнее ближе к истечению и для дорогих записей"""
+    monkeypatch.setattr(time, "time", lambda: 1000.0)
+    monkeypatch.setattr(random, "random", lambda: 0.5)
+    monkeypatch.setattr(settings, "permissions_cache_xfetch_beta", 1.0)
+    # -ln(0.5) ~ 0.69: пересчет, если до истечения меньше 0.69 * delta * beta
+
+    assert not _refresh_due(0.0, 1000.5)
+    assert not _refresh_due(1.0, 0.0)
+    assert _refresh_due(1.0, 1000.5)
+    assert not _refresh_due(1.0, 1001.0)
+    assert _refresh_due(2.0, 1001.0)
+    assert _refresh_due(0.001, 999.0)
+
+    monkeypatch.setattr(settings, "permissions_cache_xfetch_beta", 0.0)
+    assert not _refresh_due(1.0, 1000.5)
+
+
+def test_jittered_ttl_spreads_expiry(monkeypatch):
+    """Тест: TTL записи уменьшается на случайную долю в пределах jitter"""
+    monkeypatch.setattr(settings, "permissions_cache_ttl_seconds", 1000)
+    monkeypatch.setattr(settings, "permissions_cache_ttl_jitter", 0.1)
+
+    monkeypatch.setattr(random, "random", lambda: 0.0)
+    assert _jittered_ttl() == 1000
+    monkeypatch.setattr(random, "random", lambda: 0.999)
+    assert _jittered_ttl() == 900
+
+
+@pytest.mark.asyncio
+async def test_early_refresh_rewrites_entry_in_background(redis, users, monkeypatch):
+    """Тест: запись, которой пора обновиться, отдается сразу и пересчитывается в фоне"""
+    store, calls = users
+    user_id = uuid.uuid4()
+    store[user_id] = ALICE
+    await principal_module.cache_principal(user_id, {**ALICE, "roles": ["stale"]}, delta=0.5)
+
+    class _Session:
+        async def __aenter__(self):
+            return None
+
+        async def __aexit__(self, *exc_info):
+            return False
+
+    monkeypatch.setattr(principal_module, "AsyncDBSession", _Session)
+    monkeypatch.setattr(principal_module, "_refresh_due", lambda delta, expires_at: True)
+
+    assert (await resolve_principal(user_id, db=None))["roles"] == ["stale"]
+    await asyncio.gather(*principal_module._refresh_tasks.values())
+
+    cached, _, _ = _decode(await redis.get(principal_key(user_id)))
+    assert cached == ALICE
+    assert calls == [[user_id]]
+
+
+@pytest.mark.asyncio
+async def test_early_refresh_does_not_resurrect_invalidated_entry(redis, users, monkeypatch):
+    """Тест: досрочное обновление не восстанавливает запись, удаленную инвалидацией"""
+    store, _ = users
+    user_id = uuid.uuid4()
+    store[user_id] = ALICE
+
+    class _Session:
+        async def __aenter__(self):
+            await invalidate_principal(user_id)
+
+        async def __aexit__(self, *exc_info):
+            return False
+
+    monkeypatch.setattr(principal_module, "AsyncDBSession", _Session)
+
+    await principal_module._refresh_principal(user_id)
+
+    assert not await redis.exists(principal_key(user_id))
+
+
+@pytest.mark.asyncio
+async def test_early_refresh_does_not_overwrite_entry_written_after_invalidation(
+    redis, users, monkeypatch
+):
+    """Тест: досрочное обновление не затирает запись, сделанную после инвалидации"""
+    store, _ = users
+    user_id = uuid.uuid4()
+    store[user_id] = ALICE
+    await resolve_principal(user_id, db=None)
+    admin = {**ALICE, "roles": ["admin"], "permission_mask": 0b111}
+
+    class _Session:
+        async def __aenter__(self):
+            return None
+
+        async def __aexit__(self, *exc_info):
+            # Права меняются после чтения БД, но до записи обновления
+            store[user_id] = admin
+            await invalidate_principal(user_id)
+            await resolve_principal(user_id, db=None)
+            return False
+
+    monkeypatch.setattr(principal_module, "AsyncDBSession", _Session)
+    refreshes = principal_module.principal_cache.early_refreshes
+
+    await principal_module._refresh_principal(user_id)
+
+    assert _decode(await redis.get(principal_key(user_id)))[0] == admin
+    assert await redis.get(f"permissions:{user_id}") == str(admin["permission_mask"])
+    assert principal_module.principal_cache.early_refreshes == refreshes
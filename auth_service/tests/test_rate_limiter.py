@@ -0,0 +1,184 @@
+import asyncio
+import time
+
+import pytest
+
+from app.schemas.ratelimiting import (RateLimitConfig, RateLimitConfigDict,
+                                      RoleBasedLimits)
+from app.settings import settings
+from app.utils.rate_limiter import (RATE_LIMIT_KEY_PREFIXES,
+                                    RateLimitPolicyTable,
+                                    RedisLeakyBucketRateLimiter)
+
+
+def _limiter(redis, algorithm="leaky_bucket", capacity=5, leak_rate=0.001, ttl_seconds=60):
+    config = RateLimitConfigDict(
+        default=RoleBasedLimits(
+            algorithm=algorithm,
+            default=RateLimitConfig(capacity=capacity, leak_rate=leak_rate, ttl_seconds=ttl_seconds),
+        )
+    )
+    return RedisLeakyBucketRateLimiter(redis, settings.model_copy(update={"rate_limit_config": config}))
+
+
+async def _decisions(limiter, count, identifier="client"):
+    return [await limiter.allow_request(identifier, ("guest",)) for _ in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_leaky_bucket_admits_capacity_then_rejects(redis):
+    """Тест: корзина пропускает capacity запросов и отказывает с Retry-After"""
+    limiter = _limiter(redis, leak_rate=0.5)
+    await limiter.start()
+
+    decisions = await _decisions(limiter, 6)
+
+    assert [decision.allowed for decision in decisions] == [True] * 5 + [False]
+    assert [decision.remaining for decision in decisions[:5]] == [4, 3, 2, 1, 0]
+    assert decisions[5].retry_after == pytest.approx(2, abs=0.1)
+    assert 0 < await redis.ttl("rate_limit_bucket:default:client") <= 60
+
+
+@pytest.mark.asyncio
+async def test_leaky_bucket_rejection_does_not_fill_bucket(redis):
+    """Тест: отклоненный запрос не занимает место в корзине"""
+    limiter = _limiter(redis, capacity=2)
+    await _decisions(limiter, 5)
+
+    level = float(await redis.hget("rate_limit_bucket:default:client", "level"))
+    assert level == pytest.approx(2, abs=0.01)
+
+
+@pytest.mark.asyncio
+async def test_leaky_bucket_is_atomic_under_concurrency(redis):
+    """Тест: параллельные запросы не превышают емкость"""
+    limiter = _limiter(redis, capacity=10)
+
+    decisions = await asyncio.gather(*(limiter.allow_request("client", ("guest",)) for _ in range(30)))
+
+    assert sum(decision.allowed for decision in decisions) == 10
+
+
+@pytest.mark.asyncio
+async def test_leaky_bucket_leaks_over_time(redis):
+    """Тест: корзина протекает со скоростью leak_rate"""
+    limiter = _limiter(redis, capacity=1, leak_rate=20)
+
+    assert [decision.allowed for decision in await _decisions(limiter, 2)] == [True, False]
+    await asyncio.sleep(0.1)
+    assert (await limiter.allow_request("client", ("guest",))).allowed
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("algorithm", list(RATE_LIMIT_KEY_PREFIXES))
+async def test_algorithm_admits_burst_of_capacity(redis, algorithm):
+    """Тест: каждый алгоритм пропускает всплеск в capacity запросов"""
+    limiter = _limiter(redis, algorithm, capacity=5, leak_rate=0.01)
+    await limiter.start()
+
+    decisions = await _decisions(limiter, 7)
+
+    assert [decision.allowed for decision in decisions] == [True] * 5 + [False] * 2
+    assert decisions[4].remaining == 0
+    assert decisions[5].retry_after > 0
+    assert await redis.exists(f"{RATE_LIMIT_KEY_PREFIXES[algorithm]}:default:client")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("algorithm", list(RATE_LIMIT_KEY_PREFIXES))
+async def test_algorithm_counts_consumed_requests_without_check(redis, algorithm):
+    """Тест: consumed учитывается без проверки, cost = 0 ничего не пропускает"""
+    limiter = _limiter(redis, algorithm, capacity=5, leak_rate=0.01)
+    key = f"{RATE_LIMIT_KEY_PREFIXES[algorithm]}:default:client"
+    config = limiter.policies.resolve("default", ("guest",)).config
+
+    decision, level = await limiter._check_remote(key, algorithm, config, cost=0, consumed=4)
+    assert decision.allowed
+    assert level == pytest.approx(4, abs=0.01)
+
+    assert [decision.allowed for decision in await _decisions(limiter, 2)] == [True, False]
+
+
+@pytest.mark.asyncio
+async def test_gcra_spaces_requests_after_burst(redis):
+    """Тест GCRA: после всплеска следующий запрос возможен через 1 / leak_rate"""
+    limiter = _limiter(redis, "gcra", capacity=2, leak_rate=20)
+
+    assert [decision.allowed for decision in await _decisions(limiter, 3)] == [True, True, False]
+    await asyncio.sleep(0.06)
+    assert [decision.allowed for decision in await _decisions(limiter, 2)] == [True, False]
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_weights_previous_window(redis):
+    """Тест скользящего окна: запросы предыдущего окна учитываются с весом непрошедшей доли"""
+    limiter = _limiter(redis, "sliding_window", capacity=100, leak_rate=0.01)
+    window = 100 / 0.01
+    index = int(time.time() // window)
+    await redis.hset("rate_limit_window:default:client", mapping={"window": index - 1, "current": 100})
+
+    elapsed = time.time() / window - index
+    allowed = sum(decision.allowed for decision in await _decisions(limiter, 100))
+
+    assert abs(allowed - 100 * elapsed) <= 1
+
+
+def _table(role_priority=("superuser", "premium", "user", "guest")):
+    config = RateLimitConfigDict.model_validate({
+        "default": {
+            "default": {"capacity": 10, "leak_rate": 1, "ttl_seconds": 60},
+            "guest": {"capacity": 5, "leak_rate": 0.5, "ttl_seconds": 60},
+            "user": {"capacity": 20, "leak_rate": 2, "ttl_seconds": 60},
+            "premium": {"capacity": 100, "leak_rate": 10, "ttl_seconds": 60},
+            "editor": {"capacity": 50, "leak_rate": 5, "ttl_seconds": 60},
+        },
+        "login": {
+            "algorithm": "sliding_window",
+            "default": {"capacity": 3, "leak_rate": 0.3, "ttl_seconds": 300},
+            "user": {"capacity": 6, "leak_rate": 0.6, "ttl_seconds": 300},
+        },
+    })
+    return RateLimitPolicyTable(config, role_priority)
+
+
+def test_policy_table_picks_highest_priority_role():
+    """Тест: из нескольких ролей с лимитами выбирается самая приоритетная"""
+    table = _table()
+
+    assert table.resolve("default", ("guest", "premium")).config.capacity == 100
+    assert table.resolve("default", ("user",)).config.capacity == 20
+    assert table.resolve("default", ("unknown",)).config.capacity == 10
+    assert table.resolve("default", ()).key_prefix == "rate_limit_bucket:default"
+    # Роль вне role_priority идет после перечисленных
+    assert table.resolve("default", ("editor", "guest")).config.capacity == 5
+    assert table.resolve("default", ("editor",)).config.capacity == 50
+
+
+def test_policy_table_uses_algorithm_of_traffic_type():
+    """Тест: алгоритм и префикс ключа берутся из типа трафика"""
+    table = _table()
+
+    policy = table.resolve("login", ("premium", "user"))
+    assert policy.algorithm == "sliding_window"
+    assert policy.config.capacity == 6
+    assert policy.key_prefix == "rate_limit_window:login"
+    assert table.resolve("login", ("guest",)).config.capacity == 3
+
+
+def test_policy_table_unknown_traffic_type_uses_default_limits_in_own_bucket():
+    """Тест: тип трафика без лимитов берет лимиты default в отдельной корзине"""
+    table = _table()
+
+    policy = table.resolve("bulk", ("user",))
+
+    assert policy.config == table.resolve("default", ("user",)).config
+    assert policy.key_prefix == "rate_limit_bucket:bulk"
+
+
+def test_policy_table_memoizes_resolution(monkeypatch):
+    """Тест: результат для набора ролей запоминается"""
+    table = _table()
+    policy = table.resolve("default", ("user",))
+    monkeypatch.setattr(table, "_resolve", lambda traffic_type, roles: pytest.fail("Повторное разрешение"))
+
+    assert table.resolve("default", ("user",)) is policy
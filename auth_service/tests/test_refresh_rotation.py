@@ -0,0 +1,64 @@
+import asyncio
+import uuid
+
+import pytest
+
+from app.core.security import verify_jwt
+from app.core.tokens import token_factory
+from app.services import auth_service
+from app.services.auth_service import _ROTATE_REFRESH_LUA, AuthService
+from app.settings import settings
+
+
+@pytest.fixture
+def service(redis, monkeypatch):
+    # Скрипт привязан к клиенту при импорте модуля, поэтому регистрируется заново
+    monkeypatch.setattr(auth_service, "_rotate_refresh_script", redis.register_script(_ROTATE_REFRESH_LUA))
+    monkeypatch.setattr(settings, "token_embed_permissions", False)
+    return AuthService(db_session=None)
+
+
+async def _login(redis, user_id):
+    _, refresh = token_factory.mint_pair(user_id)
+    await redis.sadd(f"user_active_refresh_jtis:{user_id}", refresh.jti)
+    return refresh
+
+
+@pytest.mark.asyncio
+async def test_refresh_rotates_active_token(redis, service):
+    """Тест: старый jti отзывается, новый становится активным"""
+    user_id = uuid.uuid4()
+    refresh = await _login(redis, user_id)
+
+    tokens = await service.refresh_tokens(refresh.token)
+
+    new_refresh = verify_jwt(tokens["refresh_token"], refresh=True)
+    assert await redis.smembers(f"user_active_refresh_jtis:{user_id}") == {new_refresh["jti"]}
+    assert await redis.get(f"blacklist:{refresh.jti}") == "1"
+    assert 0 < await redis.ttl(f"blacklist:{refresh.jti}") <= settings.refresh_token_expire_days * 24 * 3600
+    assert verify_jwt(tokens["access_token"])["sid"] == new_refresh["sid"] == verify_jwt(refresh.token, refresh=True)["sid"]
+
+    assert await service.refresh_tokens(refresh.token) is None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_refresh_with_same_token_succeeds_once(redis, service):
+    """Тест: из параллельных обновлений одним токеном проходит только одно"""
+    user_id = uuid.uuid4()
+    refresh = await _login(redis, user_id)
+
+    results = await asyncio.gather(*(service.refresh_tokens(refresh.token) for _ in range(5)))
+
+    assert sum(result is not None for result in results) == 1
+    assert len(await redis.smembers(f"user_active_refresh_jtis:{user_id}")) == 1
+
+
+@pytest.mark.asyncio
+async def test_refresh_with_inactive_token_changes_nothing(redis, service):
+    """Тест: неактивный refresh токен не выпускает новую пару"""
+    user_id = uuid.uuid4()
+    refresh = token_factory.mint_refresh(user_id)
+
+    assert await service.refresh_tokens(refresh.token) is None
+    assert await redis.exists(f"user_active_refresh_jtis:{user_id}") == 0
+    assert await redis.get(f"blacklist:{refresh.jti}") is None
@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from app.core.revocation import RevocationFilter
+from app.utils.bloom import BloomFilter
+from app.utils.pubsub import RedisBroadcaster
+
+
+def _filter(redis, bucket_seconds=60):
+    bus = RedisBroadcaster(redis)
+    bus.ready = True
+    return RevocationFilter(redis, bus, bucket_seconds=bucket_seconds, bucket_capacity=100, error_rate=0.01)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    """Тест: добавленные элементы всегда находятся"""
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [f"jti-{i}" for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+
+    assert all(item in bloom for item in items)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+    assert bloom.count == 1000
+
+
+@pytest.mark.parametrize("capacity, error_rate", [(0, 0.01), (10, 0), (10, 1)])
+def test_bloom_filter_rejects_invalid_parameters(capacity, error_rate):
+    """Тест проверки параметров фильтра"""
+    with pytest.raises(ValueError):
+        BloomFilter(capacity, error_rate)
+
+
+def test_revocation_filter_falls_back_until_warmed(redis):
+    """Тест: до загрузки фильтр не дает ответа"""
+    revocation = _filter(redis)
+
+    assert revocation.might_contain("jti") is None
+    assert revocation.stats()["fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_revocation_filter_warm_up_and_events(redis):
+    """Тест загрузки черного списка из Redis и событий pub/sub"""
+    await redis.set("blacklist:loaded", "1", ex=600)
+    await redis.set("blacklist:no-ttl", "1")
+    revocation = _filter(redis)
+
+    await revocation.warm_up()
+    revocation._on_message(RevocationFilter.encode_event("published", time.time() + 600))
+    revocation._on_message("broken")
+
+    assert revocation.might_contain("loaded") is True
+    assert revocation.might_contain("published") is True
+    assert revocation.might_contain("no-ttl") is False
+    assert revocation.might_contain("unknown") is False
+
+
+def test_revocation_filter_drops_expired_buckets(redis, monkeypatch):
+    """Тест: корзина выбрасывается целиком, когда истекли все ее jti"""
+    revocation = _filter(redis, bucket_seconds=10)
+    revocation._warmed = True
+    now = 1000.0
+    monkeypatch.setattr(time, "time", lambda: now)
+    revocation.add("short", now + 5)
+    revocation.add("long", now + 25)
+    assert revocation.stats()["buckets"] == 2
+
+    monkeypatch.setattr(time, "time", lambda: now + 10)
+    assert revocation.might_contain("short") is False
+    assert revocation.might_contain("long") is True
+    assert revocation.stats()["buckets"] == 1
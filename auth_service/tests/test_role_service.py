@@ -0,0 +1,96 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from app.schemas.permission import PermissionCheckRequest
+from app.services import role_service as role_service_module
+from app.services.role_service import RoleService
+
+
+class _Result:
+    def __init__(self, rows=(), rowcount=0):
+        self._rows = list(rows)
+        self.rowcount = rowcount
+
+    def scalars(self):
+        return SimpleNamespace(all=lambda: self._rows)
+
+
+class _Session:
+    # Сессия, которая отдает заранее заданные результаты DELETE по порядку
+    def __init__(self, results):
+        self.results = list(results)
+        self.events = []
+
+    async def execute(self, statement):
+        self.events.append("execute")
+        return self.results.pop(0)
+
+    async def commit(self):
+        self.events.append("commit")
+
+
+@pytest.mark.asyncio
+async def test_delete_role_invalidates_holders_batch_by_batch(monkeypatch):
+    """Тест: владельцы роли удаляются и сбрасываются пачками после фиксации"""
+    monkeypatch.setattr(role_service_module, "INVALIDATION_BATCH_SIZE", 2)
+    first, second = [uuid.uuid4(), uuid.uuid4()], [uuid.uuid4()]
+    session = _Session([_Result(first), _Result(second), _Result(), _Result(rowcount=1)])
+    invalidated = []
+
+    async def invalidate_principal(*user_ids):
+        assert session.events[-1] == "commit"
+        invalidated.append(list(user_ids))
+
+    monkeypatch.setattr(role_service_module, "invalidate_principal", invalidate_principal)
+
+    assert await RoleService(session).delete_role(uuid.uuid4()) is True
+    assert invalidated == [first, second]
+    assert session.events == ["execute", "commit", "execute", "commit", "execute", "execute", "commit"]
+
+
+@pytest.mark.asyncio
+async def test_delete_missing_role(monkeypatch):
+    """Тест удаления несуществующей роли"""
+    session = _Session([_Result(), _Result(rowcount=0)])
+
+    async def invalidate_principal(*user_ids):
+        raise AssertionError("Кэш не должен сбрасываться")
+
+    monkeypatch.setattr(role_service_module, "invalidate_principal", invalidate_principal)
+
+    assert await RoleService(session).delete_role(uuid.uuid4()) is False
+
+
+@pytest.mark.asyncio
+async def test_check_permissions_resolves_users_once(monkeypatch):
+    """Тест пакетной проверки разрешений: пользователи загружаются одним вызовом"""
+    editor, viewer = uuid.uuid4(), uuid.uuid4()
+    calls = []
+
+    async def resolve_principals(user_ids, db):
+        calls.append(list(user_ids))
+        return {
+            editor: {"permission_mask": 0b11},
+            viewer: {"permission_mask": 0b01},
+        }
+
+    async def has(mask, name, db):
+        return bool(mask >> {"view_content": 0, "roles:create": 1}[name] & 1)
+
+    monkeypatch.setattr(role_service_module, "resolve_principals", resolve_principals)
+    monkeypatch.setattr(role_service_module.permission_registry, "has", has)
+    checks = [
+        PermissionCheckRequest(user_id=str(editor), required_permission="roles:create"),
+        PermissionCheckRequest(user_id=str(viewer), required_permission="roles:create"),
+        PermissionCheckRequest(user_id=str(viewer), required_permission="view_content"),
+        PermissionCheckRequest(user_id="not-a-uuid", required_permission="view_content"),
+    ]
+
+    results = await RoleService(None).check_permissions(checks)
+
+    assert [result["has_access"] for result in results] == [True, False, True, False]
+    assert results[1]["missing_permissions"] == ["roles:create"]
+    assert results[3]["user_id"] == "not-a-uuid"
+    assert calls == [[editor, viewer]]
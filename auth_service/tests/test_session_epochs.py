@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from app.core.revocation import SessionEpochs
+from app.core.security import decode_jwt, is_revoked_by_epoch
+from app.core.tokens import token_factory
+from app.utils.pubsub import RedisBroadcaster
+
+
+def test_session_epoch_encode_decode_keeps_sub_second_precision():
+    """Тест: эпоха хранится с микросекундами"""
+    value = SessionEpochs.encode(1700000000.123456, "sid-1")
+
+    assert SessionEpochs.decode(value) == (1700000000.123456, "sid-1")
+    assert SessionEpochs.decode(SessionEpochs.encode(1700000000.5, None)) == (1700000000.5, None)
+    # Эпохи, записанные до перехода на дробное время
+    assert SessionEpochs.decode("1700000000:") == (1700000000.0, None)
+
+
+def test_is_revoked_by_epoch():
+    """Тест отзыва токенов, выпущенных до эпохи, кроме сохраненной сессии"""
+    epoch = (1000.5, "kept")
+
+    assert is_revoked_by_epoch({"iat": 1000.4, "sid": "other"}, epoch)
+    assert not is_revoked_by_epoch({"iat": 1000.6, "sid": "other"}, epoch)
+    assert not is_revoked_by_epoch({"iat": 1000.5, "sid": "other"}, epoch)
+    assert not is_revoked_by_epoch({"iat": 999, "sid": "kept"}, epoch)
+    assert not is_revoked_by_epoch({"iat": 999}, None)
+
+
+@pytest.mark.asyncio
+async def test_token_issued_in_same_second_after_epoch_is_not_revoked(redis, monkeypatch):
+    """Тест: новая сессия в ту же секунду, что и эпоха, остается действительной"""
+    epoch_time = float(int(time.time())) + 0.25
+    with monkeypatch.context() as patch:
+        patch.setattr(time, "time", lambda: epoch_time - 0.1)
+        old_token = token_factory.mint_access("user-1").token
+        patch.setattr(time, "time", lambda: epoch_time + 0.1)
+        new_token = token_factory.mint_access("user-1").token
+
+    monkeypatch.setattr("app.core.security.session_epochs._warmed", False)
+    await redis.set("user_tokens_nbf:user-1", SessionEpochs.encode(epoch_time, None))
+
+    assert (await decode_jwt(new_token))["sub"] == "user-1"
+    with pytest.raises(ValueError, match="revoked"):
+        await decode_jwt(old_token)
+
+
+def test_session_epochs_mirror_applies_events_and_expires(redis):
+    """Тест зеркала эпох: событие pub/sub и истечение записи"""
+    epochs = SessionEpochs(redis, RedisBroadcaster(redis))
+    expires_at = time.time() + 60
+    epochs._on_message(f"user-1:{expires_at}:{SessionEpochs.encode(1000.25, 'sid-1')}")
+    epochs._on_message("broken")
+    epochs.add("user-2", 1000.0, None, time.time() - 1)
+
+    assert epochs.get("user-1") == (1000.25, "sid-1")
+    assert epochs.get("user-2") is None
+    assert epochs.stats()["users"] == 1
+
+
+@pytest.mark.asyncio
+async def test_session_epochs_warm_up_loads_keys_with_ttl(redis):
+    """Тест загрузки эпох из Redis при старте"""
+    await redis.set("user_tokens_nbf:user-1", SessionEpochs.encode(1000.25, "sid-1"), ex=60)
+    await redis.set("user_tokens_nbf:user-2", SessionEpochs.encode(1000.0, None))
+    epochs = SessionEpochs(redis, RedisBroadcaster(redis))
+
+    await epochs.warm_up()
+
+    assert epochs.get("user-1") == (1000.25, "sid-1")
+    assert epochs.get("user-2") is None
@@ -0,0 +1,130 @@
+import asyncio
+import uuid
+
+import pytest
+
+from app.core import principal as principal_module
+from app.core.principal import principal_key, resolve_principal
+from app.settings import settings
+from app.utils.single_flight import RedisLock, SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_load():
+    """Тест: одновременные вызовы по одному ключу выполняют одну загрузку"""
+    flight = SingleFlight(timeout=1)
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*(flight.do("key", load) for _ in range(5)))
+
+    assert results == [1] * 5
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "shared": 4, "timeouts": 0}
+
+
+@pytest.mark.asyncio
+async def test_leader_error_is_shared_with_waiters():
+    """Тест: ошибка загрузки получают ведущий и ожидающие"""
+    flight = SingleFlight(timeout=1)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("db down")
+
+    results = await asyncio.gather(*(flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_waiter_loads_itself_after_timeout():
+    """Тест: по таймауту ожидающий загружает сам"""
+    flight = SingleFlight(timeout=0.01)
+    release = asyncio.Event()
+
+    async def slow():
+        await release.wait()
+        return "leader"
+
+    leader = asyncio.create_task(flight.do("key", slow))
+    await asyncio.sleep(0)
+
+    async def fast():
+        return "own"
+
+    assert await flight.do("key", fast) == "own"
+    assert flight.timeouts == 1
+    release.set()
+    assert await leader == "leader"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_waiters():
+    """Тест: отмена ведущего вызова не отменяет ожидающих"""
+    flight = SingleFlight(timeout=1)
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(10)
+
+    async def fast():
+        return "own"
+
+    leader = asyncio.create_task(flight.do("key", slow))
+    await started.wait()
+    waiter = asyncio.create_task(flight.do("key", fast))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await waiter == "own"
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+
+@pytest.mark.asyncio
+async def test_redis_lock_is_released_only_by_owner(redis):
+    """Тест: блокировку снимает только владелец токена"""
+    lock = RedisLock(redis, ttl_ms=1000)
+
+    token = await lock.acquire("lock:key")
+    assert token is not None
+    assert await lock.acquire("lock:key") is None
+
+    await lock.release("lock:key", "foreign")
+    assert await redis.exists("lock:key")
+    await lock.release("lock:key", token)
+    assert await lock.acquire("lock:key") is not None
+
+
+@pytest.mark.asyncio
+async def test_locked_principal_waits_for_other_worker(redis, monkeypatch):
+    """Тест: при занятой блокировке воркер ждет записи другого воркера вместо загрузки"""
+    lock = RedisLock(redis, ttl_ms=1000)
+    monkeypatch.setattr(principal_module, "principal_load_lock", lock)
+    monkeypatch.setattr(principal_module, "LOAD_LOCK_POLL_SECONDS", 0.005)
+    monkeypatch.setattr(settings, "principal_load_lock_enabled", True)
+
+    async def load_principals(user_ids, db):
+        raise AssertionError("Загрузку выполняет другой воркер")
+
+    monkeypatch.setattr(principal_module, "load_principals", load_principals)
+    user_id = uuid.uuid4()
+    await lock.acquire(f"lock:principal:{user_id}")
+
+    async def other_worker():
+        await asyncio.sleep(0.02)
+        await principal_module.cache_principal(
+            user_id, {"login": "alice", "is_superuser": False, "roles": ["user"], "permission_mask": 1}
+        )
+
+    principal, _ = await asyncio.gather(resolve_principal(user_id, db=None), other_worker())
+
+    assert principal["login"] == "alice"
+    assert await redis.exists(principal_key(user_id))
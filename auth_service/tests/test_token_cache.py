@@ -0,0 +1,72 @@
+import pytest
+from jose.exceptions import JWTError
+
+from app.core import security
+from app.core.security import (add_to_blacklist, decode_jwt,
+                               get_cached_token_claims, verify_jwt)
+from app.core.tokens import token_factory
+
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    security.verified_token_cache.clear()
+    yield
+    security.verified_token_cache.clear()
+
+
+def test_verified_token_is_cached_until_exp():
+    """Тест: повторная проверка токена берется из кэша"""
+    issued = token_factory.mint_access("user-1")
+    assert get_cached_token_claims(issued.token) is None
+
+    claims = verify_jwt(issued.token)
+    hits = security.verified_token_cache.stats()["hits"]
+    assert verify_jwt(issued.token) == claims
+    assert security.verified_token_cache.stats()["hits"] == hits + 1
+    assert get_cached_token_claims(issued.token)["jti"] == issued.jti
+
+    # Изменение claims в ответе не портит запись кэша
+    claims["sub"] = "other"
+    assert verify_jwt(issued.token)["sub"] == "user-1"
+
+
+def test_verification_with_options_is_not_cached():
+    """Тест: проверка с нестандартными опциями не попадает в кэш"""
+    issued = token_factory.mint_access("user-1")
+
+    verify_jwt(issued.token, options={"verify_exp": False})
+
+    assert len(security.verified_token_cache) == 0
+    assert get_cached_token_claims(issued.token) is None
+
+
+def test_refresh_verification_is_cached_separately():
+    """Тест: refresh токен не отдается как проверенный access токен"""
+    issued = token_factory.mint_refresh("user-1")
+
+    verify_jwt(issued.token, refresh=True)
+
+    assert get_cached_token_claims(issued.token) is None
+
+
+def test_tampered_token_is_not_cached():
+    """Тест: токен с неверной подписью отклоняется и не кэшируется"""
+    token = token_factory.mint_access("user-1").token
+    header, payload, signature = token.split(".")
+    tampered = f"{header}.{payload}.{signature[:-4]}AAAA"
+
+    with pytest.raises(JWTError):
+        verify_jwt(tampered)
+    assert len(security.verified_token_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_cached_token_is_still_checked_against_blacklist(redis):
+    """Тест: черный список проверяется и для токена из кэша"""
+    issued = token_factory.mint_access("user-1")
+    assert (await decode_jwt(issued.token))["jti"] == issued.jti
+
+    await add_to_blacklist(issued.jti, 60)
+
+    with pytest.raises(ValueError, match="blacklisted"):
+        await decode_jwt(issued.token)
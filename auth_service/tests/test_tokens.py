@@ -0,0 +1,39 @@
+from app.core.security import verify_jwt
+from app.core.tokens import token_factory
+
+
+def test_mint_access_returns_claims_alongside_token():
+    """Тест: выпущенный токен содержит те же claims, что и результат"""
+    issued = token_factory.mint_access("user-1", {"roles": ["admin"]}, expires_minutes=5, mfa_verified=True)
+    claims = verify_jwt(issued.token)
+
+    assert claims["sub"] == issued.sub == "user-1"
+    assert claims["jti"] == issued.jti
+    assert claims["exp"] == issued.exp
+    assert claims["roles"] == ["admin"]
+    assert claims["mfa_verified"] is True
+    assert issued.exp - claims["iat"] <= 5 * 60
+    assert claims["sid"]
+
+
+def test_mint_does_not_modify_payload():
+    """Тест: переданный payload не изменяется"""
+    payload = {"roles": ["user"]}
+
+    token_factory.mint_access("user-1", payload)
+
+    assert payload == {"roles": ["user"]}
+
+
+def test_mint_pair_shares_session():
+    """Тест: access и refresh токены пары относятся к одной сессии"""
+    access, refresh = token_factory.mint_pair("user-1")
+    access_claims = verify_jwt(access.token)
+    refresh_claims = verify_jwt(refresh.token, refresh=True)
+
+    assert access_claims["sid"] == refresh_claims["sid"]
+    assert access.jti != refresh.jti
+    assert refresh.exp > access.exp
+
+    kept_access, _ = token_factory.mint_pair("user-1", session_id=access_claims["sid"])
+    assert verify_jwt(kept_access.token)["sid"] == access_claims["sid"]
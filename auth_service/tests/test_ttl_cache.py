@@ -0,0 +1,39 @@
+import time
+
+from app.utils.ttl_cache import TTLCache
+
+
+def test_ttl_cache_hit_and_miss():
+    """Тест подсчета попаданий и промахов"""
+    cache = TTLCache(max_size=2)
+    cache.set("a", 1, expires_at=time.time() + 60)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_cache_expiration():
+    """Тест истечения записи по expires_at"""
+    cache = TTLCache(max_size=2)
+    cache.set("a", 1, expires_at=time.time() - 1)
+    cache._data["b"] = (2, time.time() - 1)
+
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    """Тест вытеснения самой старой записи при переполнении"""
+    cache = TTLCache(max_size=2, default_ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1